@@ -0,0 +1,704 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from byte_budget import (
+    PROBE_QUALITIES,
+    allocate,
+    budget_summary,
+    encode_qualities,
+    probe_file,
+)
+from catalog import ImageCatalog, stat_fields
+from compression_engine import output_path, write_result
+from image_hash import compute_hashes, group_duplicates
+from image_probe import ProbeIndex
+from job_store import LeaseHeartbeat, default_worker_id
+from scheduler import estimate_cost, schedule
+from shared_pixels import prepare_workers
+
+# 支持的格式
+SUPPORTED_FORMATS = (".jpg", ".jpeg", ".png", ".webp", ".avif", ".heic", ".heif")
+
+
+def list_images(folder, extensions=SUPPORTED_FORMATS):
+    """递归列出文件夹中支持格式的图片"""
+    image_files = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext in extensions:
+                image_files.append(os.path.join(root, file))
+    return image_files
+
+
+def current_stat(path):
+    """源文件的大小和修改时间；文件已不存在时返回空字典，不覆盖目录中的记录"""
+    try:
+        return stat_fields(path)
+    except OSError:
+        return {}
+
+
+def destination_for(img_path, source_folder, dest_folder):
+    """按相对路径计算输出位置并创建目录"""
+    rel_path = os.path.relpath(img_path, source_folder)
+    dest_path = os.path.join(dest_folder, rel_path)
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    return dest_path
+
+
+def compress_one(engine, img_path, source_folder, dest_folder):
+    """压缩单张图片并写出结果，返回报告条目（可在工作进程中执行）"""
+    dest_path = destination_for(img_path, source_folder, dest_folder)
+    # 按线程计时：拆分的大图在主进程的线程中并发处理，process_time 会重复统计
+    cpu_start = time.thread_time()
+
+    original_size = 0.0
+    try:
+        # 获取原始大小（文件可能在排队期间被删除或改名）
+        original_size = os.path.getsize(img_path) / 1024
+
+        # 如果小于目标大小，直接复制
+        if original_size <= engine.target_size_kb * 1.05:
+            shutil.copy2(img_path, dest_path)
+            return {
+                "file": img_path,
+                "original_size": original_size,
+                "compressed_size": original_size,
+                "status": "skipped (already small enough)",
+                "method": "direct copy",
+                "destination": dest_path,
+            }
+
+        # 调用压缩引擎，编码数据直接写入目标文件
+        compression_data = engine.compress_file(img_path)
+        compression_data["cpu_time"] = (
+            time.thread_time() - cpu_start + compression_data["remote_cpu_time"]
+        )
+        return write_item(img_path, dest_path, original_size, compression_data)
+    except Exception as e:
+        return failed_item(img_path, dest_path, original_size, e)
+
+
+def write_item(img_path, dest_path, original_size, compression_data):
+    """写出压缩数据并生成成功的报告条目"""
+    dest_path = write_result(img_path, dest_path, compression_data)
+    compressed_size = compression_data["compressed_size"]
+    return {
+        "file": img_path,
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "method": compression_data.get("method", "unknown"),
+        "quality": compression_data.get("quality", None),
+        "colors": compression_data.get("colors", None),
+        "status": "success",
+        "ratio": 1 - (compressed_size / original_size),
+        "destination": dest_path,
+        "peak_alloc_kb": compression_data.get("peak_alloc_kb"),
+        "width": compression_data["width"],
+        "height": compression_data["height"],
+        "format": compression_data["format"],
+        "time": compression_data["time"],
+        "cpu_time": compression_data.get("cpu_time"),
+        "search": compression_data.get("search"),
+    }
+
+
+def failed_item(img_path, dest_path, original_size, error):
+    """压缩失败时复制原图"""
+    try:
+        shutil.copy2(img_path, dest_path)
+    except OSError:
+        # 原图已被删除或无法读取，没有可复制的文件
+        dest_path = None
+    return {
+        "file": img_path,
+        "original_size": original_size,
+        "compressed_size": original_size,
+        "status": f"failed: {str(error)}",
+        "method": "copy",
+        "destination": dest_path,
+    }
+
+
+class BatchCompressor:
+    """批量压缩：查重、逐张压缩、重复图复用结果，并把结果写入图片目录
+
+    界面和命令行共用；进度通过 on_progress(processed, total, path, item) 回调通知，
+    should_cancel() 返回 True 时在下一张图片前停止。
+    workers > 1 时按估算代价最长任务优先分发到进程池，超大图片的编码拆分并行。
+    """
+
+    def __init__(
+        self, engine, source_folder, dest_folder, catalog_path=None, workers=1
+    ):
+        self.engine = engine
+        self.workers = workers
+        self.source_folder = source_folder
+        self.dest_folder = dest_folder
+        self.catalog_path = catalog_path or os.path.join(
+            os.path.dirname(dest_folder), "catalog.db"
+        )
+        # 文件头信息索引与图片目录放在一起
+        self.probe_path = os.path.join(os.path.dirname(self.catalog_path), "probe.db")
+        self.report_data = []
+        self.duplicate_groups = []
+        self.duplicate_of = {}
+        # 与本批重复、已有压缩结果的代表图 {源路径: 输出路径}
+        self.known_destinations = {}
+        self.cancelled = False
+        self.elapsed = 0.0
+        # 预算模式的分配摘要
+        self.budget = None
+        self.catalog = None
+
+    def reset_output(self):
+        """清空并重建输出文件夹"""
+        if os.path.exists(self.dest_folder):
+            shutil.rmtree(self.dest_folder)
+        os.makedirs(self.dest_folder)
+
+    def find_duplicates(self, files, with_existing=False):
+        """查找重复图片，每组只压缩代表图，其余复用结果
+
+        未变更图片的感知哈希直接从图片目录读取。这里不写大小和修改时间：
+        它们表示压缩结果对应的源文件版本，由 add_report_item 写入，
+        之后缓存的哈希才被视为有效。with_existing 时目录中已有压缩结果的
+        图片也参与分组，与它们重复的新图片直接复用已有的输出，不再压缩
+        （预算和分片模式的代表图必须在本批中，不使用）。
+        """
+        hashes = self.catalog.cached_hashes(files)
+        new_hashes, _ = compute_hashes([path for path in files if path not in hashes])
+        for path, (p_hash, d_hash) in new_hashes.items():
+            self.catalog.upsert(path, phash=f"{p_hash:016x}", dhash=f"{d_hash:016x}")
+        hashes.update(new_hashes)
+
+        batch = set(files)
+        known = {}
+        if with_existing:
+            known = {
+                path: row
+                for path, row in self.catalog.compressed_hashes().items()
+                if path not in batch
+            }
+        for path, (p_hash, d_hash, _) in known.items():
+            hashes[path] = (p_hash, d_hash)
+
+        self.duplicate_groups = []
+        self.duplicate_of = {}
+        self.known_destinations = {}
+        for group in group_duplicates(hashes):
+            # 已压缩的图片优先作为代表图，组内其他已压缩的图片不再处理
+            existing = [path for path in group if path in known]
+            if existing:
+                rep = existing[0]
+                group = [rep] + [path for path in group if path in batch]
+                self.known_destinations[rep] = known[rep][2]
+            if len(group) < 2:
+                continue
+            self.duplicate_groups.append(group)
+            for dup in group[1:]:
+                self.duplicate_of[dup] = group[0]
+
+    def run(self, files, on_progress=None, should_cancel=None):
+        self.report_data = []
+        self.cancelled = False
+        start_time = time.time()
+        total = len(files)
+        processed = 0
+
+        self.catalog = ImageCatalog(self.catalog_path)
+        try:
+            self.find_duplicates(files, with_existing=True)
+            destinations = dict(self.known_destinations)
+
+            unique = [path for path in files if path not in self.duplicate_of]
+            if self.workers > 1:
+                results = self.run_parallel(unique, should_cancel)
+            else:
+                results = self.run_sequential(unique, should_cancel)
+
+            for img_path, item in results:
+                destinations[img_path] = item["destination"]
+                self.add_report_item(item)
+                processed += 1
+                if on_progress:
+                    on_progress(processed, total, img_path, item)
+            self.learn_quality()
+            if self.cancelled:
+                return self.report_data
+
+            # 重复图片直接复用代表图的压缩结果
+            for img_path, rep_path in self.duplicate_of.items():
+                item = self.reuse_duplicate(img_path, rep_path, destinations[rep_path])
+                self.add_report_item(item)
+                processed += 1
+                if on_progress:
+                    on_progress(processed, total, img_path, item)
+        finally:
+            self.catalog.close()
+            self.catalog = None
+            self.elapsed = time.time() - start_time
+
+        return self.report_data
+
+    def run_sequential(self, files, should_cancel=None):
+        for img_path in files:
+            if should_cancel and should_cancel():
+                self.cancelled = True
+                return
+            item = compress_one(
+                self.engine, img_path, self.source_folder, self.dest_folder
+            )
+            yield img_path, item
+
+    def run_parallel(self, files, should_cancel=None):
+        """按代价调度到进程池，完成一张产出一张
+
+        超大图片在主进程的线程中解码并放入共享内存，质量探测和 PNG 候选提交到
+        同一个进程池；普通图片整张提交。普通任务限量提交，保证拆分出的编码任务
+        不会排在整个批次之后。
+        """
+        jobs = deque(
+            schedule(files, self.engine.target_size_kb, self.workers, self.probe(files))
+        )
+        futures = {}
+
+        prepare_workers()
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=self.engine.mp_context
+        ) as pool:
+            with ThreadPoolExecutor(max_workers=2) as splitter:
+
+                def submit_next():
+                    job = jobs.popleft()
+                    if job.split:
+                        engine = self.engine.with_executor(pool, self.workers)
+                        future = splitter.submit(
+                            compress_one,
+                            engine,
+                            job.path,
+                            self.source_folder,
+                            self.dest_folder,
+                        )
+                    else:
+                        future = pool.submit(
+                            compress_one,
+                            self.engine,
+                            job.path,
+                            self.source_folder,
+                            self.dest_folder,
+                        )
+                    futures[future] = job.path
+
+                while jobs and len(futures) < self.workers * 2:
+                    submit_next()
+
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        img_path = futures.pop(future)
+                        yield img_path, future.result()
+
+                    if should_cancel and should_cancel():
+                        self.cancelled = True
+                        for future in futures:
+                            future.cancel()
+                        return
+                    while jobs and len(futures) < self.workers * 2:
+                        submit_next()
+
+    def run_budget(
+        self, files, budget_kb, on_progress=None, should_cancel=None, max_rounds=4
+    ):
+        """总字节预算模式：整批输出不超过 budget_kb，在预算内使质量总和最大
+
+        每张图解码一次按 PROBE_QUALITIES 编码得到大小-质量曲线，再按等斜率分配
+        各图质量（可以保留原图）。探测编码写在临时目录，分配到探测质量且力度相同
+        时直接采用；其余按分配的质量编码一次，实际大小加入曲线。实际总量超出预算
+        时按比例收紧后重新分配，最多 max_rounds 轮。重复图片复用代表图结果，
+        也计入预算。
+        """
+        self.report_data = []
+        self.cancelled = False
+        start_time = time.time()
+        budget = budget_kb * 1024
+        os.makedirs(self.dest_folder, exist_ok=True)
+        probe_dir = tempfile.mkdtemp(prefix=".budget_", dir=self.dest_folder)
+        # 搜索与最终力度相同时，探测编码就是最终结果
+        reuse_probes = self.engine.effort == self.engine.search_effort
+
+        self.catalog = ImageCatalog(self.catalog_path)
+        try:
+            self.find_duplicates(files)
+            copies = Counter(self.duplicate_of.values())
+            images = [
+                {
+                    "path": path,
+                    "points": {},
+                    "final": {},
+                    "original_bytes": os.path.getsize(path),
+                    "count": 1 + copies[path],
+                    "cpu_time": 0.0,
+                }
+                for path in files
+                if path not in self.duplicate_of
+            ]
+
+            def run_encodes(tasks):
+                """tasks: [(图片, 质量列表, 是否最终力度)]，结果记入图片"""
+                if should_cancel and should_cancel():
+                    self.cancelled = True
+                    return
+                results = self.map_encodes(
+                    [
+                        (
+                            image["path"],
+                            qualities,
+                            probe_dir,
+                            final,
+                            image.get("format"),
+                        )
+                        for image, qualities, final in tasks
+                    ]
+                )
+                for (image, _, final), result in zip(tasks, results):
+                    fmt, sizes, size, cpu_time = result
+                    image.update(format=fmt, size=size)
+                    image["cpu_time"] += cpu_time
+                    image["points"].update(sizes)
+                    if final:
+                        image["final"].update(sizes)
+
+            run_encodes([(image, PROBE_QUALITIES, reuse_probes) for image in images])
+            probe_encodes = len(images) * len(PROBE_QUALITIES)
+
+            target = budget
+            encodes = rounds = 0
+            chosen = [None] * len(images)
+            used = sum(image["original_bytes"] * image["count"] for image in images)
+            while images and not self.cancelled and rounds < max_rounds:
+                rounds += 1
+                chosen, _ = allocate(images, target)
+                todo = [
+                    (image, [quality], True)
+                    for image, quality in zip(images, chosen)
+                    if quality is not None and quality not in image["final"]
+                ]
+                run_encodes(todo)
+                if self.cancelled:
+                    break
+                encodes += len(todo)
+                used = sum(
+                    image["count"]
+                    * (
+                        image["original_bytes"]
+                        if quality is None
+                        else image["final"][quality]
+                    )
+                    for image, quality in zip(images, chosen)
+                )
+                if used <= budget:
+                    break
+                # 曲线估计偏小，按超出比例收紧
+                target *= budget / used
+            if self.cancelled:
+                return self.report_data
+
+            destinations = {}
+            processed = 0
+            for image, quality in zip(images, chosen):
+                item = self.budget_item(image, quality, probe_dir)
+                destinations[image["path"]] = item["destination"]
+                self.add_report_item(item)
+                processed += 1
+                if on_progress:
+                    on_progress(processed, len(files), image["path"], item)
+            for img_path, rep_path in self.duplicate_of.items():
+                item = self.reuse_duplicate(img_path, rep_path, destinations[rep_path])
+                self.add_report_item(item)
+                processed += 1
+                if on_progress:
+                    on_progress(processed, len(files), img_path, item)
+
+            qualities = []
+            for image, quality in zip(images, chosen):
+                qualities += [quality or 100] * image["count"]
+            self.budget = budget_summary(
+                budget, used, qualities, rounds, probe_encodes, encodes
+            )
+        finally:
+            shutil.rmtree(probe_dir, ignore_errors=True)
+            self.catalog.close()
+            self.catalog = None
+            self.elapsed = time.time() - start_time
+
+        return self.report_data
+
+    def map_encodes(self, tasks):
+        """执行 encode_qualities 任务列表，多进程时并行，结果按任务顺序返回"""
+        if self.workers == 1 or len(tasks) < 2:
+            return [encode_qualities(self.engine, *task) for task in tasks]
+        prepare_workers()
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=self.engine.mp_context
+        ) as pool:
+            futures = [
+                pool.submit(encode_qualities, self.engine, *task) for task in tasks
+            ]
+            return [future.result() for future in futures]
+
+    def budget_item(self, image, quality, probe_dir):
+        """把分配结果写到输出位置，返回报告条目"""
+        img_path = image["path"]
+        dest_path = destination_for(img_path, self.source_folder, self.dest_folder)
+        original_size = image["original_bytes"] / 1024
+        if quality is None:
+            shutil.copy2(img_path, dest_path)
+            compressed_size = original_size
+            method = "Budget Keep Original"
+            fmt = None
+        else:
+            fmt = image["format"].lower()
+            dest_path = output_path(dest_path, fmt)
+            os.replace(probe_file(probe_dir, img_path, quality, fmt), dest_path)
+            compressed_size = image["final"][quality] / 1024
+            method = f"Budget {image['format']}"
+        item = {
+            "file": img_path,
+            "original_size": original_size,
+            "compressed_size": compressed_size,
+            "method": method,
+            "quality": quality,
+            "colors": None,
+            "status": "success",
+            "ratio": 1 - compressed_size / original_size,
+            "destination": dest_path,
+            "width": image["size"][0],
+            "height": image["size"][1],
+            "cpu_time": image["cpu_time"],
+        }
+        if fmt:
+            item["format"] = fmt
+        return item
+
+    def probe(self, files):
+        """读取（或从索引取出）所有图片的文件头信息，不解码像素"""
+        with ProbeIndex(self.probe_path) as index:
+            return index.probe_all(files)
+
+    def source_path(self, rel_path):
+        """任务库中的相对路径（/ 分隔）转为本机源文件路径"""
+        return os.path.join(self.source_folder, *rel_path.split("/"))
+
+    def relative(self, path, folder):
+        return os.path.relpath(path, folder).replace(os.sep, "/")
+
+    def enqueue_shards(self, store, files):
+        """查重后把图片以相对路径加入分片任务库，返回新增数量"""
+        self.catalog = ImageCatalog(self.catalog_path)
+        try:
+            self.find_duplicates(files)
+        finally:
+            self.catalog.close()
+            self.catalog = None
+
+        probes = self.probe(files)
+        jobs = []
+        for path in files:
+            rel_path = self.relative(path, self.source_folder)
+            rep_path = self.duplicate_of.get(path)
+            if rep_path:
+                # 重复图只复制代表图结果，代价可以忽略
+                jobs.append(
+                    (rel_path, 0.0, self.relative(rep_path, self.source_folder))
+                )
+            else:
+                cost, _ = estimate_cost(
+                    path, self.engine.target_size_kb, probes.get(path)
+                )
+                jobs.append((rel_path, cost, None))
+        return store.enqueue(jobs)
+
+    def run_shard(self, store, worker_id=None, on_progress=None, should_cancel=None):
+        """分片模式：从共享任务库领取图片处理，直到所有任务结束
+
+        其他进程仍持有租约时继续等待，它们崩溃后租约过期由本进程接手。
+        结果只写入任务库（多台机器并发写共享存储上的 SQLite WAL 不可靠），
+        由 collect_shards 统一导入图片目录。
+        """
+        worker_id = worker_id or default_worker_id()
+        self.report_data = []
+        self.cancelled = False
+        start_time = time.time()
+        total = sum(store.counts().values())
+        processed = 0
+        poll_seconds = min(5.0, store.lease_seconds / 4)
+
+        try:
+            with LeaseHeartbeat(store.path, worker_id, store.lease_seconds):
+                while True:
+                    if should_cancel and should_cancel():
+                        self.cancelled = True
+                        break
+                    jobs = store.claim(worker_id)
+                    if not jobs:
+                        if not store.remaining():
+                            break
+                        time.sleep(poll_seconds)
+                        continue
+
+                    for job in jobs:
+                        img_path = self.source_path(job["path"])
+                        try:
+                            item = self.process_job(img_path, job)
+                        except Exception as e:
+                            print(f"❌ 处理失败 {job['path']}: {e}")
+                            store.fail(job["path"], worker_id, e)
+                            continue
+                        destination = self.relative(
+                            item["destination"], self.dest_folder
+                        )
+                        if not store.complete(
+                            job["path"], worker_id, item, destination
+                        ):
+                            # 租约已过期并被其他进程领取，以对方的结果为准
+                            print(f"⚠️ 租约已失效，丢弃结果: {job['path']}")
+                            continue
+                        self.report_data.append(item)
+                        processed += 1
+                        if on_progress:
+                            on_progress(processed, total, img_path, item)
+        finally:
+            store.release(worker_id)
+            self.elapsed = time.time() - start_time
+        return self.report_data
+
+    def process_job(self, img_path, job):
+        # 代表图失败时重复图自行压缩
+        if job["duplicate_of"] and job["rep_state"] == "done":
+            rep_path = self.source_path(job["duplicate_of"])
+            rep_dest = os.path.join(
+                self.dest_folder, *job["rep_destination"].split("/")
+            )
+            return self.reuse_duplicate(img_path, rep_path, rep_dest)
+        return compress_one(self.engine, img_path, self.source_folder, self.dest_folder)
+
+    def collect_shards(self, store):
+        """汇总所有分片的结果：换成本机路径并导入图片目录，返回报告数据
+
+        汇总只由一个进程执行，质量搜索结果在这里加入质量预测
+        """
+        self.report_data = []
+        self.catalog = ImageCatalog(self.catalog_path)
+        try:
+            for rel_path, destination, item in store.results():
+                item["file"] = self.source_path(rel_path)
+                item["destination"] = os.path.join(
+                    self.dest_folder, *destination.split("/")
+                )
+                self.add_report_item(item)
+
+            # 多次领取都未完成的图片按失败处理，输出原图
+            for failure in store.failures():
+                img_path = self.source_path(failure["path"])
+                dest_path = destination_for(
+                    img_path, self.source_folder, self.dest_folder
+                )
+                original_size = os.path.getsize(img_path) / 1024
+                self.add_report_item(
+                    failed_item(img_path, dest_path, original_size, failure["error"])
+                )
+        finally:
+            self.catalog.close()
+            self.catalog = None
+        self.learn_quality()
+
+        self.duplicate_groups = [
+            [self.source_path(path) for path in group]
+            for group in store.duplicate_groups()
+        ]
+        return self.report_data
+
+    def reuse_duplicate(self, img_path, rep_path, rep_dest):
+        rel_path = os.path.relpath(img_path, self.source_folder)
+        dest_path = os.path.join(self.dest_folder, rel_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # 扩展名跟随代表图的输出格式
+        dest_path = os.path.splitext(dest_path)[0] + os.path.splitext(rep_dest)[1]
+        shutil.copy2(rep_dest, dest_path)
+
+        original_size = os.path.getsize(img_path) / 1024
+        compressed_size = os.path.getsize(dest_path) / 1024
+        return {
+            "file": img_path,
+            "original_size": original_size,
+            "compressed_size": compressed_size,
+            "method": "duplicate reuse",
+            "status": f"duplicate of {os.path.basename(rep_path)}",
+            "ratio": 1 - (compressed_size / original_size),
+            "destination": dest_path,
+        }
+
+    def learn_quality(self):
+        """把本次质量搜索的结果加入质量预测并保存，下次运行时使用"""
+        prior = self.engine.prior
+        if prior is not None and prior.update(self.report_data):
+            prior.save()
+
+    def add_report_item(self, item):
+        """记录一条压缩结果到报告数据，并同步写入图片目录"""
+        self.report_data.append(item)
+        if self.catalog is None:
+            return
+
+        rel_path = os.path.relpath(item["file"], self.source_folder)
+        tag = rel_path.split(os.sep)[0] if os.sep in rel_path else None
+        # 只有成功压缩的条目带尺寸和格式，缺失的字段不覆盖已有记录
+        optional = {
+            "width": item.get("width"),
+            "height": item.get("height"),
+            "format": item.get("format"),
+            "compress_time": item.get("time"),
+        }
+        self.catalog.upsert(
+            item["file"],
+            tag=tag,
+            original_kb=item["original_size"],
+            compressed_kb=item["compressed_size"],
+            method=item.get("method"),
+            quality=item.get("quality"),
+            destination=item.get("destination"),
+            status=item["status"],
+            **{k: v for k, v in optional.items() if v is not None},
+            **current_stat(item["file"]),
+        )
+
+    def summary(self):
+        """统计成功、跳过、重复复用的数量"""
+        statuses = [item["status"] for item in self.report_data]
+        cpu_time = sum(item.get("cpu_time") or 0.0 for item in self.report_data)
+        return {
+            "total": len(self.report_data),
+            "success": statuses.count("success"),
+            "skipped": statuses.count("skipped (already small enough)"),
+            "duplicates": sum(1 for s in statuses if s.startswith("duplicate of")),
+            "failed": sum(1 for s in statuses if s.startswith("failed")),
+            "elapsed": self.elapsed,
+            "cpu_time": cpu_time,
+            "workers": self.workers,
+            "budget": self.budget,
+            # 并行效率：总 CPU 时间 / (墙钟时间 × 进程数)，越接近 1 越少拖尾
+            "efficiency": (
+                cpu_time / (self.elapsed * self.workers) if self.elapsed else 0.0
+            ),
+        }
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import time
+
+from compression_engine import avif_supported, jpeg_ready, open_image
+
+# 探测质量：每张图解码一次，按这些质量编码，得到大小-质量曲线
+PROBE_QUALITIES = (20, 45, 70, 90)
+
+# 各格式可分配的质量范围（低于 smart_* 搜索的下限，预算紧时仍有解）
+QUALITY_RANGE = {"JPEG": (10, 95), "WEBP": (10, 90), "AVIF": (10, 85)}
+
+# 保留原图视为质量 100
+ORIGINAL_QUALITY = 100
+
+
+def budget_format(img):
+    """预算模式的编码格式：WebP/AVIF 保持，PNG 等转 WebP（保留透明），其余 JPEG"""
+    fmt = (img.format or "").lower()
+    if fmt == "avif" and avif_supported():
+        return "AVIF"
+    if fmt in ("jpeg", "heic", "heif"):
+        return "JPEG"
+    return "WEBP"
+
+
+def probe_file(probe_dir, path, quality, fmt):
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(probe_dir, f"{key}_{quality}.{fmt.lower()}")
+
+
+def encode_qualities(engine, path, qualities, probe_dir, final, fmt=None):
+    """解码一次，按多个质量编码并写入临时目录（可在工作进程中执行）
+
+    返回 (格式, {质量: 字节数}, 尺寸, CPU 时间)
+    """
+    cpu_start = time.process_time()
+    sizes = {}
+    with open_image(path) as img:
+        size = img.size
+        fmt = fmt or budget_format(img)
+        if fmt == "JPEG":
+            img = jpeg_ready(img)
+        params = engine.encoder_params(fmt.lower(), final)
+        for quality in qualities:
+            buffer = engine.encode(img, fmt, quality=quality, **params)
+            with open(probe_file(probe_dir, path, quality, fmt), "wb") as f:
+                f.write(buffer.getbuffer())
+            sizes[quality] = buffer.getbuffer().nbytes
+    return fmt, sizes, size, time.process_time() - cpu_start
+
+
+def size_curve(points, qualities):
+    """由若干 (质量, 字节数) 插值出各质量的大小
+
+    在对数大小上分段线性插值，两端按最近一段的斜率外推，并保证随质量单调不减
+    """
+    import numpy as np
+
+    known = sorted(points.items())
+    xs = np.array([q for q, _ in known], dtype=float)
+    ys = np.log(np.array([max(size, 1) for _, size in known], dtype=float))
+    grid = np.asarray(qualities, dtype=float)
+    if len(xs) == 1:
+        curve = np.full(len(grid), ys[0])
+    else:
+        curve = np.interp(grid, xs, ys)
+        low_slope = (ys[1] - ys[0]) / (xs[1] - xs[0])
+        high_slope = (ys[-1] - ys[-2]) / (xs[-1] - xs[-2])
+        below = grid < xs[0]
+        above = grid > xs[-1]
+        curve[below] = ys[0] + (grid[below] - xs[0]) * low_slope
+        curve[above] = ys[-1] + (grid[above] - xs[-1]) * high_slope
+    return np.maximum.accumulate(np.exp(curve))
+
+
+def allocate(images, budget_bytes):
+    """等斜率（拉格朗日）分配：在总字节数不超过预算的前提下最大化质量总和
+
+    images 为 [{"points": {质量: 字节数}, "format", "original_bytes", "count"}]，
+    count 为包括重复图在内的份数。对乘子 λ 二分，每张图独立选择使
+    质量 - λ × 字节数 最大的选项；选项包括保留原图（质量 100）。
+    返回每张图的质量（保留原图为 None）和预计总字节数。
+
+    局限：效用直接取质量参数，而 JPEG、WebP、AVIF 的质量刻度并不等价，
+    混合格式的批次中各格式之间的分配只是近似（同一格式内是准确的）。
+    """
+    import numpy as np
+
+    if not images:
+        return [], 0
+    qualities = list(range(1, ORIGINAL_QUALITY + 1))
+    utility = np.array(qualities, dtype=float)
+    sizes = np.full((len(images), len(qualities)), np.inf)
+    counts = np.array([image["count"] for image in images], dtype=float)
+    for row, image in enumerate(images):
+        low, high = QUALITY_RANGE[image["format"]]
+        curve = size_curve(image["points"], qualities)
+        sizes[row, low - 1 : high] = curve[low - 1 : high]
+        sizes[row, ORIGINAL_QUALITY - 1] = image["original_bytes"]
+
+    # 不可选的质量（范围外）分数为 -inf；先置 0 避免 0 × inf
+    valid = np.isfinite(sizes)
+    finite = np.where(valid, sizes, 0.0)
+
+    def choose(lam):
+        scores = np.where(valid, utility[None, :] - lam * finite, -np.inf)
+        columns = np.argmax(scores, axis=1)
+        total = float((sizes[np.arange(len(images)), columns] * counts).sum())
+        return columns, total
+
+    columns, total = choose(0.0)
+    if total > budget_bytes:
+        # λ 越大越偏向小文件；先倍增找到可行上界，再二分
+        low_lam, high_lam = 0.0, 1e-6
+        while choose(high_lam)[1] > budget_bytes and high_lam < 1e6:
+            high_lam *= 2
+        for _ in range(60):
+            mid = (low_lam + high_lam) / 2
+            if choose(mid)[1] > budget_bytes:
+                low_lam = mid
+            else:
+                high_lam = mid
+        columns, total = choose(high_lam)
+
+    chosen = [
+        None if column == ORIGINAL_QUALITY - 1 else qualities[column]
+        for column in columns
+    ]
+    return chosen, total
+
+
+def budget_summary(budget_bytes, used_bytes, qualities, rounds, probe_encodes, encodes):
+    """预算分配结果摘要，qualities 为各图片（按份数展开）的质量，保留原图计为 100"""
+    return {
+        "budget_kb": budget_bytes / 1024,
+        "used_kb": used_bytes / 1024,
+        "average_quality": sum(qualities) / len(qualities) if qualities else None,
+        "min_quality": min(qualities) if qualities else None,
+        "rounds": rounds,
+        "probe_encodes": probe_encodes,
+        "final_encodes": encodes,
+    }
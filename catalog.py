@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import time
+
+DEFAULT_CATALOG = "output/catalog.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    source_path TEXT PRIMARY KEY,
+    tag TEXT,
+    source_url TEXT,
+    file_size INTEGER,
+    mtime REAL,
+    phash TEXT,
+    dhash TEXT,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    original_kb REAL,
+    compressed_kb REAL,
+    method TEXT,
+    quality INTEGER,
+    compress_time REAL,
+    destination TEXT,
+    status TEXT,
+    upload_state TEXT,
+    upload_url TEXT,
+    upload_target TEXT,
+    content_hash TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_images_tag ON images(tag);
+CREATE INDEX IF NOT EXISTS idx_images_phash ON images(phash);
+CREATE INDEX IF NOT EXISTS idx_images_compressed_kb ON images(compressed_kb);
+CREATE INDEX IF NOT EXISTS idx_images_upload_state ON images(upload_state);
+"""
+
+# 旧版本目录缺少的列，打开时补上
+ADDED_COLUMNS = {"content_hash": "TEXT", "upload_target": "TEXT"}
+
+COLUMNS = (
+    "tag",
+    "source_url",
+    "file_size",
+    "mtime",
+    "phash",
+    "dhash",
+    "width",
+    "height",
+    "format",
+    "original_kb",
+    "compressed_kb",
+    "method",
+    "quality",
+    "compress_time",
+    "destination",
+    "status",
+    "upload_state",
+    "upload_url",
+    "upload_target",
+    "content_hash",
+)
+
+
+def stat_fields(path):
+    """文件大小和修改时间，用于判断图片是否变更"""
+    stat = os.stat(path)
+    return {"file_size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class ImageCatalog:
+    """图片及压缩结果的 SQLite 目录
+
+    写入先缓冲在内存中，累计 batch_size 条后在一个事务里批量提交；
+    同一路径的多次写入会合并字段（后写覆盖先写）。
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG, batch_size=500):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(images)")}
+        for column, kind in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE images ADD COLUMN {column} {kind}")
+        self._pending = {}
+
+    def upsert(self, source_path, **fields):
+        """缓冲一条记录，只更新传入的字段"""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的目录字段: {', '.join(sorted(unknown))}")
+        self._pending.setdefault(source_path, {}).update(fields)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """在一个事务中提交所有缓冲的记录"""
+        if not self._pending:
+            return
+        now = time.time()
+        by_columns = {}
+        for source_path, fields in self._pending.items():
+            columns = tuple(sorted(fields))
+            by_columns.setdefault(columns, []).append(
+                (source_path, *(fields[c] for c in columns), now)
+            )
+
+        with self.conn:
+            for columns, rows in by_columns.items():
+                names = ("source_path",) + columns + ("updated_at",)
+                updates = ", ".join(
+                    f"{c}=excluded.{c}" for c in columns + ("updated_at",)
+                )
+                self.conn.executemany(
+                    f"INSERT INTO images ({', '.join(names)}) "
+                    f"VALUES ({', '.join('?' * len(names))}) "
+                    f"ON CONFLICT(source_path) DO UPDATE SET {updates}",
+                    rows,
+                )
+        self._pending = {}
+
+    def get(self, source_path):
+        self.flush()
+        row = self.conn.execute(
+            "SELECT * FROM images WHERE source_path = ?", (source_path,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _stat_rows(self, paths):
+        self.flush()
+        rows = {}
+        paths = list(paths)
+        # 分批查询，避免超出 SQLite 参数上限
+        for i in range(0, len(paths), 500):
+            part = paths[i : i + 500]
+            query = (
+                "SELECT source_path, file_size, mtime, phash, dhash, status FROM images "
+                f"WHERE source_path IN ({', '.join('?' * len(part))})"
+            )
+            for row in self.conn.execute(query, part):
+                rows[row["source_path"]] = row
+        return rows
+
+    @staticmethod
+    def _is_changed(row, path):
+        """记录与当前文件不一致；文件已删除或无法访问时也视为变化"""
+        if row is None:
+            return True
+        try:
+            stat = stat_fields(path)
+        except OSError:
+            return True
+        return row["file_size"] != stat["file_size"] or row["mtime"] != stat["mtime"]
+
+    def changed(self, paths):
+        """返回新增或大小/修改时间有变化的图片，已不存在的文件不返回"""
+        rows = self._stat_rows(paths)
+        return [
+            path
+            for path in paths
+            if os.path.exists(path) and self._is_changed(rows.get(path), path)
+        ]
+
+    def uncompressed(self, paths):
+        """返回尚未压缩、或压缩后又有变化的图片（下载记录没有压缩状态）
+
+        已不存在的文件不返回。
+        """
+        rows = self._stat_rows(paths)
+        return [
+            path
+            for path in paths
+            if os.path.exists(path)
+            and (self._is_changed(rows.get(path), path) or not rows[path]["status"])
+        ]
+
+    def failed(self, paths):
+        """上次压缩失败且之后没有变化的图片"""
+        rows = self._stat_rows(paths)
+        return [
+            path
+            for path, row in rows.items()
+            if (row["status"] or "").startswith("failed")
+            and not self._is_changed(row, path)
+        ]
+
+    def compressed_hashes(self):
+        """已有压缩结果的图片 {path: (phash, dhash, 输出路径)}
+
+        只包含源文件未变更、输出文件仍存在的记录，新图片可以直接复用这些结果。
+        """
+        self.flush()
+        result = {}
+        query = (
+            "SELECT source_path, file_size, mtime, phash, dhash, destination, status "
+            "FROM images WHERE phash IS NOT NULL AND dhash IS NOT NULL "
+            "AND destination IS NOT NULL AND status NOT LIKE 'failed%'"
+        )
+        for row in self.conn.execute(query):
+            path = row["source_path"]
+            if not os.path.exists(path) or not os.path.exists(row["destination"]):
+                continue
+            if self._is_changed(row, path):
+                continue
+            result[path] = (
+                int(row["phash"], 16),
+                int(row["dhash"], 16),
+                row["destination"],
+            )
+        return result
+
+    def cached_hashes(self, paths):
+        """未变更图片的已缓存感知哈希 {path: (phash, dhash)}"""
+        rows = self._stat_rows(paths)
+        return {
+            path: (int(row["phash"], 16), int(row["dhash"], 16))
+            for path, row in rows.items()
+            if row["phash"] and row["dhash"] and not self._is_changed(row, path)
+        }
+
+    def larger_than(self, kb, compressed=True):
+        """压缩后（或原始）大小超过 kb 的图片"""
+        self.flush()
+        column = "compressed_kb" if compressed else "original_kb"
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                f"SELECT * FROM images WHERE {column} > ? ORDER BY {column} DESC",
+                (kb,),
+            )
+        ]
+
+    def by_upload_state(self, state):
+        self.flush()
+        if state is None:
+            query = "SELECT * FROM images WHERE upload_state IS NULL"
+            return [dict(row) for row in self.conn.execute(query)]
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                "SELECT * FROM images WHERE upload_state = ?", (state,)
+            )
+        ]
+
+    def uploaded_files(self, target):
+        """已上传到 target（存储后端标识）的图片 {路径: (内容哈希, 地址)}
+
+        上传到其他后端或旧版本未记录后端的图片不算已上传。
+        """
+        self.flush()
+        return {
+            row["source_path"]: (row["content_hash"], row["upload_url"])
+            for row in self.conn.execute(
+                "SELECT source_path, content_hash, upload_url FROM images "
+                "WHERE upload_state = 'uploaded' AND content_hash IS NOT NULL "
+                "AND upload_target = ?",
+                (target,),
+            )
+        }
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,464 @@
+import os
+import argparse
+import json
+import random
+import time
+import multiprocessing
+
+from batch_compressor import BatchCompressor, SUPPORTED_FORMATS, list_images
+from catalog import ImageCatalog
+from compression_engine import CompressionEngine, EFFORT_PRESETS, benchmark_efforts
+from compression_report import build_report, load_manifest, save_manifest, save_report
+from folder_watcher import FolderWatcher
+from job_store import JobStore
+from quality_prior import QualityPrior, prior_stats
+from tile_pyramid import SCAN_FORMATS, TILE_EXTENSIONS, PyramidBuilder
+from uploader import FirebaseStorage, LocalStorage, Uploader
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="高保真图片批量压缩（命令行）")
+    parser.add_argument("--source", default="output/download", help="图片文件夹")
+    parser.add_argument("--dest", default="output/compressed", help="压缩输出文件夹")
+    parser.add_argument("--target-kb", type=int, default=200, help="目标大小 (KB)")
+    parser.add_argument(
+        "--effort",
+        choices=list(EFFORT_PRESETS),
+        default="max",
+        help="最终编码力度",
+    )
+    parser.add_argument(
+        "--search-effort",
+        choices=list(EFFORT_PRESETS),
+        default=None,
+        help="质量搜索时的编码力度（默认与 --effort 相同）",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        default=0,
+        metavar="N",
+        help="压缩前在 N 张随机样本上测试各力度预设",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="并行压缩进程数（1 为单进程顺序执行）",
+    )
+    parser.add_argument("--no-report", action="store_true", help="不生成报告")
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="用 tracemalloc 记录每张图的 Python 峰值分配（明显变慢，仅用于分析）",
+    )
+    parser.add_argument(
+        "--budget-mb",
+        type=float,
+        default=None,
+        help="整批输出的总大小上限 (MB)，在预算内分配各图质量，忽略 --target-kb",
+    )
+    parser.add_argument(
+        "--no-prior",
+        action="store_true",
+        help="不使用历史结果预测起始质量（默认读写输出目录下的 quality_prior.json）",
+    )
+    shard = parser.add_argument_group("分片模式（多机共享任务库）")
+    shard.add_argument(
+        "--job-store",
+        default=None,
+        help="共享存储上的任务库路径，指定后按分片模式领取任务",
+    )
+    shard.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="只扫描源文件夹并把图片加入任务库，不压缩",
+    )
+    shard.add_argument(
+        "--lease-seconds",
+        type=int,
+        default=300,
+        help="任务租约时长（秒），进程停止心跳超过该时长后任务被重新分配",
+    )
+    watch = parser.add_argument_group("监视模式")
+    watch.add_argument(
+        "--watch",
+        action="store_true",
+        help="持续监视源文件夹，新增或修改的图片稳定后自动压缩",
+    )
+    watch.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=2.0,
+        help="文件大小和修改时间保持不变多久后才视为写入完成",
+    )
+    watch.add_argument(
+        "--poll-interval", type=float, default=1.0, help="检查间隔（秒）"
+    )
+    pyramid = parser.add_argument_group("瓦片金字塔（超大作品的 Deep Zoom 输出）")
+    pyramid.add_argument(
+        "--pyramid",
+        action="store_true",
+        help="为每张图片生成 Deep Zoom 瓦片金字塔（.dzi + 瓦片 + .json 清单）；"
+        "只有未压缩的 TIFF/BMP/PPM 流式读取，JPEG/PNG/压缩 TIFF 整张解码",
+    )
+    pyramid.add_argument("--tile-size", type=int, default=254, help="瓦片边长")
+    pyramid.add_argument("--tile-overlap", type=int, default=1, help="瓦片重叠像素")
+    pyramid.add_argument("--tile-format", choices=list(TILE_EXTENSIONS), default="jpeg")
+    pyramid.add_argument(
+        "--tile-kb", type=int, default=30, help="单个瓦片的目标大小 (KB)"
+    )
+    upload = parser.add_argument_group("上传（读取输出清单，不压缩）")
+    upload.add_argument(
+        "--upload",
+        action="store_true",
+        help="按 manifest.json 上传压缩结果，内容已上传过的文件跳过",
+    )
+    upload.add_argument(
+        "--storage",
+        choices=["local", "firebase"],
+        default="local",
+        help="存储后端（local 复制到 --storage-dir，用于测试）",
+    )
+    upload.add_argument("--storage-dir", default="output/uploads")
+    upload.add_argument("--bucket", default="portfolio-d5d1f.appspot.com")
+    upload.add_argument("--credentials", default="./config/serviceAccount.json")
+    upload.add_argument(
+        "--upload-concurrency", type=int, default=4, help="同时进行的上传数"
+    )
+    upload.add_argument(
+        "--upload-rate", type=float, default=5.0, help="每秒最多发起的上传请求数"
+    )
+    return parser.parse_args(argv)
+
+
+def make_engine(args):
+    prior = None
+    if not args.no_prior:
+        prior = QualityPrior(
+            os.path.join(os.path.dirname(args.dest), "quality_prior.json")
+        )
+    return CompressionEngine(
+        args.target_kb,
+        track_memory=args.profile_memory,
+        effort=args.effort,
+        search_effort=args.search_effort,
+        prior=prior,
+    )
+
+
+def on_progress(processed, total, img_path, item):
+    if processed % 50 == 0 or processed == total:
+        print(f"🔄 {processed}/{total} {os.path.basename(img_path)}")
+
+
+def write_outputs(args, batch, engine, effort_benchmark=None, summary=None):
+    """写输出清单和报告"""
+    output_root = os.path.dirname(args.dest)
+    manifest_path = save_manifest(
+        batch.report_data, os.path.join(output_root, "manifest.json")
+    )
+    print(f"清单已生成: {manifest_path}")
+
+    if not args.no_report:
+        report = build_report(
+            batch.report_data,
+            args.target_kb,
+            args.source,
+            args.dest,
+            duplicate_groups=batch.duplicate_groups,
+            effort=engine.effort,
+            search_effort=engine.search_effort,
+            effort_benchmark=effort_benchmark,
+            batch_summary=summary,
+        )
+        report_path, _ = save_report(report, os.path.join(output_root, "reports"))
+        print(f"报告已生成: {report_path}")
+
+
+def shard_worker(args):
+    """单个分片工作进程：领取任务直到任务库中没有未完成的任务"""
+    batch = BatchCompressor(make_engine(args), args.source, args.dest)
+    with JobStore(args.job_store, args.lease_seconds) as store:
+        batch.run_shard(store, on_progress=on_progress)
+    print(f"✅ 进程 {os.getpid()} 处理了 {len(batch.report_data)} 张图片")
+
+
+def run_sharded(args):
+    """分片模式：--enqueue 建立任务；否则启动 --workers 个工作进程，全部结束后汇总一次"""
+    engine = make_engine(args)
+    batch = BatchCompressor(engine, args.source, args.dest)
+
+    if args.enqueue:
+        image_files = list_images(args.source)
+        with JobStore(args.job_store, args.lease_seconds) as store:
+            added = batch.enqueue_shards(store, image_files)
+            total = sum(store.counts().values())
+        print(f"📥 新增 {added} 个任务，任务库共 {total} 个")
+        return 0
+
+    if args.workers > 1:
+        processes = [
+            multiprocessing.Process(target=shard_worker, args=(args,))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        shard_worker(args)
+
+    with JobStore(args.job_store, args.lease_seconds) as store:
+        counts = store.counts()
+        # 多台机器同时结束时只有一个进程负责汇总
+        if not store.finalize_once():
+            print(f"任务状态: {counts}，由其他进程汇总或仍有未完成任务")
+            return 0
+        batch.collect_shards(store)
+
+    summary = batch.summary()
+    print(
+        f"🎉 分片任务全部完成: 成功 {summary['success']}, 跳过 {summary['skipped']}, "
+        f"重复复用 {summary['duplicates']}, 失败 {summary['failed']}"
+    )
+    write_outputs(args, batch, engine)
+    return 0
+
+
+# 监视模式中失败图片的重试间隔（秒），依次加长
+RETRY_DELAYS = (30, 120, 600, 3600)
+
+
+def run_watch(args):
+    """监视模式：先补压缩未处理的图片，之后每批新图片压缩后增量更新清单和报告
+
+    失败的图片按 RETRY_DELAYS 退避重试（例如文件被占用或暂时无法读取），
+    重试次数用完后不再处理，直到文件被修改。
+    """
+    engine = make_engine(args)
+    batch = BatchCompressor(engine, args.source, args.dest, workers=args.workers)
+    output_root = os.path.dirname(args.dest)
+    manifest_path = os.path.join(output_root, "manifest.json")
+    manifest = {item["file"]: item for item in load_manifest(manifest_path)}
+    duplicate_groups = []
+    # 失败图片 -> (已重试次数, 下次重试时间)
+    retries = {}
+
+    def due_retries():
+        now = time.time()
+        return [path for path, (_, due) in retries.items() if due <= now]
+
+    def process(paths):
+        todo = []
+        if paths:
+            with ImageCatalog(batch.catalog_path) as catalog:
+                todo = catalog.uncompressed(paths)
+        # 失败后被删除或改名的图片不再重试（改名后的新路径作为新文件处理）
+        for path in [path for path in retries if not os.path.exists(path)]:
+            del retries[path]
+        todo = [path for path in todo if os.path.exists(path)]
+        retry = [path for path in due_retries() if path not in todo]
+        if not todo and not retry:
+            return
+        if todo:
+            print(f"🆕 {len(todo)} 张新图片")
+        if retry:
+            print(f"🔁 重试 {len(retry)} 张失败的图片")
+        batch.run(todo + retry, on_progress)
+        duplicate_groups.extend(batch.duplicate_groups)
+        for item in batch.report_data:
+            manifest[item["file"]] = item
+            path = item["file"]
+            if not item["status"].startswith("failed"):
+                retries.pop(path, None)
+                continue
+            # 新图片或被修改过的图片重新计数
+            attempts = retries[path][0] + 1 if path in retry else 1
+            if attempts > len(RETRY_DELAYS):
+                retries.pop(path, None)
+                print(f"❌ {os.path.basename(path)} 重试 {len(RETRY_DELAYS)} 次仍失败")
+            else:
+                retries[path] = (attempts, time.time() + RETRY_DELAYS[attempts - 1])
+        save_manifest(list(manifest.values()), manifest_path)
+
+        summary = batch.summary()
+        print(
+            f"✅ 成功 {summary['success']}, 跳过 {summary['skipped']}, "
+            f"重复复用 {summary['duplicates']}, 失败 {summary['failed']}, "
+            f"耗时 {summary['elapsed']:.1f}秒"
+        )
+        if not args.no_report:
+            report = build_report(
+                list(manifest.values()),
+                args.target_kb,
+                args.source,
+                args.dest,
+                duplicate_groups=duplicate_groups,
+                effort=engine.effort,
+                search_effort=engine.search_effort,
+            )
+            save_report(report, os.path.join(output_root, "reports"), "watch_report")
+
+    os.makedirs(args.dest, exist_ok=True)
+    watcher = FolderWatcher(
+        args.source,
+        SUPPORTED_FORMATS,
+        settle_seconds=args.settle_seconds,
+        poll_interval=args.poll_interval,
+    )
+    # 先开始监视再补压缩，补压缩期间到达的图片不会遗漏
+    watcher.start()
+    try:
+        existing = list_images(args.source)
+        # 之前运行中失败的图片启动后立即重试一次
+        with ImageCatalog(batch.catalog_path) as catalog:
+            for path in catalog.failed(existing):
+                retries[path] = (0, 0.0)
+        process(existing)
+        print(f"👀 正在监视 {args.source}（{watcher.mode}），Ctrl+C 退出")
+        # 没有新文件时也定期检查是否有到期的重试
+        for paths in watcher.batches(idle=True):
+            process(paths)
+    except KeyboardInterrupt:
+        print("已停止监视")
+    finally:
+        watcher.stop()
+    return 0
+
+
+def run_pyramid(args):
+    """金字塔模式：按源文件夹的目录结构输出到 --dest，每张图一个金字塔"""
+    image_files = list_images(args.source, SUPPORTED_FORMATS + SCAN_FORMATS)
+    if not image_files:
+        print(f"没有找到可用的图片文件: {args.source}")
+        return 1
+    builder = PyramidBuilder(
+        tile_size=args.tile_size,
+        overlap=args.tile_overlap,
+        fmt=args.tile_format,
+        tile_kb=args.tile_kb,
+        effort=args.effort,
+        search_effort=args.search_effort,
+        workers=args.workers,
+    )
+    failed = 0
+    for img_path in image_files:
+        relative = os.path.relpath(os.path.dirname(img_path), args.source)
+        dest_folder = os.path.normpath(os.path.join(args.dest, relative))
+        os.makedirs(dest_folder, exist_ok=True)
+        try:
+            manifest = builder.build(img_path, dest_folder)
+        except Exception as e:
+            failed += 1
+            print(f"❌ {img_path}: {e}")
+            continue
+        print(
+            f"🧩 {os.path.basename(img_path)}: {manifest['width']}x"
+            f"{manifest['height']}, {len(manifest['levels'])} 级, "
+            f"{manifest['total_tiles']} 个瓦片, "
+            f"{manifest['total_bytes'] / 1024:.1f}KB, {manifest['time']:.1f}秒"
+            + ("" if manifest["streamed"] else "（压缩格式，整张解码）")
+        )
+    print(f"🎉 金字塔完成: {len(image_files) - failed} 张, 失败 {failed}")
+    return 1 if failed else 0
+
+
+def run_upload(args):
+    """上传模式：按输出清单上传，结果写入 upload_results.json 和图片目录"""
+    output_root = os.path.dirname(args.dest)
+    items = load_manifest(os.path.join(output_root, "manifest.json"))
+    if not items:
+        print(f"没有找到输出清单，请先压缩: {output_root}/manifest.json")
+        return 1
+    if args.storage == "firebase":
+        backend = FirebaseStorage(args.bucket, args.credentials)
+    else:
+        backend = LocalStorage(args.storage_dir)
+    uploader = Uploader(
+        backend,
+        os.path.join(output_root, "catalog.db"),
+        args.source,
+        concurrency=args.upload_concurrency,
+        rate=args.upload_rate,
+    )
+    results = uploader.run(items, on_progress)
+
+    result_path = os.path.join(output_root, "upload_results.json")
+    with open(result_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    os.replace(result_path + ".tmp", result_path)
+    summary = uploader.summary()
+    print(
+        f"☁️ 上传完成: 上传 {summary['uploaded']}, 跳过 {summary['skipped']}, "
+        f"失败 {summary['failed']}, 耗时 {summary['elapsed']:.1f}秒"
+    )
+    print(f"上传结果: {result_path}")
+    return 1 if summary["failed"] else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.job_store:
+        return run_sharded(args)
+    if args.watch:
+        return run_watch(args)
+    if args.pyramid:
+        return run_pyramid(args)
+    if args.upload:
+        return run_upload(args)
+
+    image_files = list_images(args.source)
+    if not image_files:
+        print(f"没有找到可用的图片文件: {args.source}")
+        return 1
+    print(f"找到 {len(image_files)} 张图片")
+
+    effort_benchmark = None
+    if args.benchmark:
+        sample = random.sample(image_files, min(args.benchmark, len(image_files)))
+        effort_benchmark = benchmark_efforts(sample, args.target_kb)
+        for row in effort_benchmark:
+            print(
+                f"⏱️ {row['search_effort']}/{row['effort']}: {row['time']:.2f}秒, "
+                f"{row['total_kb']:.1f}KB, {row['encodes']} 次编码"
+            )
+
+    engine = make_engine(args)
+    batch = BatchCompressor(engine, args.source, args.dest, workers=args.workers)
+    batch.reset_output()
+
+    if args.budget_mb:
+        batch.run_budget(image_files, args.budget_mb * 1024, on_progress)
+    else:
+        batch.run(image_files, on_progress)
+    summary = batch.summary()
+    print(
+        f"🎉 完成: 成功 {summary['success']}, 跳过 {summary['skipped']}, "
+        f"重复复用 {summary['duplicates']}, 失败 {summary['failed']}, "
+        f"耗时 {summary['elapsed']:.1f}秒, "
+        f"并行效率 {summary['efficiency']:.0%} ({summary['workers']} 进程)"
+    )
+    budget = summary["budget"]
+    if budget:
+        print(
+            f"💰 预算: {budget['used_kb'] / 1024:.2f}MB / "
+            f"{budget['budget_kb'] / 1024:.2f}MB, 平均质量 "
+            f"{budget['average_quality']:.1f}, 最低 {budget['min_quality']}"
+        )
+        if budget["used_kb"] > budget["budget_kb"]:
+            print("⚠️ 最低质量下仍超出预算，请提高预算")
+    prior = prior_stats(batch.report_data)
+    if prior:
+        print(
+            f"🎯 质量预测: {prior['images']} 张, 平均误差 {prior['mean_error']:.1f}, "
+            f"平均编码 {prior['encodes']:.1f} 次（不用预测约 "
+            f"{prior['baseline_encodes']:.1f} 次）"
+        )
+
+    write_outputs(args, batch, engine, effort_benchmark, summary)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
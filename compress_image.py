@@ -1,24 +1,37 @@
+import time
+
+# 启动计时起点，放在其他导入之前
+_START = time.perf_counter()
+
 import os
+import multiprocessing
+import queue
 import random
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageQt
-import shutil
-import io
-import time
-from pathlib import Path
-import markdown
-from datetime import datetime
+import sys
 import subprocess
-import tempfile
-import numpy as np
-
-# 添加高效的压缩库
-try:
-    import pillow_avif  # 增加AVIF格式支持
-    import pillow_heif  # 增加HEIF格式支持
-except ImportError:
-    pass
+from compression_engine import (
+    CompressionEngine,
+    EFFORT_PRESETS,
+    benchmark_efforts,
+    decode_result,
+    open_image,
+)
+from batch_compressor import BatchCompressor, SUPPORTED_FORMATS, list_images
+from image_probe import ProbeIndex
+from quality_prior import QualityPrior
+
+# 启动基准检查的重型模块：应在用到对应功能时才导入
+HEAVY_MODULES = (
+    "numpy",
+    "markdown",
+    "pillow_avif",
+    "pillow_heif",
+    "PIL.ImageTk",
+    "PIL.ImageQt",
+)
 
 
 class ImageCompressorApp:
@@ -48,6 +61,31 @@ class ImageCompressorApp:
         self.output_folder = "output/download"
         self.compressed_folder = "output/compressed"
         self.report_data = []
+        self.duplicate_groups = []
+        self.effort_benchmark = None
+        self.batch_summary = None
+        # 上次批量压缩使用的引擎副本，报告按它的目标大小和力度生成
+        self.batch_engine = None
+        # 后台线程的结果通过队列交回主线程处理（Tk 只能在主线程操作）
+        self.events = queue.Queue()
+        # 预览串行执行；编号用于丢弃已过时的预览
+        self.preview_lock = threading.Lock()
+        self.preview_token = 0
+        # 首张预览完成的时间，启动基准使用
+        self.first_preview_at = None
+        # 缩略图缓存，首次打开浏览窗口时创建
+        self.thumbnails = None
+        # 文件头信息（尺寸/格式/方向等），扫描后在后台批量读取
+        self.probe_index = None
+        self.probes = {}
+        # 预览大图时多进程在共享内存上并行编码；界面进程有多个线程，
+        # 进程池用 spawn 启动（fork 可能复制其他线程持有的锁而死锁）
+        self.engine = CompressionEngine(
+            self.target_size_kb,
+            workers=os.cpu_count() or 1,
+            prior=QualityPrior(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
 
         # 压缩算法参数
         self.compression_settings = {
@@ -59,22 +97,14 @@ class ImageCompressorApp:
         }
 
         # 支持的格式
-        self.supported_formats = [
-            ".jpg",
-            ".jpeg",
-            ".png",
-            ".webp",
-            ".avif",
-            ".heic",
-            ".heif",
-        ]
+        self.supported_formats = list(SUPPORTED_FORMATS)
 
         # 创建UI
         self.create_widgets()
 
-        # 自动加载图片
-        self.load_image_files()
-        self.show_random_image()
+        # 后台扫描文件夹并预览一张随机图片，窗口先可用
+        self.root.after(50, self.poll_events)
+        self.load_image_files(preview=True)
 
     def create_widgets(self):
         # 主容器
@@ -95,6 +125,30 @@ class ImageCompressorApp:
         size_entry.grid(row=0, column=1, padx=5)
         size_entry.bind("<Return>", self.update_target_size)
 
+        ttk.Label(settings_frame, text="搜索力度:").grid(row=0, column=2, padx=5)
+        self.search_effort_var = tk.StringVar(value=self.engine.search_effort)
+        search_effort_box = ttk.Combobox(
+            settings_frame,
+            textvariable=self.search_effort_var,
+            values=list(EFFORT_PRESETS),
+            state="readonly",
+            width=10,
+        )
+        search_effort_box.grid(row=0, column=3, padx=5)
+        search_effort_box.bind("<<ComboboxSelected>>", self.update_effort)
+
+        ttk.Label(settings_frame, text="最终力度:").grid(row=0, column=4, padx=5)
+        self.effort_var = tk.StringVar(value=self.engine.effort)
+        effort_box = ttk.Combobox(
+            settings_frame,
+            textvariable=self.effort_var,
+            values=list(EFFORT_PRESETS),
+            state="readonly",
+            width=10,
+        )
+        effort_box.grid(row=0, column=5, padx=5)
+        effort_box.bind("<<ComboboxSelected>>", self.update_effort)
+
         ttk.Button(
             control_frame,
             text="选择图片文件夹",
@@ -104,12 +158,22 @@ class ImageCompressorApp:
         ttk.Button(
             control_frame, text="随机选择图片", command=self.show_random_image, width=15
         ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            control_frame, text="浏览图片", command=self.open_browser, width=15
+        ).pack(side=tk.LEFT, padx=5)
         ttk.Button(
             control_frame, text="压缩全部图片", command=self.compress_all, width=15
         ).pack(side=tk.LEFT, padx=5)
         ttk.Button(
             control_frame, text="生成报告", command=self.generate_report, width=15
         ).pack(side=tk.LEFT, padx=5)
+        self.benchmark_button = ttk.Button(
+            control_frame,
+            text="力度基准测试",
+            command=self.run_effort_benchmark,
+            width=15,
+        )
+        self.benchmark_button.pack(side=tk.LEFT, padx=5)
 
         # 图片显示区域
         image_frame = ttk.LabelFrame(main_frame, text="图片预览", padding=10)
@@ -166,6 +230,7 @@ class ImageCompressorApp:
             if size < 10 or size > 5000:
                 raise ValueError
             self.target_size_kb = size
+            self.engine.target_size_kb = size
             if self.current_image:
                 self.display_images()
             self.status_var.set(f"目标大小已更新: {self.target_size_kb}KB")
@@ -178,22 +243,66 @@ class ImageCompressorApp:
         if folder:
             self.output_folder = folder
             self.compressed_folder = os.path.join(os.path.dirname(folder), "compressed")
-            self.load_image_files()
-            self.show_random_image()
+            self.load_image_files(preview=True)
             self.status_var.set(f"已选择文件夹: {self.output_folder}")
 
-    def load_image_files(self):
-        self.image_files = []
-        if os.path.exists(self.output_folder):
-            for root, _, files in os.walk(self.output_folder):
-                for file in files:
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in self.supported_formats:
-                        full_path = os.path.join(root, file)
-                        self.image_files.append(full_path)
-            self.status_var.set(f"找到 {len(self.image_files)} 张图片")
-        else:
+    def run_in_background(self, func, on_done, on_error=None):
+        """在后台线程执行 func，结果交给主线程的 on_done / on_error"""
+
+        def worker():
+            try:
+                result = func()
+            except Exception as e:
+                self.events.put((on_error, e))
+            else:
+                self.events.put((on_done, result))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def poll_events(self):
+        """主线程定时处理后台任务的结果"""
+        while True:
+            try:
+                callback, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if callback is not None:
+                callback(value)
+        self.root.after(50, self.poll_events)
+
+    def load_image_files(self, preview=False):
+        """后台扫描文件夹；preview 为真时扫描完成后预览一张随机图片"""
+        folder = self.output_folder
+        if not os.path.exists(folder):
+            self.image_files = []
             self.status_var.set("输出文件夹不存在")
+            self.first_preview_at = self.first_preview_at or time.perf_counter()
+            return
+        self.status_var.set(f"正在扫描: {folder}")
+
+        def done(files):
+            if folder != self.output_folder:
+                return  # 扫描期间已切换文件夹
+            self.image_files = files
+            self.status_var.set(f"找到 {len(files)} 张图片")
+            if preview and files:
+                self.show_random_image()
+            elif self.first_preview_at is None:
+                self.first_preview_at = time.perf_counter()
+            # 预览之后再读取全部文件头，之后信息面板不再等待
+            self.run_in_background(
+                lambda: self.get_probe_index().probe_all(files), self.probes.update
+            )
+
+        self.run_in_background(lambda: list_images(folder), done)
+
+    def get_probe_index(self):
+        """文件头信息索引，与批量压缩的图片目录放在一起；可在后台线程调用"""
+        if self.probe_index is None:
+            self.probe_index = ProbeIndex(
+                os.path.join(os.path.dirname(self.compressed_folder), "probe.db")
+            )
+        return self.probe_index
 
     def show_random_image(self):
         if not self.image_files:
@@ -203,46 +312,107 @@ class ImageCompressorApp:
         self.current_image = random.choice(self.image_files)
         self.display_images()
 
+    def open_browser(self):
+        """打开缩略图网格，点击图片后预览"""
+        if not self.image_files:
+            messagebox.showwarning("警告", "没有找到可用的图片文件")
+            return
+        from image_browser import ImageBrowser
+        from thumbnail_cache import ThumbnailCache
+
+        if self.thumbnails is None:
+            cache_dir = os.path.join(
+                os.path.dirname(self.compressed_folder), "thumbnails"
+            )
+            self.thumbnails = ThumbnailCache(cache_dir)
+        ImageBrowser(self.root, self.thumbnails, self.image_files, self.select_image)
+
+    def select_image(self, path):
+        self.current_image = path
+        self.display_images()
+
     def display_images(self):
+        """后台压缩并生成缩略图，完成后回到主线程显示"""
         if not self.current_image:
             return
 
-        try:
-            # 显示原图
-            original_img = Image.open(self.current_image)
+        self.preview_token += 1
+        token = self.preview_token
+        path = self.current_image
+        self.status_var.set(f"正在预览: {os.path.basename(path)}")
+        # 已读取过文件头的图片，信息面板先于压缩结果显示
+        if self.probes.get(path):
+            self.show_info(path, self.probes[path])
+
+        def failed(e):
+            self.first_preview_at = self.first_preview_at or time.perf_counter()
+            messagebox.showerror("错误", f"无法加载图片: {str(e)}")
+
+        self.run_in_background(
+            lambda: self.prepare_preview(path, token),
+            lambda preview: self.show_preview(preview, token),
+            failed,
+        )
+
+    def prepare_preview(self, path, token):
+        """后台线程：压缩原图并生成两张缩略图，不接触 Tk"""
+        with self.preview_lock:
+            if token != self.preview_token:
+                return None  # 已有更新的预览请求
+            info = self.probes.get(path) or self.get_probe_index().probe(path)
+            # 先压缩原图（全尺寸像素），再缩略显示，不再复制整张原图
+            original_img = open_image(path)
+            compression_data = self.engine.compress_image(original_img, path)
             original_img.thumbnail((450, 450))
-            original_tk = ImageTk.PhotoImage(original_img)
-            self.original_img_label.configure(image=original_tk)
-            self.original_img_label.image = original_tk
-
-            # 显示原图信息
-            file_size = os.path.getsize(self.current_image) / 1024
-            width, height = original_img.size
-            mode = original_img.mode
-            self.original_info.config(
-                text=f"文件: {os.path.basename(self.current_image)}\n"
-                f"大小: {file_size:.1f}KB\n"
-                f"尺寸: {width}x{height}\n"
-                f"模式: {mode}\n"
-                f"格式: {original_img.format}"
-            )
+            # 只在预览时解码压缩后的数据
+            compressed_img = decode_result(compression_data, original_img)
+            compressed_img.thumbnail((450, 450))
+            return path, info, original_img, compressed_img, compression_data
+
+    def show_info(self, path, info):
+        """显示原图信息，只用文件头数据"""
+        text = (
+            f"文件: {os.path.basename(path)}\n"
+            f"大小: {info['file_size'] / 1024:.1f}KB\n"
+            f"尺寸: {info['width']}x{info['height']}\n"
+            f"模式: {info['mode']}\n"
+            f"格式: {info['format'].upper()}"
+        )
+        if info["orientation"] != 1:
+            text += f"\nEXIF 方向: {info['orientation']}"
+        if info["has_icc"]:
+            text += "\n嵌入 ICC 配置"
+        self.original_info.config(text=text)
+
+    def show_preview(self, preview, token):
+        """主线程：显示后台准备好的预览"""
+        if preview is None or token != self.preview_token:
+            return
+        # PhotoImage 需要 Tk，用到预览时才导入
+        from PIL import ImageTk
 
-            # 自动计算压缩并显示结果
-            self.auto_compress_and_show(original_img)
+        path, info, original_img, compressed_img, compression_data = preview
 
-        except Exception as e:
-            messagebox.showerror("错误", f"无法加载图片: {str(e)}")
+        # 显示原图
+        original_tk = ImageTk.PhotoImage(original_img)
+        self.original_img_label.configure(image=original_tk)
+        self.original_img_label.image = original_tk
 
-    def auto_compress_and_show(self, original_img):
-        """自动计算压缩比例并显示结果"""
-        try:
-            start_time = time.time()
+        # 显示原图信息
+        self.show_info(path, info)
+
+        # 显示压缩结果
+        self.show_compressed(compression_data, compressed_img)
+        self.status_var.set(f"预览: {os.path.basename(path)}")
+        if self.first_preview_at is None:
+            self.first_preview_at = time.perf_counter()
 
-            # 调用优化后的压缩方法
-            compressed_img, compression_data = self.compress_image(original_img.copy())
+    def show_compressed(self, compression_data, compressed_img):
+        """显示压缩结果"""
+        from PIL import ImageTk
 
+        try:
             # 显示压缩图
-            compressed_img.thumbnail((450, 450))
             compressed_tk = ImageTk.PhotoImage(compressed_img)
             self.compressed_img_label.configure(image=compressed_tk)
             self.compressed_img_label.image = compressed_tk
@@ -256,9 +426,9 @@ class ImageCompressorApp:
                     f"压缩比: {compression_data['ratio']:.1%}\n"
                     f"处理时间: {compression_data['time']:.2f}秒"
                 )
-                if "quality" in compression_data:
+                if compression_data.get("quality") is not None:
                     info_text += f"\n质量参数: {compression_data['quality']}"
-                if "colors" in compression_data:
+                if compression_data.get("colors") is not None:
                     info_text += f"\n使用颜色: {compression_data['colors']}"
 
                 self.compressed_info.config(text=info_text)
@@ -266,341 +436,21 @@ class ImageCompressorApp:
         except Exception as e:
             messagebox.showerror("错误", f"压缩图片失败: {str(e)}")
 
-    def compress_image(self, img):
-        """优化后的图像压缩方法"""
-        img_format = img.format.lower() if img.format else "jpeg"
-        original_format = img_format
-        file_ext = os.path.splitext(self.current_image)[1].lower()
-
-        # 如果输入格式为HEIC/HEIF，转换格式处理
-        if img_format in ["heic", "heif"] or file_ext in [".heic", ".heif"]:
-            img_format = "jpeg"  # 转换为JPEG处理
-
-        # 创建压缩数据字典
-        compression_data = {
-            "method": "Direct Copy",
-            "compressed_size": os.path.getsize(self.current_image) / 1024,
-            "quality": None,
-            "colors": None,
-            "time": 0.0,
-            "ratio": 0.0,
-            "format": img_format,
-        }
-
-        start_time = time.time()
-
-        # 如果原始图片已经足够小，直接返回
-        original_size_kb = compression_data["compressed_size"]
-        if original_size_kb <= self.target_size_kb * 1.05:
-            compression_data["method"] = "Direct Copy (Already Small)"
-            compression_data["time"] = time.time() - start_time
-            return img, compression_data
-
-        # 根据不同格式使用不同的压缩方法
-        if img_format in ["jpeg", "jpg"]:
-            buffer = io.BytesIO()
-
-            # 高质量模式优先尝试
-            quality = 90
-            img.save(
-                buffer, format="JPEG", quality=quality, optimize=True, progressive=True
-            )
-            compressed_size = len(buffer.getvalue()) / 1024
-
-            # 如果高质量模式已经满足需求
-            if compressed_size <= self.target_size_kb:
-                compression_data["method"] = "High Quality JPEG"
-                compression_data["quality"] = quality
-                compression_data["compressed_size"] = compressed_size
-                compression_data["ratio"] = 1 - compressed_size / original_size_kb
-                compression_data["time"] = time.time() - start_time
-                return Image.open(buffer), compression_data
-
-            # 执行智能压缩
-            compressed_img, quality = self.smart_jpeg_compress(img, self.target_size_kb)
-            compression_data["method"] = "Smart JPEG Compression"
-            compression_data["quality"] = quality
-            compression_data["time"] = time.time() - start_time
-
-            # 计算压缩后大小
-            buffer = io.BytesIO()
-            compressed_img.save(
-                buffer, format="JPEG", quality=quality, optimize=True, progressive=True
-            )
-            compressed_size = len(buffer.getvalue()) / 1024
-            compression_data["compressed_size"] = compressed_size
-            compression_data["ratio"] = 1 - compressed_size / original_size_kb
-            compression_data["format"] = "jpeg"
-
-            return compressed_img, compression_data
-
-        elif img_format == "png":
-            # 尝试使用高级PNG压缩
-            compressed_img, method = self.compress_png(img, self.target_size_kb)
-
-            compression_data["method"] = method
-            compression_data["time"] = time.time() - start_time
-
-            # 计算压缩后大小
-            buffer = io.BytesIO()
-            compressed_img.save(buffer, format="PNG", optimize=True)
-            compressed_size = len(buffer.getvalue()) / 1024
-            compression_data["compressed_size"] = compressed_size
-            compression_data["ratio"] = 1 - compressed_size / original_size_kb
-            compression_data["format"] = "png"
-
-            return compressed_img, compression_data
-
-        elif img_format == "webp":
-            # WebP压缩
-            compressed_img, quality = self.smart_webp_compress(img, self.target_size_kb)
-
-            compression_data["method"] = "Smart WebP Compression"
-            compression_data["quality"] = quality
-            compression_data["time"] = time.time() - start_time
-
-            # 计算压缩后大小
-            buffer = io.BytesIO()
-            compressed_img.save(buffer, format="WEBP", quality=quality, method=6)
-            compressed_size = len(buffer.getvalue()) / 1024
-            compression_data["compressed_size"] = compressed_size
-            compression_data["ratio"] = 1 - compressed_size / original_size_kb
-            compression_data["format"] = "webp"
-
-            return compressed_img, compression_data
-
-        else:
-            # 其他格式尝试转为WebP或高质量JPEG
-            try:
-                # 尝试转换为WebP
-                compressed_img, quality = self.smart_webp_compress(
-                    img, self.target_size_kb
-                )
-
-                compression_data["method"] = "Convert to WebP"
-                compression_data["quality"] = quality
-                compression_data["time"] = time.time() - start_time
-                compression_data["format"] = "webp"
-
-                buffer = io.BytesIO()
-                compressed_img.save(buffer, format="WEBP", quality=quality, method=6)
-                compressed_size = len(buffer.getvalue()) / 1024
-                compression_data["compressed_size"] = compressed_size
-                compression_data["ratio"] = 1 - compressed_size / original_size_kb
-
-                return compressed_img, compression_data
-            except:
-                # 如果WebP转换失败，回退到JPEG压缩
-                compressed_img, quality = self.smart_jpeg_compress(
-                    img, self.target_size_kb
-                )
-
-                compression_data["method"] = f"Convert to JPEG (from {original_format})"
-                compression_data["quality"] = quality
-                compression_data["time"] = time.time() - start_time
-                compression_data["format"] = "jpeg"
-
-                buffer = io.BytesIO()
-                compressed_img.save(
-                    buffer,
-                    format="JPEG",
-                    quality=quality,
-                    optimize=True,
-                    progressive=True,
-                )
-                compressed_size = len(buffer.getvalue()) / 1024
-                compression_data["compressed_size"] = compressed_size
-                compression_data["ratio"] = 1 - compressed_size / original_size_kb
-
-                return compressed_img, compression_data
-
-    def smart_jpeg_compress(self, img, target_kb):
-        """智能JPEG压缩，优先保留高质量"""
-
-        # 使用Pillow的高质量保存
-        def save_jpeg(quality):
-            buffer = io.BytesIO()
-            img.save(
-                buffer, format="JPEG", quality=quality, optimize=True, progressive=True
-            )
-            return buffer.getvalue()
-
-        # 高质量优先策略
-        low, high = 40, 95
-        best_quality = high
-        best_data = save_jpeg(best_quality)
-        best_size = len(best_data) / 1024
-
-        # 如果高质量已经小于目标大小，直接返回
-        if best_size <= target_kb:
-            return Image.open(io.BytesIO(best_data)), best_quality
-
-        # 二分法查找最佳质量
-        while low <= high:
-            mid = (low + high) // 2
-            mid_data = save_jpeg(mid)
-            mid_size = len(mid_data) / 1024
-
-            if mid_size < target_kb:
-                best_quality = mid
-                best_data = mid_data
-                best_size = mid_size
-                low = mid + 1
-            else:
-                high = mid - 1
-
-        # 确保不会低于最低质量
-        if best_quality < 50 and best_size > target_kb:
-            quality = max(10, best_quality - 5)
-            return self.smart_jpeg_compress(img, target_kb)
-
-        return Image.open(io.BytesIO(best_data)), best_quality
-
-    def compress_png(self, img, target_kb):
-        """高级PNG压缩方法"""
-        # 1. 尝试无损压缩
-        try:
-            compressed_img = self.compress_png_lossless(img)
-            buffer = io.BytesIO()
-            compressed_img.save(buffer, format="PNG", optimize=True)
-            compressed_size = len(buffer.getvalue()) / 1024
-
-            if compressed_size <= target_kb:
-                return compressed_img, "PNG Lossless (Zopfli)"
-        except Exception as e:
-            print(f"PNG无损压缩失败: {e}")
-
-        # 2. 尝试有损压缩（减少颜色）
-        try:
-            compressed_img = self.compress_png_lossy(img, 256)  # 256色
-            buffer = io.BytesIO()
-            compressed_img.save(buffer, format="PNG", optimize=True)
-            compressed_size = len(buffer.getvalue()) / 1024
-
-            if compressed_size <= target_kb:
-                return compressed_img, "PNG Lossy (256 colors)"
-        except Exception as e:
-            print(f"PNG有损压缩失败: {e}")
-
-        # 3. 降为128色
-        try:
-            compressed_img = self.compress_png_lossy(img, 128)
-            buffer = io.BytesIO()
-            compressed_img.save(buffer, format="PNG", optimize=True)
-            compressed_size = len(buffer.getvalue()) / 1024
-
-            if compressed_size <= target_kb:
-                return compressed_img, "PNG Lossy (128 colors)"
-        except Exception as e:
-            print(f"PNG有损压缩失败: {e}")
-
-        # 4. 最终转为WebP
-        webp_img, quality = self.smart_webp_compress(img, target_kb)
-        return webp_img, f"Convert to WebP (quality={quality})"
-
-    def compress_png_lossless(self, img):
-        """使用Zopfli进行无损PNG压缩（需要安装optipng或zopflipng）"""
-        try:
-            # 使用系统optipng命令
-            temp_input = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-            temp_output = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-
-            img.save(temp_input, format="PNG")
-            temp_input.close()
-
-            # 使用高级压缩参数
-            cmd = [
-                "optipng",
-                "-o6",
-                "-quiet",
-                temp_input.name,
-                "-out",
-                temp_output.name,
-            ]
-            subprocess.run(
-                cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-
-            compressed_img = Image.open(temp_output.name)
-
-            # 清理临时文件
-            os.unlink(temp_input.name)
-            os.unlink(temp_output.name)
-
-            return compressed_img
-        except:
-            # 如果optipng不可用，使用Pillow的最佳优化
-            buffer = io.BytesIO()
-            img.save(buffer, format="PNG", compress_level=9)
-            return Image.open(buffer)
-
-    def compress_png_lossy(self, img, max_colors):
-        """有损PNG压缩 - 减少颜色数量"""
-        # 转换为P模式（调色板模式）
-        if img.mode == "RGBA":
-            # 处理透明通道
-            alpha = img.split()[-1]
-            img = img.convert("RGB")
-
-        # 转换时使用高保真方法
-        palette_img = img.quantize(colors=max_colors, method=Image.MEDIANCUT)
-
-        # 转换回RGBA如果原始有透明通道
-        if img.mode == "RGBA":
-            palette_img = palette_img.convert("RGBA")
-            palette_img.putalpha(alpha)
-
-        return palette_img
-
-    def smart_webp_compress(self, img, target_kb):
-        """智能WebP压缩"""
-
-        def save_webp(quality):
-            buffer = io.BytesIO()
-            img.save(buffer, format="WEBP", quality=quality, method=6)
-            return buffer.getvalue()
-
-        # 高质量优先策略
-        low, high = 40, 90
-        best_quality = high
-        best_data = save_webp(best_quality)
-        best_size = len(best_data) / 1024
-
-        # 如果高质量已经小于目标大小，直接返回
-        if best_size <= target_kb:
-            return Image.open(io.BytesIO(best_data)), best_quality
-
-        # 二分法查找最佳质量
-        while low <= high:
-            mid = (low + high) // 2
-            mid_data = save_webp(mid)
-            mid_size = len(mid_data) / 1024
-
-            if mid_size < target_kb:
-                best_quality = mid
-                best_data = mid_data
-                best_size = mid_size
-                low = mid + 1
-            else:
-                high = mid - 1
-
-        return Image.open(io.BytesIO(best_data)), best_quality
-
     def compress_all(self):
         if not self.image_files:
             messagebox.showwarning("警告", "没有找到可用的图片文件")
             return
 
-        # 创建压缩文件夹
-        if os.path.exists(self.compressed_folder):
-            shutil.rmtree(self.compressed_folder)
-        os.makedirs(self.compressed_folder)
-
-        # 初始化报告数据
-        self.report_data = []
-        total = len(self.image_files)
-        processed = 0
-        skipped = 0
+        # 批次使用引擎的副本：压缩期间修改目标大小或力度只影响预览
+        engine = self.engine.snapshot()
+        batch = BatchCompressor(
+            engine,
+            self.output_folder,
+            self.compressed_folder,
+            workers=os.cpu_count() or 1,
+        )
+        files = list(self.image_files)
+        total = len(files)
 
         # 在主窗口显示压缩状态
         self.status_var.set(f"正在压缩: 0/{total} (跳过:0)")
@@ -624,7 +474,7 @@ class ImageCompressorApp:
         )
         progress_bar.pack(pady=10)
 
-        status_label = ttk.Label(progress_window, text="状态: 初始化...")
+        status_label = ttk.Label(progress_window, text="状态: 正在查找重复图片...")
         status_label.pack(pady=5)
 
         cancel_button = ttk.Button(
@@ -636,217 +486,145 @@ class ImageCompressorApp:
 
         self.cancel_flag = False
         progress_window.grab_set()
-        self.root.update()
 
-        start_time = time.time()
-
-        for img_path in self.image_files:
-            if self.cancel_flag:
-                status_label.config(text="操作已取消")
-                time.sleep(1)
-                progress_window.destroy()
-                self.status_var.set("用户取消压缩")
-                return
+        skipped = 0
 
-            processed += 1
+        def show_progress(args):
+            # 主线程：更新进度窗口
+            nonlocal skipped
+            processed, total, img_path, item = args
+            if item["status"].startswith("skipped"):
+                skipped += 1
             self.status_var.set(f"正在压缩: {processed}/{total} (跳过:{skipped})")
             current_file_label.config(text=f"当前文件: {os.path.basename(img_path)}")
-            status_label.config(text="正在处理...")
-            progress_var.set(processed)
-            progress_window.update()
-
-            # 获取相对路径
-            rel_path = os.path.relpath(img_path, self.output_folder)
-            dest_path = os.path.join(self.compressed_folder, rel_path)
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-
-            # 获取原始大小
-            original_size = os.path.getsize(img_path) / 1024
-
-            # 如果小于目标大小，直接复制
-            if original_size <= self.target_size_kb * 1.05:
-                shutil.copy2(img_path, dest_path)
-                skipped += 1
-                self.report_data.append(
-                    {
-                        "file": img_path,
-                        "original_size": original_size,
-                        "compressed_size": original_size,
-                        "status": "skipped (already small enough)",
-                        "method": "direct copy",
-                        "destination": dest_path,
-                    }
-                )
-                continue
-
-            try:
-                img = Image.open(img_path)
-                file_format = img.format.lower() if img.format else ""
-
-                # 调用压缩方法
-                compressed_img, compression_data = self.compress_image(img)
-
-                # 获取实际压缩大小
-                buffer = io.BytesIO()
-                compressed_img.save(
-                    buffer,
-                    format=(
-                        "JPEG"
-                        if compression_data["format"] == "jpeg"
-                        else "PNG" if compression_data["format"] == "png" else "WEBP"
-                    ),
-                )
-                compressed_size = len(buffer.getvalue()) / 1024
-
-                # 保存图片，保留EXIF信息
-                compressed_img.save(
-                    dest_path,
-                    quality=compression_data.get("quality", 85),
-                    optimize=True,
-                )
-
-                # 报告数据
-                report_item = {
-                    "file": img_path,
-                    "original_size": original_size,
-                    "compressed_size": compressed_size,
-                    "method": compression_data.get("method", "unknown"),
-                    "quality": compression_data.get("quality", None),
-                    "colors": compression_data.get("colors", None),
-                    "status": "success",
-                    "ratio": 1 - (compressed_size / original_size),
-                    "destination": dest_path,
-                }
-
-                self.report_data.append(report_item)
-
+            if item["status"] == "success":
                 status_label.config(
-                    text=f"完成: 大小 {compressed_size:.1f}KB (原 {original_size:.1f}KB)"
+                    text=f"完成: 大小 {item['compressed_size']:.1f}KB "
+                    f"(原 {item['original_size']:.1f}KB)"
                 )
+            else:
+                status_label.config(text=f"状态: {item['status']}")
+            progress_var.set(processed)
 
-            except Exception as e:
-                # 压缩失败时复制原图
-                shutil.copy2(img_path, dest_path)
-                self.report_data.append(
-                    {
-                        "file": img_path,
-                        "original_size": original_size,
-                        "compressed_size": original_size,
-                        "status": f"failed: {str(e)}",
-                        "method": "copy",
-                        "destination": dest_path,
-                    }
-                )
-                status_label.config(text=f"失败: {str(e)}")
+        def work():
+            # 后台线程：等待进行中的预览结束，批量压缩与预览共用同一个引擎
+            self.preview_token += 1
+            with self.preview_lock:
+                try:
+                    batch.reset_output()
+                    batch.run(
+                        files,
+                        lambda *args: self.events.put((show_progress, args)),
+                        lambda: self.cancel_flag,
+                    )
+                finally:
+                    engine.close()
+            return batch
+
+        def failed(e):
+            progress_window.destroy()
+            messagebox.showerror("错误", f"批量压缩失败: {str(e)}")
+
+        self.run_in_background(
+            work, lambda batch: self.finish_compress_all(batch, progress_window), failed
+        )
 
+    def finish_compress_all(self, batch, progress_window):
+        """主线程：批量压缩结束后汇总"""
+        self.report_data = batch.report_data
+        self.duplicate_groups = batch.duplicate_groups
+        self.batch_engine = batch.engine
         progress_window.destroy()
 
-        elapsed = time.time() - start_time
-        success_count = len([x for x in self.report_data if x["status"] == "success"])
+        if batch.cancelled:
+            self.status_var.set("用户取消压缩")
+            return
+
+        summary = batch.summary()
+        self.batch_summary = summary
+        elapsed = summary["elapsed"]
+        total = summary["total"]
 
         messagebox.showinfo(
             "完成",
             f"图片压缩完成!\n\n"
             f"处理总数: {total}\n"
-            f"成功压缩: {success_count}\n"
-            f"跳过(已足够小): {skipped}\n"
+            f"成功压缩: {summary['success']}\n"
+            f"跳过(已足够小): {summary['skipped']}\n"
+            f"重复复用: {summary['duplicates']}\n"
             f"耗时: {elapsed:.1f}秒\n"
-            f"平均耗时: {elapsed/total if total else 0:.2f}秒/图片",
+            f"平均耗时: {elapsed/total if total else 0:.2f}秒/图片\n"
+            f"并行效率: {summary['efficiency']:.0%} ({summary['workers']} 进程)",
         )
         self.status_var.set(f"压缩完成! 结果保存在: {self.compressed_folder}")
 
-    def generate_report(self):
-        if not self.report_data:
-            messagebox.showwarning("警告", "没有可用的压缩数据，请先执行压缩")
-            return
+    def update_effort(self, event=None):
+        """切换编码力度预设"""
+        self.engine.set_effort(self.effort_var.get(), self.search_effort_var.get())
+        if self.current_image:
+            self.display_images()
+        self.status_var.set(
+            f"编码力度: 搜索 {self.engine.search_effort} / 最终 {self.engine.effort}"
+        )
 
-        # 创建Markdown报告
-        report = f"# 智能图片压缩报告\n\n"
-        report += f"**生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        report += f"**目标大小**: {self.target_size_kb} KB\n"
-        report += f"**源文件夹**: {self.output_folder}\n"
-        report += f"**目标文件夹**: {self.compressed_folder}\n\n"
-
-        report += "## 统计摘要\n\n"
-
-        # 分类统计压缩方法
-        method_stats = {}
-        for item in self.report_data:
-            method = item.get("method", "unknown")
-            if method not in method_stats:
-                method_stats[method] = {"count": 0, "saved": 0}
-            method_stats[method]["count"] += 1
-            method_stats[method]["saved"] += (
-                item["original_size"] - item["compressed_size"]
-            )
+    def run_effort_benchmark(self):
+        """在随机样本上测量各力度预设，结果写入报告"""
+        if not self.image_files:
+            messagebox.showwarning("警告", "没有找到可用的图片文件")
+            return
 
-        total_saved = sum(
-            item["original_size"] - item["compressed_size"] for item in self.report_data
+        sample = random.sample(self.image_files, min(10, len(self.image_files)))
+        self.status_var.set(f"正在测试编码力度预设 ({len(sample)} 张样本)...")
+        # 每个预设都要压缩全部样本，在后台线程执行，完成前禁止重复启动
+        self.benchmark_button.config(state=tk.DISABLED)
+        target_kb = self.target_size_kb
+
+        def failed(e):
+            self.benchmark_button.config(state=tk.NORMAL)
+            self.status_var.set("编码力度基准失败")
+            messagebox.showerror("错误", f"编码力度基准失败: {str(e)}")
+
+        self.run_in_background(
+            lambda: benchmark_efforts(sample, target_kb),
+            self.show_effort_benchmark,
+            failed,
         )
-        avg_ratio = (
-            total_saved / sum(item["original_size"] for item in self.report_data)
-            if self.report_data
-            else 0
-        )
-
-        report += f"- 总文件数: {len(self.report_data)}\n"
-        report += f"- 总压缩节省: {total_saved:.1f} KB\n"
-        report += f"- 平均压缩率: {avg_ratio:.1%}\n"
-        report += f"- 压缩方法分布:\n"
 
-        for method, stats in method_stats.items():
-            report += (
-                f"  - {method}: {stats['count']} 文件 (节省 {stats['saved']:.1f}KB)\n"
-            )
+    def show_effort_benchmark(self, results):
+        """主线程：显示力度基准结果"""
+        self.benchmark_button.config(state=tk.NORMAL)
+        self.effort_benchmark = results
+        lines = [
+            f"{row['search_effort']}/{row['effort']}: {row['time']:.2f}秒, "
+            f"{row['total_kb']:.1f}KB, {row['encodes']} 次编码"
+            for row in self.effort_benchmark
+        ]
+        messagebox.showinfo("编码力度基准", "\n".join(lines))
+        self.status_var.set("编码力度基准已完成，结果将写入报告")
 
-        report += "\n## 文件处理详情\n\n"
-        report += "| 原文件 | 原始大小(KB) | 压缩后大小(KB) | 压缩率 | 方法 | 状态 |\n"
-        report += "|--------|-------------|----------------|--------|------|------|\n"
+    def generate_report(self):
+        if not self.report_data:
+            messagebox.showwarning("警告", "没有可用的压缩数据，请先执行压缩")
+            return
 
-        for item in self.report_data:
-            ratio = 1 - (item["compressed_size"] / item["original_size"])
-            report += (
-                f"| {os.path.basename(item['file'])} | {item['original_size']:.1f} | "
-                f"{item['compressed_size']:.1f} | {ratio:.1%} | "
-                f"{item.get('method', '')} | {item['status']} |\n"
-            )
+        from compression_report import build_report, save_report
+
+        engine = self.batch_engine or self.engine
+        report = build_report(
+            self.report_data,
+            engine.target_size_kb,
+            self.output_folder,
+            self.compressed_folder,
+            duplicate_groups=self.duplicate_groups,
+            effort=engine.effort,
+            search_effort=engine.search_effort,
+            effort_benchmark=self.effort_benchmark,
+            batch_summary=self.batch_summary,
+        )
 
         # 保存报告
         report_folder = os.path.join(os.path.dirname(self.compressed_folder), "reports")
-        os.makedirs(report_folder, exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_path = os.path.join(report_folder, f"compression_report_{timestamp}.md")
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write(report)
-
-        # 转换为HTML
-        html = markdown.markdown(report)
-        html_path = os.path.join(report_folder, f"compression_report_{timestamp}.html")
-
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(
-                f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>图片压缩报告</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; max-width: 1200px; margin: 0 auto; padding: 20px; }}
-                    table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-                    th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                    th {{ background-color: #f2f2f2; }}
-                    .summary {{ background-color: #f8f8f8; padding: 15px; border-radius: 5px; }}
-                    .chart-container {{ width: 100%; height: 300px; }}
-                </style>
-            </head>
-            <body>
-            {html}
-            </body>
-            </html>
-            """
-            )
+        report_path, html_path = save_report(report, report_folder)
 
         # 显示报告生成成功的消息
         show_in_folder = messagebox.askyesno(
@@ -870,7 +648,62 @@ class ImageCompressorApp:
         self.status_var.set(f"报告已生成: {report_path}")
 
 
+def startup_benchmark(max_startup_ms=None, timeout=120):
+    """测量启动耗时：模块导入、窗口可用、首张预览完成
+
+    窗口可用时间超过 max_startup_ms 时返回 1，便于在 CI 中发现启动变慢
+    """
+    imported = time.perf_counter()
+    root = tk.Tk()
+    app = ImageCompressorApp(root)
+    root.update()
+    ready = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    # 继续处理事件，直到后台扫描和首张预览完成
+    while app.first_preview_at is None and time.perf_counter() - ready < timeout:
+        root.update()
+        time.sleep(0.01)
+    preview = app.first_preview_at
+    root.destroy()
+    app.engine.close()
+
+    ready_ms = (ready - _START) * 1000
+    print("⏱️ 启动耗时")
+    print(f"  模块导入: {(imported - _START) * 1000:.0f}ms")
+    print(f"  窗口可用: {ready_ms:.0f}ms")
+    if preview is not None:
+        print(f"  首张预览: {(preview - _START) * 1000:.0f}ms")
+    else:
+        print(f"  首张预览: 超过 {timeout} 秒未完成")
+    print(f"  窗口可用时已加载的重型模块: {', '.join(loaded) or '无'}")
+
+    if max_startup_ms is not None and ready_ms > max_startup_ms:
+        print(f"❌ 窗口可用耗时超过 {max_startup_ms}ms")
+        return 1
+    return 0
+
+
 if __name__ == "__main__":
+    if "--startup-benchmark" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser(description="图片压缩工具启动基准")
+        parser.add_argument("--startup-benchmark", action="store_true")
+        parser.add_argument(
+            "--max-startup-ms",
+            type=float,
+            default=None,
+            help="窗口可用耗时上限（毫秒），超过时以非零状态退出",
+        )
+        args = parser.parse_args()
+        sys.exit(startup_benchmark(args.max_startup_ms))
+
     root = tk.Tk()
     app = ImageCompressorApp(root)
     root.mainloop()
+    app.engine.close()
+    if app.thumbnails is not None:
+        app.thumbnails.close()
+    if app.probe_index is not None:
+        app.probe_index.close()
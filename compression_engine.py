@@ -0,0 +1,777 @@
+import os
+import io
+import copy
+import functools
+import importlib
+import math
+import time
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from quality_prior import image_features
+from shared_pixels import SharedPixels, prepare_workers, run_shared
+
+# 启动时检测无损 JPEG 重新打包工具（libjpeg 的 jpegtran）
+JPEGTRAN = shutil.which("jpegtran")
+
+# AVIF/HEIF 插件导入较慢，遇到对应文件或需要编码 AVIF 时才加载
+PLUGIN_EXTENSIONS = {
+    ".avif": "pillow_avif",
+    ".heic": "pillow_heif",
+    ".heif": "pillow_heif",
+}
+_loaded_plugins = set()
+
+
+def load_plugin(name):
+    """按需导入格式插件（未安装时忽略），每个插件只导入一次"""
+    if name in _loaded_plugins:
+        return
+    _loaded_plugins.add(name)
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return
+    if name == "pillow_heif":
+        module.register_heif_opener()
+
+
+def open_image(path):
+    """打开图片；AVIF/HEIF 文件先加载对应插件"""
+    plugin = PLUGIN_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if plugin:
+        load_plugin(plugin)
+    return Image.open(path)
+
+
+@functools.cache
+def avif_supported():
+    """能否编码 AVIF（首次调用时加载插件）"""
+    load_plugin("pillow_avif")
+    Image.init()
+    return "AVIF" in Image.SAVE
+
+
+# 压缩结果格式对应的扩展名
+FORMAT_EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg"),
+    "png": (".png",),
+    "webp": (".webp",),
+    "avif": (".avif",),
+}
+
+# PNG 压缩阶梯：依次尝试，第一个不超过目标大小的候选胜出，WebP 兜底
+PNG_LADDER = ("lossless", "lossy256", "lossy128", "webp")
+
+# 编码力度预设：同一预设在各格式上对应一致的速度/体积取舍
+EFFORT_PRESETS = {
+    "fast": {
+        "jpeg": {"optimize": False, "progressive": False},
+        "webp": {"method": 2},
+        "avif": {"speed": 8},
+        "png": {"compress_level": 6},
+        "optipng": "-o1",
+    },
+    "balanced": {
+        "jpeg": {"optimize": True, "progressive": False},
+        "webp": {"method": 4},
+        "avif": {"speed": 6},
+        "png": {"optimize": True},
+        "optipng": "-o2",
+    },
+    "max": {
+        "jpeg": {"optimize": True, "progressive": True},
+        "webp": {"method": 6},
+        "avif": {"speed": 2},
+        "png": {"optimize": True},
+        "optipng": "-o6",
+    },
+}
+
+
+def encode(img, fmt, **params):
+    """编码到内存缓冲区，返回 BytesIO（不复制编码数据）"""
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer
+
+
+def buffer_kb(buffer):
+    """缓冲区大小（KB），通过 getbuffer().nbytes 获取，避免 getvalue() 复制"""
+    return buffer.getbuffer().nbytes / 1024
+
+
+def output_path(dest_path, fmt):
+    """压缩后格式与原扩展名不一致时（如 PNG 转 WebP），替换扩展名"""
+    root, ext = os.path.splitext(dest_path)
+    if ext.lower() in FORMAT_EXTENSIONS.get(fmt, (ext.lower(),)):
+        return dest_path
+    return root + FORMAT_EXTENSIONS[fmt][0]
+
+
+def write_result(source_path, dest_path, compression_data):
+    """写出压缩结果：有编码数据时直接写字节，否则复制原文件"""
+    data = compression_data.get("data")
+    if data is None:
+        shutil.copy2(source_path, dest_path)
+        return dest_path
+
+    dest_path = output_path(dest_path, compression_data["format"])
+    with open(dest_path, "wb") as f:
+        f.write(data)
+    return dest_path
+
+
+def jpeg_ready(img):
+    """JPEG 不支持透明和调色板模式，编码前转为 RGB"""
+    if img.mode not in ("RGB", "L", "CMYK"):
+        return img.convert("RGB")
+    return img
+
+
+def spread(low, high, count):
+    """在 [low, high] 内均匀取 count 个不重复的质量值，count 为 1 时即二分中点"""
+    if count <= 0 or low > high:
+        return []
+    return sorted({low + (high - low) * i // (count + 1) for i in range(1, count + 1)})
+
+
+def encode_bytes(img, fmt, params):
+    """工作进程中的单次编码，返回编码字节"""
+    return encode(img, fmt, **params).getvalue()
+
+
+def png_candidate_bytes(img, engine, target_kb, step):
+    """工作进程中计算一个 PNG 阶梯候选，返回 (编码字节, 方法, 格式) 或 None"""
+    candidate = engine.png_candidate(img, target_kb, step)
+    if candidate is None:
+        return None
+    buffer, method, fmt = candidate
+    return buffer.getvalue(), method, fmt
+
+
+def decode_result(compression_data, original_img):
+    """仅在需要像素时（预览）解码压缩结果"""
+    data = compression_data.get("data")
+    if data is None:
+        return original_img
+    return Image.open(io.BytesIO(data))
+
+
+class CompressionEngine:
+    """不依赖界面的压缩引擎
+
+    编码结果以 memoryview（指向 BytesIO 内部缓冲区）的形式放在
+    compression_data["data"] 中传递，调用方直接写文件，不再解码后重新保存。
+
+    effort 为最终编码使用的力度预设；search_effort 为质量搜索时使用的预设，
+    例如 search_effort="fast", effort="max" 表示用快速编码找质量，最后用最高力度编码一次。
+
+    workers > 1 时，像素数不少于 parallel_min_pixels 的大图只解码一次并放入共享内存，
+    多个质量探测和 PNG 阶梯候选交给进程池同时编码。
+    """
+
+    def __init__(
+        self,
+        target_size_kb=200,
+        track_memory=False,
+        lossless_margin=1.25,
+        effort="max",
+        search_effort=None,
+        workers=1,
+        parallel_min_pixels=4_000_000,
+        prior=None,
+        prior_tolerance=0.05,
+        mp_context=None,
+    ):
+        self.target_size_kb = target_size_kb
+        self.track_memory = track_memory
+        # 原图不超过目标大小的该倍数时，先尝试无损重新打包
+        self.lossless_margin = lossless_margin
+        self.set_effort(effort, search_effort)
+        self.encodes = 0
+        self.workers = workers
+        self.parallel_min_pixels = parallel_min_pixels
+        # 进程池懒创建，也可以由批处理注入共用
+        self.executor = None
+        self.owns_executor = False
+        # 进程池的启动方式；界面等有多个线程的进程传入 spawn 上下文，
+        # 避免 fork 复制其他线程持有的锁而死锁。批处理的进程池也使用它
+        self.mp_context = mp_context
+        self.shared = {}
+        # 工作进程中消耗的 CPU 时间（本进程的 process_time 统计不到）
+        self.remote_cpu_time = 0.0
+        # 历史结果拟合的质量预测（QualityPrior），用于确定搜索起点
+        self.prior = prior
+        # 预测质量的结果不超过目标且差距在该比例内时直接采用
+        self.prior_tolerance = prior_tolerance
+        self.search_info = None
+
+    def __getstate__(self):
+        # 进程池和共享内存不能跨进程传递，工作进程中的副本只做单进程编码
+        state = self.__dict__.copy()
+        state.update(
+            executor=None, owns_executor=False, shared={}, workers=1, mp_context=None
+        )
+        return state
+
+    def with_executor(self, executor, workers):
+        """返回共用外部进程池的引擎副本，批处理中拆分超大图片时使用"""
+        engine = copy.copy(self)
+        engine.executor = executor
+        engine.workers = workers
+        # 是否拆分已由批处理调度按代价决定，不再受像素阈值限制
+        engine.parallel_min_pixels = 0
+        # 多个线程在同一进程中压缩时 tracemalloc 峰值无法区分
+        engine.track_memory = False
+        return engine
+
+    def snapshot(self):
+        """返回设置相同的独立副本（不共用进程池和共享内存）
+
+        后台批处理使用副本，界面中途修改目标大小或力度不影响进行中的批次。
+        """
+        engine = copy.copy(self)
+        # copy 经过 __getstate__，恢复需要保留的设置
+        engine.workers = self.workers
+        engine.mp_context = self.mp_context
+        return engine
+
+    def close(self):
+        """释放共享内存和自建的进程池"""
+        self.release_shared()
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.owns_executor = False
+
+    def parallel_for(self, img):
+        """大图且允许多进程时，在共享内存上并行编码"""
+        return self.workers > 1 and img.width * img.height >= self.parallel_min_pixels
+
+    def share(self, img):
+        """同一图像对象只放入共享内存一次，返回描述符"""
+        entry = self.shared.get(id(img))
+        if entry is None:
+            # 保留图像引用，避免 id 在本次压缩期间被复用
+            entry = (img, SharedPixels(img))
+            self.shared[id(img)] = entry
+        return entry[1].descriptor
+
+    def release_shared(self):
+        for _, pixels in self.shared.values():
+            pixels.close()
+        self.shared = {}
+
+    def submit_shared(self, img, func, *args):
+        """提交 func(共享图像, *args) 到进程池"""
+        if self.executor is None:
+            prepare_workers()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=self.mp_context
+            )
+            self.owns_executor = True
+        return self.executor.submit(run_shared, self.share(img), func, *args)
+
+    def shared_result(self, future):
+        result, cpu_time = future.result()
+        self.remote_cpu_time += cpu_time
+        return result
+
+    def encode(self, img, fmt, **params):
+        """编码并计数，用于基准测试统计编码次数"""
+        self.encodes += 1
+        return encode(img, fmt, **params)
+
+    def set_effort(self, effort, search_effort=None):
+        for name in (effort, search_effort):
+            if name is not None and name not in EFFORT_PRESETS:
+                raise ValueError(f"未知的力度预设: {name}")
+        self.effort = effort
+        self.search_effort = search_effort or effort
+
+    def encoder_params(self, fmt, final=True):
+        """当前预设下某格式的编码参数"""
+        preset = EFFORT_PRESETS[self.effort if final else self.search_effort]
+        return preset[fmt]
+
+    def compress_file(self, path):
+        """压缩单个文件，track_memory 时记录 Python 侧峰值分配（编码缓冲区等）"""
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        remote_start = self.remote_cpu_time
+
+        with open_image(path) as img:
+            compression_data = self.compress_image(img, path)
+            compression_data["width"], compression_data["height"] = img.size
+        compression_data["remote_cpu_time"] = self.remote_cpu_time - remote_start
+
+        if self.track_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            compression_data["peak_alloc_kb"] = (peak - baseline) / 1024
+        return compression_data
+
+    def compress_image(self, img, source_path):
+        """优化后的图像压缩方法"""
+        self.search_info = None
+        try:
+            compression_data = self.compress_decoded(img, source_path)
+        finally:
+            self.release_shared()
+        if self.search_info is not None and compression_data["data"] is not None:
+            compression_data["search"] = self.search_info
+        return compression_data
+
+    def compress_decoded(self, img, source_path):
+        img_format = img.format.lower() if img.format else "jpeg"
+        original_format = img_format
+        file_ext = os.path.splitext(source_path)[1].lower()
+        target_kb = self.target_size_kb
+
+        # 如果输入格式为HEIC/HEIF，转换格式处理
+        if img_format in ["heic", "heif"] or file_ext in [".heic", ".heif"]:
+            img_format = "jpeg"  # 转换为JPEG处理
+
+        # 创建压缩数据字典
+        compression_data = {
+            "method": "Direct Copy",
+            "compressed_size": os.path.getsize(source_path) / 1024,
+            "quality": None,
+            "colors": None,
+            "time": 0.0,
+            "ratio": 0.0,
+            "format": img_format,
+            "data": None,
+        }
+
+        start_time = time.time()
+
+        # 如果原始图片已经足够小，直接返回
+        original_size_kb = compression_data["compressed_size"]
+        if original_size_kb <= target_kb * 1.05:
+            compression_data["method"] = "Direct Copy (Already Small)"
+            compression_data["time"] = time.time() - start_time
+            return compression_data
+
+        def finish(buffer, method, fmt, quality=None):
+            compressed_size = buffer_kb(buffer)
+            compression_data.update(
+                {
+                    "method": method,
+                    "quality": quality,
+                    "format": fmt,
+                    "data": buffer.getbuffer(),
+                    "compressed_size": compressed_size,
+                    "ratio": 1 - compressed_size / original_size_kb,
+                    "time": time.time() - start_time,
+                }
+            )
+            return compression_data
+
+        # 根据不同格式使用不同的压缩方法
+        if img_format in ["jpeg", "jpg"]:
+            # 略超目标的JPEG先尝试无损重新打包，不解码、无画质损失
+            if (
+                original_format == "jpeg"
+                and original_size_kb <= target_kb * self.lossless_margin
+            ):
+                buffer = self.jpeg_lossless_optimize(source_path)
+                if buffer is not None and buffer_kb(buffer) <= target_kb:
+                    return finish(buffer, "Lossless JPEG (jpegtran)", "jpeg")
+
+            # 高质量模式优先尝试
+            quality = 90
+            buffer = self.encode(
+                jpeg_ready(img), "JPEG", quality=quality, **self.encoder_params("jpeg")
+            )
+
+            # 如果高质量模式已经满足需求
+            if buffer_kb(buffer) <= target_kb:
+                return finish(buffer, "High Quality JPEG", "jpeg", quality)
+
+            # 执行智能压缩（质量90已超出目标，从89开始搜索）
+            buffer, quality = self.smart_jpeg_compress(img, target_kb, high=quality - 1)
+            return finish(buffer, "Smart JPEG Compression", "jpeg", quality)
+
+        elif img_format == "png":
+            # 尝试使用高级PNG压缩
+            buffer, method, fmt = self.compress_png(img, target_kb)
+            return finish(buffer, method, fmt)
+
+        elif img_format == "webp":
+            # WebP压缩
+            buffer, quality = self.smart_webp_compress(img, target_kb)
+            return finish(buffer, "Smart WebP Compression", "webp", quality)
+
+        elif img_format == "avif" and avif_supported():
+            # AVIF压缩
+            buffer, quality = self.smart_avif_compress(img, target_kb)
+            return finish(buffer, "Smart AVIF Compression", "avif", quality)
+
+        else:
+            # 其他格式尝试转为WebP或高质量JPEG
+            try:
+                buffer, quality = self.smart_webp_compress(img, target_kb)
+                return finish(buffer, "Convert to WebP", "webp", quality)
+            except:
+                # 如果WebP转换失败，回退到JPEG压缩
+                buffer, quality = self.smart_jpeg_compress(img, target_kb)
+                return finish(
+                    buffer,
+                    f"Convert to JPEG (from {original_format})",
+                    "jpeg",
+                    quality,
+                )
+
+    def compress_variant(self, img, fmt, strict=False):
+        """把没有对应源文件的内存图像（如缩放后的变体）压缩为指定格式
+
+        返回 compression_data，字段与 compress_image 一致（不含直接复制的情况）；
+        strict 时严格使用 fmt，PNG 不转为 WebP（大小尽力而为）。
+        """
+        start_time = time.time()
+        target_kb = self.target_size_kb
+        quality = None
+        try:
+            if fmt == "jpeg":
+                buffer, quality = self.smart_jpeg_compress(img, target_kb)
+                method = "Smart JPEG Compression"
+            elif fmt == "png":
+                buffer, method, fmt = self.compress_png(
+                    img, target_kb, allow_webp=not strict
+                )
+            elif fmt == "webp":
+                buffer, quality = self.smart_webp_compress(img, target_kb)
+                method = "Smart WebP Compression"
+            elif fmt == "avif" and avif_supported():
+                buffer, quality = self.smart_avif_compress(img, target_kb)
+                method = "Smart AVIF Compression"
+            else:
+                raise ValueError(f"不支持的输出格式: {fmt}")
+        finally:
+            self.release_shared()
+
+        return {
+            "method": method,
+            "compressed_size": buffer_kb(buffer),
+            "quality": quality,
+            "colors": None,
+            "time": time.time() - start_time,
+            "format": fmt,
+            "data": buffer.getbuffer(),
+            "width": img.width,
+            "height": img.height,
+        }
+
+    def encode_qualities(self, img, fmt, qualities, final):
+        """按多个质量编码，返回缓冲区列表；大图时在共享内存上并行"""
+        params = [
+            dict(quality=quality, **self.encoder_params(fmt.lower(), final))
+            for quality in qualities
+        ]
+        if len(params) > 1 and self.parallel_for(img):
+            futures = [self.submit_shared(img, encode_bytes, fmt, p) for p in params]
+            self.encodes += len(futures)
+            return [io.BytesIO(self.shared_result(future)) for future in futures]
+        return [self.encode(img, fmt, **p) for p in params]
+
+    def quality_search(self, img, fmt, target_kb, low, high):
+        """高质量优先的查找，返回 (缓冲区, 质量)
+
+        单进程时每轮编码一个中点，即二分查找；大图并行时每轮在区间内均匀取
+        workers 个质量同时编码，轮数随进程数减少，结果与二分查找一致。
+        有质量预测时（单进程）从预测值出发按预测误差倍增步长找到区间再二分，
+        预测值已接近目标时直接采用。
+        搜索阶段使用 search_effort 编码；若与最终力度不同，找到质量后再用最终力度
+        编码一次，结果不超过目标（或不大于搜索结果）时采用。
+        """
+        width = self.workers if self.parallel_for(img) else 1
+        buffers = {}
+        top, bottom = high, low
+        encodes_before = self.encodes
+
+        def probe(qualities):
+            missing = [q for q in qualities if q not in buffers]
+            encoded = self.encode_qualities(img, fmt, missing, False)
+            buffers.update(zip(missing, encoded))
+
+        def fits(quality):
+            size = buffer_kb(buffers[quality])
+            return size < target_kb or (quality == top and size <= target_kb)
+
+        def close_enough(quality):
+            return buffer_kb(buffers[quality]) >= target_kb * (1 - self.prior_tolerance)
+
+        features = guess = None
+        if self.prior is not None:
+            features = image_features(img, target_kb)
+            if width == 1:
+                guess = self.prior.predict(fmt, features, low, high)
+
+        best_quality = None
+        if guess is None:
+            # 最高质量与第一轮探测点一起编码
+            probe([high] + spread(low, high - 1, width - 1))
+            # 如果高质量已经小于目标大小，直接采用
+            if fits(high):
+                best_quality, low = high, high + 1
+        else:
+            seed, step = guess
+            probe([seed])
+            if fits(seed):
+                best_quality, low = seed, seed + 1
+                # 向上倍增步长，直到超出目标或已足够接近
+                while low <= high and not close_enough(best_quality):
+                    quality = min(high, best_quality + step)
+                    probe([quality])
+                    if not fits(quality):
+                        high = quality - 1
+                        break
+                    best_quality, low = quality, quality + 1
+                    step *= 2
+                if close_enough(best_quality):
+                    low = high + 1
+            else:
+                high = seed - 1
+                # 向下倍增步长，直到找到满足目标的质量
+                while low <= high:
+                    quality = max(low, seed - step)
+                    probe([quality])
+                    if fits(quality):
+                        best_quality, low = quality, quality + 1
+                        break
+                    high = quality - 1
+                    step *= 2
+
+        while low <= high:
+            qualities = spread(low, high, width)
+            probe(qualities)
+            for quality in qualities:
+                if fits(quality):
+                    best_quality = quality
+                    low = quality + 1
+                else:
+                    high = quality - 1
+                    break
+
+        # 最低质量也超出目标时使用最高质量
+        found = best_quality is not None
+        censored = not found or best_quality == top
+        if not found:
+            probe([top])
+            best_quality = top
+        best_buffer = buffers[best_quality]
+
+        final = self.search_effort != self.effort
+        if final:
+            final_buffer = self.encode_qualities(img, fmt, [best_quality], True)[0]
+            final_kb = buffer_kb(final_buffer)
+            if final_kb <= target_kb or final_kb <= buffer_kb(best_buffer):
+                best_buffer = final_buffer
+
+        if features is not None:
+            # 不用预测时的二分查找：先编码最高质量，未达标时再二分整个区间
+            baseline = 1 + int(final)
+            if not found or best_quality != top:
+                baseline += int(math.log2(top - bottom + 1)) + 1
+            self.search_info = {
+                "format": fmt,
+                "features": features,
+                "predicted": guess[0] if guess else None,
+                "quality": best_quality,
+                "kb": buffer_kb(best_buffer),
+                "censored": censored,
+                "encodes": self.encodes - encodes_before,
+                "final": int(final),
+                "baseline_encodes": baseline,
+            }
+        return best_buffer, best_quality
+
+    def smart_jpeg_compress(self, img, target_kb, high=95):
+        """智能JPEG压缩，优先保留高质量，返回 (缓冲区, 质量)"""
+        return self.quality_search(jpeg_ready(img), "JPEG", target_kb, 40, high)
+
+    def jpeg_lossless_optimize(self, source_path):
+        """用 jpegtran 对原始 DCT 数据做霍夫曼优化、渐进式重排并去除元数据
+
+        不可用或失败时返回 None，由调用方回退到有损搜索
+        """
+        if not JPEGTRAN:
+            return None
+        with open(source_path, "rb") as f:
+            original = f.read()
+        try:
+            result = subprocess.run(
+                [JPEGTRAN, "-copy", "none", "-optimize", "-progressive"],
+                input=original,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        if not result.stdout:
+            return None
+        return io.BytesIO(result.stdout)
+
+    def compress_png(self, img, target_kb, allow_webp=True):
+        """高级PNG压缩方法，按阶梯依次尝试，返回 (缓冲区, 方法, 格式)
+
+        allow_webp 为假时不转为 WebP，最后一级 PNG 候选即使超出目标也返回。
+        """
+        ladder = PNG_LADDER if allow_webp else PNG_LADDER[:-1]
+        if self.parallel_for(img):
+            # 各级候选同时在共享像素上计算，仍按阶梯顺序取第一个满足目标的
+            futures = [
+                self.submit_shared(img, png_candidate_bytes, self, target_kb, step)
+                for step in ladder
+            ]
+            try:
+                for step, future in zip(ladder, futures):
+                    candidate = self.shared_result(future)
+                    if candidate is not None and (
+                        step == ladder[-1] or len(candidate[0]) / 1024 <= target_kb
+                    ):
+                        data, method, fmt = candidate
+                        return io.BytesIO(data), method, fmt
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        for step in ladder:
+            candidate = self.png_candidate(img, target_kb, step)
+            if candidate is not None and (
+                step == ladder[-1] or buffer_kb(candidate[0]) <= target_kb
+            ):
+                return candidate
+        raise RuntimeError("PNG 压缩失败")
+
+    def png_candidate(self, img, target_kb, step):
+        """PNG 压缩阶梯中的单个候选，返回 (缓冲区, 方法, 格式)
+
+        各候选相互独立，大图时由 compress_png 分给不同进程在共享像素上并行计算；
+        前几级失败时返回 None，最后的 WebP 兜底失败时抛出异常。
+        """
+        if step == "webp":
+            # 最终转为WebP
+            buffer, quality = self.smart_webp_compress(img, target_kb)
+            return buffer, f"Convert to WebP (quality={quality})", "webp"
+
+        try:
+            if step == "lossless":
+                # 尝试无损压缩
+                buffer = self.compress_png_lossless(img)
+                return buffer, "PNG Lossless (Zopfli)", "png"
+
+            # 尝试有损压缩（减少颜色）
+            colors = int(step[len("lossy") :])
+            palette_img = self.compress_png_lossy(img, colors)
+            buffer = self.encode(palette_img, "PNG", **self.encoder_params("png"))
+            return buffer, f"PNG Lossy ({colors} colors)", "png"
+        except Exception as e:
+            print(f"PNG压缩候选 {step} 失败: {e}")
+            return None
+
+    def compress_png_lossless(self, img):
+        """使用optipng进行无损PNG压缩，返回编码后的缓冲区"""
+        try:
+            # 使用系统optipng命令
+            temp_input = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+            temp_output = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+            temp_output.close()
+
+            img.save(temp_input, format="PNG")
+            temp_input.close()
+
+            try:
+                # 使用高级压缩参数
+                cmd = [
+                    "optipng",
+                    self.encoder_params("optipng"),
+                    "-quiet",
+                    "-clobber",
+                    temp_input.name,
+                    "-out",
+                    temp_output.name,
+                ]
+                subprocess.run(
+                    cmd,
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+
+                # 直接读取优化后的字节，不再解码
+                with open(temp_output.name, "rb") as f:
+                    return io.BytesIO(f.read())
+            finally:
+                # 清理临时文件
+                os.unlink(temp_input.name)
+                os.unlink(temp_output.name)
+        except:
+            # 如果optipng不可用，使用Pillow的最佳优化
+            return self.encode(img, "PNG", compress_level=9)
+
+    def compress_png_lossy(self, img, max_colors):
+        """有损PNG压缩 - 减少颜色数量"""
+        # 转换为P模式（调色板模式），透明图片使用支持alpha的量化方法
+        if img.mode in ("RGBA", "LA", "PA"):
+            return img.convert("RGBA").quantize(
+                colors=max_colors, method=Image.FASTOCTREE
+            )
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        # 转换时使用高保真方法
+        return img.quantize(colors=max_colors, method=Image.MEDIANCUT)
+
+    def smart_webp_compress(self, img, target_kb):
+        """智能WebP压缩，返回 (缓冲区, 质量)"""
+        return self.quality_search(img, "WEBP", target_kb, 40, 90)
+
+    def smart_avif_compress(self, img, target_kb):
+        """智能AVIF压缩，返回 (缓冲区, 质量)"""
+        return self.quality_search(img, "AVIF", target_kb, 30, 85)
+
+
+def benchmark_efforts(
+    paths,
+    target_size_kb,
+    configs=(
+        ("fast", "fast"),
+        ("balanced", "balanced"),
+        ("max", "max"),
+        ("fast", "max"),
+    ),
+):
+    """在样本图片上对比各力度预设的耗时和输出大小
+
+    configs 为 (search_effort, effort) 列表，返回每个组合的统计
+    """
+    results = []
+    for search_effort, effort in configs:
+        engine = CompressionEngine(
+            target_size_kb, effort=effort, search_effort=search_effort
+        )
+        total_kb = 0.0
+        start = time.perf_counter()
+        for path in paths:
+            total_kb += engine.compress_file(path)["compressed_size"]
+        results.append(
+            {
+                "search_effort": search_effort,
+                "effort": effort,
+                "images": len(paths),
+                "time": time.perf_counter() - start,
+                "total_kb": total_kb,
+                "encodes": engine.encodes,
+            }
+        )
+    return results
@@ -0,0 +1,197 @@
+import os
+import json
+from datetime import datetime
+
+from quality_prior import prior_stats
+
+
+def build_report(
+    report_data,
+    target_size_kb,
+    source_folder,
+    dest_folder,
+    duplicate_groups=(),
+    effort=None,
+    search_effort=None,
+    effort_benchmark=None,
+    batch_summary=None,
+):
+    """根据压缩结果生成 Markdown 报告"""
+    report = f"# 智能图片压缩报告\n\n"
+    report += f"**生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    report += f"**目标大小**: {target_size_kb} KB\n"
+    report += f"**源文件夹**: {source_folder}\n"
+    report += f"**目标文件夹**: {dest_folder}\n"
+    if effort:
+        report += f"**编码力度**: 搜索 {search_effort or effort} / 最终 {effort}\n"
+    report += "\n"
+
+    report += "## 统计摘要\n\n"
+
+    # 分类统计压缩方法
+    method_stats = {}
+    for item in report_data:
+        method = item.get("method", "unknown")
+        if method not in method_stats:
+            method_stats[method] = {"count": 0, "saved": 0}
+        method_stats[method]["count"] += 1
+        method_stats[method]["saved"] += item["original_size"] - item["compressed_size"]
+
+    total_saved = sum(
+        item["original_size"] - item["compressed_size"] for item in report_data
+    )
+    total_original = sum(item["original_size"] for item in report_data)
+    avg_ratio = total_saved / total_original if total_original else 0
+
+    report += f"- 总文件数: {len(report_data)}\n"
+    report += f"- 总压缩节省: {total_saved:.1f} KB\n"
+    report += f"- 平均压缩率: {avg_ratio:.1%}\n"
+    report += f"- 压缩方法分布:\n"
+
+    for method, stats in method_stats.items():
+        report += f"  - {method}: {stats['count']} 文件 (节省 {stats['saved']:.1f}KB)\n"
+
+    peaks = [
+        item["peak_alloc_kb"]
+        for item in report_data
+        if item.get("peak_alloc_kb") is not None
+    ]
+    if peaks:
+        report += (
+            f"- Python 峰值分配: 平均 {sum(peaks) / len(peaks):.1f}KB, "
+            f"最大 {max(peaks):.1f}KB（编码缓冲区等，不含像素数据）\n"
+        )
+
+    if batch_summary and batch_summary.get("elapsed"):
+        report += (
+            f"- 并行: {batch_summary['workers']} 进程, "
+            f"墙钟 {batch_summary['elapsed']:.1f}秒, "
+            f"CPU {batch_summary['cpu_time']:.1f}秒, "
+            f"并行效率 {batch_summary['efficiency']:.0%}\n"
+        )
+
+    budget = batch_summary and batch_summary.get("budget")
+    if budget:
+        report += (
+            f"- 总字节预算: {budget['used_kb']:.1f}KB / {budget['budget_kb']:.1f}KB, "
+            f"平均质量 {budget['average_quality']:.1f}, "
+            f"最低质量 {budget['min_quality']}, "
+            f"分配 {budget['rounds']} 轮, 探测编码 {budget['probe_encodes']} 次, "
+            f"最终编码 {budget['final_encodes']} 次\n"
+        )
+
+    prior = prior_stats(report_data)
+    if prior:
+        report += (
+            f"- 质量预测: {prior['images']} 张使用预测起点, "
+            f"平均误差 {prior['mean_error']:.1f}, "
+            f"平均编码 {prior['encodes']:.1f} 次（不用预测约 "
+            f"{prior['baseline_encodes']:.1f} 次）, "
+            f"首次编码即采用 {prior['first_hit']} 张\n"
+        )
+
+    if effort_benchmark:
+        report += "\n## 编码力度基准\n\n"
+        report += f"样本图片: {effort_benchmark[0]['images']} 张\n\n"
+        report += "| 预设 (搜索/最终) | 总耗时(秒) | 平均耗时(秒/图) | 总大小(KB) | 编码次数 |\n"
+        report += "|------------------|-----------|-----------------|-----------|----------|\n"
+        for row in effort_benchmark:
+            report += (
+                f"| {row['search_effort']}/{row['effort']} | {row['time']:.2f} | "
+                f"{row['time'] / row['images'] if row['images'] else 0:.2f} | "
+                f"{row['total_kb']:.1f} | {row['encodes']} |\n"
+            )
+
+    report += "\n## 文件处理详情\n\n"
+    report += "| 原文件 | 原始大小(KB) | 压缩后大小(KB) | 压缩率 | 方法 | 峰值分配(KB) | 状态 |\n"
+    report += "|--------|-------------|----------------|--------|------|--------------|------|\n"
+
+    for item in report_data:
+        # 读取失败的图片没有原始大小
+        original = item["original_size"]
+        ratio = 1 - (item["compressed_size"] / original) if original else 0.0
+        peak = item.get("peak_alloc_kb")
+        peak_text = f"{peak:.1f}" if peak is not None else "-"
+        report += (
+            f"| {os.path.basename(item['file'])} | {item['original_size']:.1f} | "
+            f"{item['compressed_size']:.1f} | {ratio:.1%} | "
+            f"{item.get('method', '')} | {peak_text} | {item['status']} |\n"
+        )
+
+    if duplicate_groups:
+        report += "\n## 重复图片分组\n\n"
+        report += "每组只压缩代表图（第一项），其余复用其压缩结果。\n\n"
+        for i, group in enumerate(duplicate_groups, 1):
+            report += f"{i}. " + " = ".join(
+                os.path.relpath(path, source_folder) for path in group
+            )
+            report += "\n"
+
+    return report
+
+
+def save_manifest(report_data, manifest_path):
+    """保存输出清单（每张图片的处理结果），先写临时文件再替换，读取方不会看到半个文件"""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    manifest = {
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "images": report_data,
+    }
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+
+def load_manifest(manifest_path):
+    """读取输出清单中的图片条目，文件不存在时返回空列表"""
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)["images"]
+
+
+def save_report(report, report_folder, name=None):
+    """保存 Markdown 报告并转换为 HTML，返回 (md路径, html路径)
+
+    name 为空时按时间戳命名；监视模式传入固定名称，每批处理后覆盖更新
+    """
+    import markdown
+
+    os.makedirs(report_folder, exist_ok=True)
+
+    name = name or f"compression_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    report_path = os.path.join(report_folder, f"{name}.md")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report)
+
+    # 转换为HTML
+    html = markdown.markdown(report, extensions=["tables"])
+    html_path = os.path.join(report_folder, f"{name}.html")
+
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(
+            f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <title>图片压缩报告</title>
+                <style>
+                    body {{ font-family: Arial, sans-serif; line-height: 1.6; max-width: 1200px; margin: 0 auto; padding: 20px; }}
+                    table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
+                    th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+                    th {{ background-color: #f2f2f2; }}
+                    .summary {{ background-color: #f8f8f8; padding: 15px; border-radius: 5px; }}
+                    .chart-container {{ width: 100%; height: 300px; }}
+                </style>
+            </head>
+            <body>
+            {html}
+            </body>
+            </html>
+            """
+        )
+
+    return report_path, html_path
@@ -1,17 +1,24 @@
 import os
+import sys
 import requests
 import json
 from concurrent.futures import ThreadPoolExecutor
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from catalog import ImageCatalog
+
+# 与压缩工具的默认源文件夹一致，图片目录中下载、压缩、上传使用同一个路径键
+DOWNLOAD_DIR = os.path.join("output", "download")
+
 
 def download_image(item):
-    tag_dir = os.path.join("output", item["tag"])
+    tag_dir = os.path.join(DOWNLOAD_DIR, item["tag"])
     os.makedirs(tag_dir, exist_ok=True)
 
     save_path = os.path.join(tag_dir, item["name"])
     if os.path.exists(save_path):
         print(f"文件已存在，跳过: {save_path}")
-        return
+        return save_path, item
 
     try:
         response = requests.get(item["url"], stream=True)
@@ -22,8 +29,10 @@ def download_image(item):
                 f.write(chunk)
 
         print(f"成功下载: {save_path}")
+        return save_path, item
     except Exception as e:
         print(f"下载失败 {item['url']}: {str(e)}")
+        return None, item
 
 
 def main():
@@ -32,8 +41,17 @@ def main():
 
     os.makedirs("output", exist_ok=True)
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        executor.map(download_image, data)
+    # 下载结果在主线程中批量写入图片目录；大小和修改时间在压缩后才写入，
+    # 否则未压缩的图片会被当作没有变化
+    with ImageCatalog("output/catalog.db") as catalog:
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            for save_path, item in executor.map(download_image, data):
+                if save_path:
+                    catalog.upsert(
+                        save_path,
+                        tag=item["tag"],
+                        source_url=item["url"],
+                    )
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 import os
-import json
 import firebase_admin
 from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
+from export_sink import JsonlChunkSink
+from firestore_serializer import firestore_default
 
 
 def main():
@@ -10,6 +11,8 @@ def main():
     collection_name = os.getenv("COLLECTION_NAME")
     output_dir = os.getenv("OUTPUT_DIR")
     config_filepath = os.getenv("FIREBASE_CONFIG")
+    compression = os.getenv("EXPORT_COMPRESSION", "gzip")
+    chunk_docs = int(os.getenv("EXPORT_CHUNK_DOCS", "10000"))
 
     if not collection_name:
         raise ValueError("COLLECTION_NAME not found in .env file")
@@ -22,46 +25,24 @@ def main():
         print(f"Firebase Credential Error: {e}")
         return
 
-    os.makedirs(output_dir, exist_ok=True)
     collection_ref = db.collection(collection_name)
     print(f"Downloading collection: {collection_name}")
 
     docs = collection_ref.stream()
 
-    success_count = 0
-    for doc in docs:
-        doc_data = doc.to_dict()
-        doc_id = doc.id
-        file_name = f"{doc_id}.json"
-        file_path = os.path.join(output_dir, file_name)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(
-                {"id": doc_id, "data": convert_firestore_types(doc_data)},
-                f,
-                ensure_ascii=False,
-                indent=2,
-            )
-
-        success_count += 1
-        print(f"✅ Document saved: {file_name}")
-
-    print(f"\nDownload completed! Total documents: {success_count}")
+    with JsonlChunkSink(
+        output_dir,
+        compression=compression,
+        chunk_docs=chunk_docs,
+        default=firestore_default,
+    ) as sink:
+        for doc in docs:
+            sink.write(doc.id, doc.to_dict())
+
+    print(f"\nDownload completed! Total documents: {sink.total_docs}")
+    print(f"Chunks written: {len(sink.index['chunks'])}")
     print(f"Documents saved to: {os.path.abspath(output_dir)}")
 
 
-def convert_firestore_types(data):
-    if isinstance(data, dict):
-        return {k: convert_firestore_types(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_firestore_types(item) for item in data]
-    elif hasattr(data, "_path"):  # DocumentReference
-        return {"__reference__": data.path}
-    elif hasattr(data, "__class__") and data.__class__.__name__ == "Timestamp":
-        return {"__timestamp__": data.isoformat()}
-    elif hasattr(data, "to_eng_string"):  # GeoPoint
-        return {"__geopoint__": f"{data.latitude},{data.longitude}"}
-    return data
-
-
 if __name__ == "__main__":
     main()
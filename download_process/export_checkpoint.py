@@ -0,0 +1,170 @@
+import os
+import json
+import time
+from datetime import datetime
+
+
+def encode_watermark(value):
+    """水位写入 JSON 的形式；支持时间、数字和字符串字段，其他类型抛出 TypeError"""
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return {"type": "value", "value": value}
+    raise TypeError(f"不支持作为增量字段的类型: {type(value).__name__}")
+
+
+def decode_watermark(stored):
+    if stored is None:
+        return None
+    if isinstance(stored, str):
+        return datetime.fromisoformat(stored)  # 旧版本只保存时间
+    if stored["type"] == "datetime":
+        return datetime.fromisoformat(stored["value"])
+    return stored["value"]
+
+
+class ExportCheckpoint:
+    """导出进度检查点
+
+    记录已落盘分块对应的游标（最后一个文档ID及其增量字段值）和增量导出的水位
+    （时间、数字或字符串字段），每次分块提交后原子写入。恢复时按游标的排序字段
+    值定位，游标文档之后被删除或修改也不影响。游标和水位同时记在分块索引中，与分块
+    一起提交；进程在两次写入之间被杀死时，恢复以分块索引为准，不会重复导出。
+    """
+
+    def __init__(self, path, collection_name):
+        self.path = path
+        self.collection_name = collection_name
+        self.state = self._load()
+        self._warned = False
+        # 最近写入文档的增量字段值（编码后），随分块记为游标的排序值
+        self._cursor_value = None
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("collection") == self.collection_name:
+                return state
+            print(f"⚠️ 检查点属于集合 {state.get('collection')}，忽略")
+        return {
+            "collection": self.collection_name,
+            "run": None,
+            "run_dir": None,
+            "cursor": None,
+            "cursor_value": None,
+            "exported": 0,
+            "completed": True,
+            "since": None,
+            "watermark": None,
+            "updated_at": None,
+        }
+
+    @property
+    def in_progress(self):
+        return not self.state["completed"]
+
+    @property
+    def cursor(self):
+        return self.state["cursor"]
+
+    @property
+    def cursor_value(self):
+        """游标文档的增量字段值；旧版本检查点没有记录时为 None"""
+        return decode_watermark(self.state.get("cursor_value"))
+
+    @property
+    def since(self):
+        """增量导出的起点（上次完成导出时的水位）"""
+        return decode_watermark(self.state["since"])
+
+    def start_run(self, run_dir, incremental):
+        """开始新的导出；已有未完成的导出时沿用其游标"""
+        if self.in_progress:
+            print(
+                f"♻️ 从检查点恢复: 已导出 {self.state['exported']} 个文档，"
+                f"游标 {self.state['cursor']}"
+            )
+            return self.state["run_dir"]
+
+        self.state.update(
+            {
+                "run": "incremental" if incremental else "full",
+                "run_dir": run_dir,
+                "cursor": None,
+                "cursor_value": None,
+                "exported": 0,
+                "completed": False,
+                "watermark": self.state["since"] if incremental else None,
+            }
+        )
+        if not incremental:
+            self.state["since"] = None
+        self._save()
+        return run_dir
+
+    def track(self, value):
+        """记录已写入分块缓冲区的文档的增量字段值：作为游标的排序值，并维护最大水位
+
+        只在文档写入成功后调用；无法比较的值只警告一次并忽略，不影响导出
+        """
+        self._cursor_value = None
+        if value is None:
+            return
+        try:
+            encoded = encode_watermark(value)
+            current = decode_watermark(self.state["watermark"])
+            newer = current is None or value > current
+        except TypeError as e:
+            if not self._warned:
+                print(f"⚠️ 增量字段值无法作为水位，已忽略: {e}")
+                self._warned = True
+            return
+        self._cursor_value = encoded
+        if newer:
+            self.state["watermark"] = encoded
+
+    def chunk_meta(self):
+        """记入分块索引项的检查点字段（JsonlChunkSink 的 chunk_meta）"""
+        return {
+            "watermark": self.state["watermark"],
+            "cursor_value": self._cursor_value,
+        }
+
+    def resume(self, chunks):
+        """按分块索引恢复游标、导出数量和水位
+
+        分块索引与分块一起原子写入，比检查点文件更新时以它为准
+        """
+        if not chunks:
+            return
+        last = chunks[-1]
+        self.state["cursor"] = last["last_id"]
+        self.state["cursor_value"] = last.get("cursor_value")
+        self.state["exported"] = sum(chunk["docs"] for chunk in chunks)
+        if "watermark" in last:
+            self.state["watermark"] = last["watermark"]
+        self._save()
+
+    def commit(self, chunk):
+        """分块落盘后推进游标"""
+        self.state["cursor"] = chunk["last_id"]
+        self.state["cursor_value"] = chunk.get("cursor_value")
+        self.state["exported"] += chunk["docs"]
+        self._save()
+
+    def complete(self):
+        """导出完成，水位成为下一次增量导出的起点"""
+        self.state["completed"] = True
+        self.state["cursor"] = None
+        self.state["cursor_value"] = None
+        if self.state["watermark"]:
+            self.state["since"] = self.state["watermark"]
+        self._save()
+
+    def _save(self):
+        self.state["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
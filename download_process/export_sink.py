@@ -0,0 +1,186 @@
+import os
+import io
+import json
+import gzip
+import time
+
+# 可选的 zstd 压缩支持
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SUFFIXES = {"none": ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class JsonlChunkSink:
+    """按块滚动写入的 NDJSON 导出器
+
+    每个文档序列化为紧凑的一行 JSON，累计到 chunk_docs 条或 chunk_bytes 字节后
+    落盘为一个分块文件（先写临时文件再 os.replace，保证分块级原子性），
+    并同步更新 index.json 索引。resume=True 时在已有索引后继续追加分块。
+    chunk_meta 返回的字段（如导出检查点的水位）记入分块的索引项，与分块一起提交。
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        compression="none",
+        chunk_docs=10000,
+        chunk_bytes=64 * 1024 * 1024,
+        log_every=1000,
+        default=None,
+        resume=False,
+        chunk_meta=None,
+    ):
+        if compression not in CHUNK_SUFFIXES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd 压缩需要安装 zstandard")
+
+        self.output_dir = output_dir
+        self.compression = compression
+        self.chunk_docs = chunk_docs
+        self.chunk_bytes = chunk_bytes
+        self.log_every = log_every
+        self.chunk_meta = chunk_meta
+        self.encoder = json.JSONEncoder(
+            ensure_ascii=False, separators=(",", ":"), default=default
+        )
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.index_path = os.path.join(output_dir, "index.json")
+        self.index = self._load_index(resume)
+
+        self._buffer = io.StringIO()
+        self._buffer_docs = 0
+        self._buffer_bytes = 0
+        self._first_id = None
+        self._last_id = None
+        self.total_docs = sum(c["docs"] for c in self.index["chunks"])
+        self._logged_docs = self.total_docs
+        self._start_time = time.time()
+
+    def _load_index(self, resume):
+        if resume and os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"format": "jsonl", "compression": self.compression, "chunks": []}
+
+    def write(self, doc_id, data, auto_flush=True):
+        """写入一个文档，达到阈值时自动落盘当前分块并返回其索引项
+
+        auto_flush=False 时只写入缓冲区，调用方更新 chunk_meta 的状态后再调用
+        flush_if_full；序列化失败时抛出异常，缓冲区不变。
+        """
+        line = self.encoder.encode({"id": doc_id, "data": data})
+        self._buffer.write(line)
+        self._buffer.write("\n")
+        self._buffer_docs += 1
+        self._buffer_bytes += len(line) + 1
+        if self._first_id is None:
+            self._first_id = doc_id
+        self._last_id = doc_id
+        self.total_docs += 1
+
+        if self.total_docs - self._logged_docs >= self.log_every:
+            self._log_progress()
+
+        return self.flush_if_full() if auto_flush else None
+
+    def flush_if_full(self):
+        """缓冲区达到阈值时落盘，返回分块索引项，否则返回 None"""
+        if (
+            self._buffer_docs >= self.chunk_docs
+            or self._buffer_bytes >= self.chunk_bytes
+        ):
+            return self.flush()
+        return None
+
+    def flush(self):
+        """把缓冲区写成一个完整分块并更新索引"""
+        if not self._buffer_docs:
+            return None
+
+        chunk_no = len(self.index["chunks"])
+        chunk_name = f"part-{chunk_no:05d}{CHUNK_SUFFIXES[self.compression]}"
+        chunk_path = os.path.join(self.output_dir, chunk_name)
+
+        payload = self._buffer.getvalue().encode("utf-8")
+        if self.compression == "gzip":
+            payload = gzip.compress(payload, compresslevel=6)
+        elif self.compression == "zstd":
+            payload = zstandard.ZstdCompressor(level=3).compress(payload)
+
+        # 原子写入分块
+        temp_path = f"{chunk_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(payload)
+        os.replace(temp_path, chunk_path)
+
+        chunk = {
+            "file": chunk_name,
+            "docs": self._buffer_docs,
+            "bytes": len(payload),
+            "first_id": self._first_id,
+            "last_id": self._last_id,
+        }
+        if self.chunk_meta:
+            chunk.update(self.chunk_meta())
+        self.index["chunks"].append(chunk)
+        self._write_index()
+
+        self._buffer = io.StringIO()
+        self._buffer_docs = 0
+        self._buffer_bytes = 0
+        self._first_id = None
+        self._last_id = None
+        return chunk
+
+    def _write_index(self):
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def _log_progress(self):
+        elapsed = time.time() - self._start_time
+        rate = (self.total_docs - self._logged_docs) / elapsed if elapsed else 0
+        print(
+            f"✅ 已写入 {self.total_docs} 个文档 | "
+            f"{len(self.index['chunks'])} 个分块 | {rate:.0f} 文档/秒"
+        )
+        self._logged_docs = self.total_docs
+        self._start_time = time.time()
+
+    def close(self):
+        chunk = self.flush()
+        self._log_progress()
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 异常时也落盘已缓冲的完整文档
+        self.close()
+        return False
+
+
+def iter_documents(output_dir):
+    """按索引顺序读取导出的所有文档"""
+    with open(os.path.join(output_dir, "index.json"), "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    for chunk in index["chunks"]:
+        path = os.path.join(output_dir, chunk["file"])
+        with open(path, "rb") as f:
+            payload = f.read()
+        if path.endswith(".gz"):
+            payload = gzip.decompress(payload)
+        elif path.endswith(".zst"):
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        for line in payload.decode("utf-8").splitlines():
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,180 @@
+import json
+import time
+from datetime import datetime
+
+# Firestore 类型（未安装时退化为按类名识别）
+try:
+    from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+except ImportError:
+    DocumentReference = None
+    GeoPoint = None
+
+
+def _reference(value):
+    return {"__reference__": value.path}
+
+
+def _timestamp(value):
+    return {"__timestamp__": value.isoformat()}
+
+
+def _geopoint(value):
+    return {"__geopoint__": f"{value.latitude},{value.longitude}"}
+
+
+# 按精确类型分发的转换表；JSON 原生类型映射为 None 表示无需转换
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+_CONVERTERS = {t: None for t in _PLAIN_TYPES}
+_CONVERTERS[datetime] = _timestamp
+if DocumentReference is not None:
+    _CONVERTERS[DocumentReference] = _reference
+    _CONVERTERS[GeoPoint] = _geopoint
+
+
+def _resolve_converter(value):
+    """首次遇到未知类型时按原有规则识别
+
+    鸭子类型检查的是实例（_path、latitude 等属性通常在实例上赋值，类上没有）；
+    只有按类即可确定的结果才缓存到转换表，同类的其他实例直接查表。
+    """
+    cls = type(value)
+    if hasattr(value, "_path") or cls.__name__ == "DocumentReference":
+        converter = _reference
+        cacheable = hasattr(cls, "_path") or cls.__name__ == "DocumentReference"
+    elif cls.__name__ in ("Timestamp", "DatetimeWithNanoseconds") or issubclass(
+        cls, datetime
+    ):
+        converter, cacheable = _timestamp, True
+    elif hasattr(value, "latitude") and hasattr(value, "longitude"):
+        converter = _geopoint
+        cacheable = hasattr(cls, "latitude") and hasattr(cls, "longitude")
+    else:
+        # 同类的其他实例可能带有这些属性，不缓存
+        converter, cacheable = None, False
+    if cacheable:
+        _CONVERTERS[cls] = converter
+    return converter
+
+
+def firestore_default(value):
+    """json 编码器的 default 钩子：只在遇到非 JSON 原生类型时被调用"""
+    cls = type(value)
+    try:
+        converter = _CONVERTERS[cls]
+    except KeyError:
+        converter = _resolve_converter(value)
+    if converter is None:
+        raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+    return converter(value)
+
+
+def convert_firestore_types(data):
+    """递归转换 Firestore 特殊类型，不含特殊类型的子树原样返回（不复制）"""
+    cls = type(data)
+    if cls is dict:
+        converted = None
+        for key, value in data.items():
+            new_value = convert_firestore_types(value)
+            if new_value is not value:
+                if converted is None:
+                    converted = dict(data)
+                converted[key] = new_value
+        return data if converted is None else converted
+    if cls is list:
+        converted = None
+        for i, item in enumerate(data):
+            new_item = convert_firestore_types(item)
+            if new_item is not item:
+                if converted is None:
+                    converted = list(data)
+                converted[i] = new_item
+        return data if converted is None else converted
+
+    try:
+        converter = _CONVERTERS[cls]
+    except KeyError:
+        converter = _resolve_converter(data)
+    return data if converter is None else converter(data)
+
+
+def make_object_hook(db=None):
+    """生成 json.loads 的 object_hook，把导出的特殊标记还原为 Firestore 类型
+
+    传入 db 时引用还原为 DocumentReference，否则保留文档路径字符串；
+    未安装 Firestore 时地理坐标还原为 (latitude, longitude) 元组。
+    """
+
+    def object_hook(obj):
+        if len(obj) != 1:
+            return obj
+        if "__timestamp__" in obj:
+            return datetime.fromisoformat(obj["__timestamp__"])
+        if "__reference__" in obj:
+            path = obj["__reference__"]
+            return db.document(path) if db is not None else path
+        if "__geopoint__" in obj:
+            latitude, longitude = (float(x) for x in obj["__geopoint__"].split(","))
+            if GeoPoint is not None:
+                return GeoPoint(latitude, longitude)
+            return (latitude, longitude)
+        return obj
+
+    return object_hook
+
+
+def loads(text, db=None):
+    """解析一行导出的 JSON 并还原特殊类型"""
+    return json.loads(text, object_hook=make_object_hook(db))
+
+
+def _legacy_convert(data):
+    # 旧实现的检查链，仅供 benchmark 对比；普通 datetime 也按时间戳处理
+    if isinstance(data, dict):
+        return {k: _legacy_convert(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [_legacy_convert(item) for item in data]
+    elif hasattr(data, "_path"):
+        return {"__reference__": data.path}
+    elif hasattr(data, "__class__") and data.__class__.__name__ == "Timestamp":
+        return {"__timestamp__": data.isoformat()}
+    elif hasattr(data, "to_eng_string"):
+        return {"__geopoint__": f"{data.latitude},{data.longitude}"}
+    elif isinstance(data, datetime):
+        return {"__timestamp__": data.isoformat()}
+    return data
+
+
+def benchmark(docs=2000, depth=6, width=4):
+    """对比旧的预遍历转换与 default 钩子的序列化耗时"""
+
+    def build(level):
+        if level == 0:
+            return {"name": "图片", "size": 1024, "ratio": 0.5, "ok": True}
+        return {
+            "items": [build(level - 1) for _ in range(width)],
+            "createdAt": datetime(2024, 1, 1, 12, 0, 0),
+        }
+
+    doc = build(depth // 2)
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    fast_encoder = json.JSONEncoder(
+        ensure_ascii=False, separators=(",", ":"), default=firestore_default
+    )
+
+    start = time.perf_counter()
+    for _ in range(docs):
+        encoder.encode(_legacy_convert(doc))
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(docs):
+        fast_encoder.encode(doc)
+    fast = time.perf_counter() - start
+
+    print(f"旧版预遍历: {legacy:.3f}s | default 钩子: {fast:.3f}s")
+    print(f"加速比: {legacy / fast:.2f}x")
+    return legacy, fast
+
+
+if __name__ == "__main__":
+    benchmark()
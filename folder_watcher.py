@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+
+# 有 watchdog 时使用系统文件事件（Linux inotify / macOS FSEvents / Windows），否则轮询
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# 下载工具常用的临时文件后缀，重命名为正式文件名后才处理
+TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", ".download")
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.dest_path)
+
+
+class FolderWatcher:
+    """监视文件夹中新增或修改的图片
+
+    文件大小和修改时间连续 settle_seconds 不变后才交出，避免处理写了一半的文件。
+    """
+
+    def __init__(self, folder, extensions, settle_seconds=2.0, poll_interval=1.0):
+        self.folder = folder
+        self.extensions = tuple(extensions)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        # path -> (大小, 修改时间, 开始稳定的时间)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.snapshot = {}
+        self.observer = None
+
+    @property
+    def mode(self):
+        return "events" if self.observer is not None else "polling"
+
+    def is_image(self, path):
+        name = path.lower()
+        return name.endswith(self.extensions) and not name.endswith(TEMP_SUFFIXES)
+
+    def notice(self, path):
+        """记录一个可能有变化的文件，稳定后交出"""
+        if self.is_image(path):
+            with self.lock:
+                self.pending.setdefault(path, None)
+
+    def scan(self):
+        """轮询模式：对比大小和修改时间找出新增或修改的文件"""
+        current = {}
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if not self.is_image(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                current[path] = (stat.st_size, stat.st_mtime)
+        for path, signature in current.items():
+            if self.snapshot.get(path) != signature:
+                self.notice(path)
+        self.snapshot = current
+
+    def take_ready(self):
+        """取出已稳定的文件"""
+        now = time.time()
+        ready = []
+        with self.lock:
+            for path, state in list(self.pending.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # 文件已被删除或改名
+                    del self.pending[path]
+                    continue
+                signature = (stat.st_size, stat.st_mtime)
+                if state is None or state[:2] != signature:
+                    self.pending[path] = signature + (now,)
+                elif stat.st_size and now - state[2] >= self.settle_seconds:
+                    ready.append(path)
+                    del self.pending[path]
+        return sorted(ready)
+
+    def start(self):
+        if Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), self.folder, recursive=True)
+            self.observer.start()
+        else:
+            # 记录当前状态，已有文件由调用方单独处理
+            self.scan()
+            with self.lock:
+                self.pending.clear()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def batches(self, idle=False):
+        """start() 之后持续产出已稳定的新文件列表，直到被中断
+
+        idle 为真时没有新文件也每轮产出空列表，调用方可借此处理定时任务。
+        """
+        while True:
+            time.sleep(self.poll_interval)
+            if self.observer is None:
+                self.scan()
+            ready = self.take_ready()
+            if ready or idle:
+                yield ready
@@ -0,0 +1,153 @@
+import os
+import queue
+import tkinter as tk
+from tkinter import ttk
+
+
+class ImageBrowser:
+    """虚拟化的缩略图网格
+
+    只为可见的行创建画布元素和 PhotoImage，滚动时回收移出视野的；
+    缩略图从 ThumbnailCache 读取，缺失的交给后台生成，完成后补上。
+    """
+
+    def __init__(self, master, cache, files, on_select, title="图片浏览"):
+        self.cache = cache
+        self.files = files
+        self.on_select = on_select
+        self.index_of = {os.path.abspath(path): i for i, path in enumerate(files)}
+        # 每格：缩略图加一行文件名
+        self.cell = cache.size + 30
+        self.columns = 0
+        self.items = {}  # 序号 -> (图片元素, 文字元素)
+        self.photos = {}  # 序号 -> PhotoImage，移出视野后释放
+        self.ready = queue.Queue()
+        self.closed = False
+
+        self.window = tk.Toplevel(master)
+        self.window.title(f"{title} ({len(files)} 张)")
+        self.window.geometry("900x700")
+        self.canvas = tk.Canvas(
+            self.window,
+            background="#F0F0F0",
+            highlightthickness=0,
+            yscrollincrement=self.cell // 3,
+        )
+        scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.scroll)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", self.layout)
+        self.canvas.bind("<Button-1>", self.on_click)
+        # Windows/macOS 使用 MouseWheel，X11 使用 Button-4/5
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll("scroll", 1, "units"))
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.window.after(50, self.poll)
+
+    def layout(self, event=None):
+        """窗口宽度变化时重新计算列数"""
+        columns = max(1, self.canvas.winfo_width() // self.cell)
+        if columns != self.columns:
+            self.columns = columns
+            self.canvas.delete("all")
+            self.items.clear()
+            self.photos.clear()
+            rows = -(-len(self.files) // columns)
+            self.canvas.configure(
+                scrollregion=(0, 0, columns * self.cell, rows * self.cell)
+            )
+        self.refresh()
+
+    def scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def on_wheel(self, event):
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+    def visible_range(self):
+        top = int(self.canvas.canvasy(0))
+        bottom = top + self.canvas.winfo_height()
+        first = top // self.cell * self.columns
+        last = min(len(self.files), (bottom // self.cell + 1) * self.columns)
+        return first, last
+
+    def refresh(self):
+        """为可见的格子创建元素，回收不可见的，缺失的缩略图交给后台生成"""
+        if not self.columns:
+            return
+        first, last = self.visible_range()
+        for index in list(self.items):
+            if not first <= index < last:
+                for item in self.items.pop(index):
+                    self.canvas.delete(item)
+                self.photos.pop(index, None)
+
+        missing = []
+        for index in range(first, last):
+            if index in self.items:
+                continue
+            path = self.files[index]
+            x = index % self.columns * self.cell + self.cell // 2
+            y = index // self.columns * self.cell
+            image_item = self.canvas.create_image(
+                x, y + self.cache.size // 2 + 4, anchor=tk.CENTER
+            )
+            text_item = self.canvas.create_text(
+                x,
+                y + self.cache.size + 16,
+                text=os.path.basename(path),
+                width=self.cell - 8,
+                font=("Arial", 9),
+            )
+            self.items[index] = (image_item, text_item)
+            thumb = self.cache.get(path)
+            if thumb is not None:
+                self.show_thumb(index, thumb)
+            else:
+                missing.append(path)
+
+        # 可见的优先，其次预取下一屏；新的请求替换上一次未完成的
+        ahead = self.files[last : last + (last - first)]
+        self.cache.request(missing + ahead, self.on_ready)
+
+    def show_thumb(self, index, thumb):
+        from PIL import ImageTk
+
+        photo = ImageTk.PhotoImage(thumb)
+        self.photos[index] = photo
+        self.canvas.itemconfigure(self.items[index][0], image=photo)
+
+    def on_ready(self, path, thumb):
+        # 后台线程回调，交给主线程处理
+        self.ready.put((path, thumb))
+
+    def poll(self):
+        if self.closed:
+            return
+        while True:
+            try:
+                path, thumb = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            index = self.index_of.get(path)
+            if thumb is not None and index in self.items:
+                self.show_thumb(index, thumb)
+        self.window.after(50, self.poll)
+
+    def on_click(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        column = int(x // self.cell)
+        index = int(y // self.cell) * self.columns + column
+        if column < self.columns and 0 <= index < len(self.files):
+            self.on_select(self.files[index])
+
+    def close(self):
+        self.closed = True
+        self.cache.request([], self.on_ready)
+        self.cache.flush()
+        self.window.destroy()
@@ -0,0 +1,174 @@
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from compression_engine import open_image
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+
+@functools.cache
+def _dct_matrix(n):
+    """DCT-II 变换矩阵，pHash 用矩阵乘法完成二维 DCT"""
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _bits_to_int(bits):
+    import numpy as np
+
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def load_gray_thumbnail(path, size=PHASH_SIZE):
+    """读取灰度缩略图，JPEG 使用 draft 模式只解码缩小后的像素"""
+    # numpy 只在计算哈希时导入，不拖慢界面启动
+    import numpy as np
+
+    with open_image(path) as img:
+        img.draft("L", (size * 4, size * 4))
+        gray = img.convert("L")
+        return np.asarray(gray.resize((size, size), Image.LANCZOS), dtype=np.float32)
+
+
+def dhash(gray):
+    """差异哈希：比较相邻像素亮度"""
+    import numpy as np
+
+    img = Image.fromarray(gray.astype(np.uint8))
+    small = np.asarray(
+        img.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16
+    )
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    """感知哈希：低频 DCT 系数与中位数比较"""
+    import numpy as np
+
+    dct = _dct_matrix(PHASH_SIZE)
+    coeffs = dct @ gray @ dct.T
+    low = coeffs[:HASH_SIZE, :HASH_SIZE].ravel()
+    median = np.median(low[1:])  # 排除直流分量
+    return _bits_to_int(low > median)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def image_hashes(path):
+    gray = load_gray_thumbnail(path)
+    return phash(gray), dhash(gray)
+
+
+# 带透明通道的模式；调色板和灰度/RGB 图像的透明色记在 info["transparency"] 中
+ALPHA_MODES = ("RGBA", "RGBa", "LA", "La", "PA")
+
+
+def has_alpha(path):
+    """只读取文件头，判断图片是否带透明信息"""
+    try:
+        with open_image(path) as img:
+            return img.mode in ALPHA_MODES or "transparency" in img.info
+    except Exception:
+        return False
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树，用于近似重复查找"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, key, value):
+        node = self.root
+        if node is None:
+            self.root = [key, value, {}]
+            return
+        while True:
+            distance = hamming(key, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                return
+            node = child
+
+    def search(self, key, radius):
+        """返回距离不超过 radius 的 (距离, value) 列表"""
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                results.append((distance, node[1]))
+            for d, child in node[2].items():
+                if distance - radius <= d <= distance + radius:
+                    stack.append(child)
+        return results
+
+
+def compute_hashes(paths, max_workers=8):
+    """并行计算 (phash, dhash)，返回 (hashes, errors)"""
+    hashes = {}
+    errors = {}
+
+    def compute(path):
+        try:
+            return path, image_hashes(path), None
+        except Exception as e:
+            return path, None, e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path, value, error in executor.map(compute, paths):
+            if error is None:
+                hashes[path] = value
+            else:
+                errors[path] = error
+    return hashes, errors
+
+
+def group_duplicates(hashes, phash_radius=4, dhash_radius=6):
+    """把 {path: (phash, dhash)} 分成近似重复的组
+
+    只在相同扩展名的文件之间匹配，这样重复项可以直接复用代表图的压缩结果。
+    哈希只看灰度，透明信息另外比较：带透明和不带透明的图片不会分到一组，
+    避免把透明原图当作其不透明副本的重复项。
+    每组的代表图是文件最大的那张（通常质量最高）。
+    返回 [代表图, 重复图...] 列表，只包含有重复的组。
+    """
+    # 大文件优先成为代表图
+    ordered = sorted(hashes, key=lambda p: os.path.getsize(p), reverse=True)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        alpha = dict(zip(ordered, executor.map(has_alpha, ordered)))
+    trees = {}
+    groups = {}
+    for path in ordered:
+        p_hash, d_hash = hashes[path]
+        ext = os.path.splitext(path)[1].lower()
+        tree = trees.setdefault((ext, alpha[path]), BKTree())
+
+        representative = None
+        for distance, candidate in sorted(tree.search(p_hash, phash_radius)):
+            if hamming(d_hash, hashes[candidate][1]) <= dhash_radius:
+                representative = candidate
+                break
+
+        if representative is None:
+            tree.add(p_hash, path)
+            groups[path] = [path]
+        else:
+            groups[representative].append(path)
+
+    return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from compression_engine import open_image
+
+DEFAULT_PROBE_INDEX = "output/probe.db"
+
+# EXIF 方向标签
+ORIENTATION_TAG = 0x0112
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    file_size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    mode TEXT,
+    orientation INTEGER,
+    has_icc INTEGER
+);
+"""
+
+FIELDS = ("width", "height", "format", "mode", "orientation", "has_icc")
+
+
+def orientation_of(img):
+    """从文件头中的 EXIF 读取方向；不调用 getexif()，PNG 等格式会因此解码像素"""
+    exif = img.info.get("exif")
+    if exif:
+        data = Image.Exif()
+        data.load(exif)
+        return data.get(ORIENTATION_TAG, 1)
+    tags = getattr(img, "tag_v2", None)  # TIFF 的标签在文件头中
+    if tags is not None:
+        return tags.get(ORIENTATION_TAG, 1)
+    return 1
+
+
+def probe_image(path):
+    """只读取文件头：尺寸、格式、模式、EXIF 方向、是否带 ICC 配置"""
+    stat = os.stat(path)
+    with open_image(path) as img:
+        return {
+            "mtime_ns": stat.st_mtime_ns,
+            "file_size": stat.st_size,
+            "width": img.width,
+            "height": img.height,
+            "format": (img.format or "").lower(),
+            "mode": img.mode,
+            "orientation": orientation_of(img),
+            "has_icc": bool(img.info.get("icc_profile")),
+        }
+
+
+class ProbeIndex:
+    """图片文件头信息的持久索引
+
+    以 (路径, 修改时间, 文件大小) 为键缓存 probe_image 的结果，文件变更后自动
+    重新读取；未缓存的文件用线程池并行读取文件头，结果在一个事务中写入。
+    无法识别的文件不缓存，结果中为 None。
+    """
+
+    def __init__(self, path=DEFAULT_PROBE_INDEX, workers=8):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.workers = workers
+        # 界面在后台线程中使用，连接由锁保护
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def cached(self, paths):
+        """未变更文件的缓存结果 {路径: 信息}"""
+        rows = {}
+        with self.lock:
+            # 分批查询，避免超出 SQLite 参数上限
+            for i in range(0, len(paths), 500):
+                part = paths[i : i + 500]
+                query = (
+                    "SELECT * FROM probes "
+                    f"WHERE path IN ({', '.join('?' * len(part))})"
+                )
+                for row in self.conn.execute(query, part):
+                    rows[row["path"]] = dict(row)
+
+        result = {}
+        for path, row in rows.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (row["mtime_ns"], row["file_size"]) == (stat.st_mtime_ns, stat.st_size):
+                row["has_icc"] = bool(row["has_icc"])
+                del row["path"]
+                result[path] = row
+        return result
+
+    def probe_all(self, paths):
+        """返回 {路径: 信息或 None}，缺失的并行读取文件头并写入索引"""
+        paths = list(paths)
+        result = self.cached(paths)
+        missing = [path for path in paths if path not in result]
+        if not missing:
+            return result
+
+        def safe_probe(path):
+            try:
+                return probe_image(path)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            probed = dict(zip(missing, pool.map(safe_probe, missing)))
+        rows = [
+            (path, info["mtime_ns"], info["file_size"], *(info[f] for f in FIELDS))
+            for path, info in probed.items()
+            if info is not None
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO probes VALUES ({', '.join('?' * 9)})", rows
+            )
+        result.update(probed)
+        return result
+
+    def probe(self, path):
+        return self.probe_all([path])[path]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
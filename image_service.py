@@ -0,0 +1,504 @@
+import os
+import argparse
+import hashlib
+import json
+import math
+import mimetypes
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from PIL import Image
+
+from compression_engine import (
+    EFFORT_PRESETS,
+    FORMAT_EXTENSIONS,
+    CompressionEngine,
+    avif_supported,
+    open_image,
+)
+
+CONTENT_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+# 缩放后的变体没有源文件，按源格式选择输出格式（HEIC 等转为 JPEG，其余转为 WebP）
+VARIANT_FORMATS = {"jpeg": "jpeg", "png": "png", "webp": "webp", "avif": "avif"}
+
+# 最低质量仍超出目标时缩小重压的次数，以及允许缩小到的最小宽度
+MAX_DOWNSCALE = 6
+MIN_VARIANT_WIDTH = 32
+
+
+class VariantTooLarge(ValueError):
+    """缩小到最小宽度仍无法满足目标大小"""
+
+
+def resized(img, width):
+    """按宽度等比缩小，调色板等模式先转为 RGB(A)"""
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.LANCZOS)
+
+
+class VariantCache:
+    """两级变体缓存：内存 LRU（按字节数限制）+ 磁盘缓存（超出上限时删除最久未用的）"""
+
+    def __init__(self, cache_dir, max_memory_bytes, max_disk_bytes):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        # key -> (数据, 格式)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # key -> (磁盘路径, 大小)，启动时按修改时间恢复使用顺序
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.load_disk_index()
+
+    def load_disk_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, os.path.splitext(name)[0], path, stat))
+        for _, key, path, stat in sorted(entries):
+            self.disk[key] = (path, stat.st_size)
+            self.disk_bytes += stat.st_size
+
+    def get(self, key):
+        """返回 (数据, 格式, 层级) 或 None；磁盘命中的结果提升到内存"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                return entry + ("memory",)
+            disk_entry = self.disk.get(key)
+            if disk_entry is not None:
+                self.disk.move_to_end(key)
+
+        if disk_entry is None:
+            return None
+        path, _ = disk_entry
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self.forget_disk(key)
+            return None
+        # 更新修改时间，重启后仍保持使用顺序
+        os.utime(path)
+        fmt = os.path.splitext(path)[1][1:]
+        self.put_memory(key, data, fmt)
+        return data, fmt, "disk"
+
+    def put(self, key, data, fmt):
+        self.put_memory(key, data, fmt)
+
+        path = os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.forget_disk(key)
+            self.disk[key] = (path, len(data))
+            self.disk_bytes += len(data)
+            evicted = []
+            while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                old_key, (old_path, size) = self.disk.popitem(last=False)
+                self.disk_bytes -= size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.unlink(old_path)
+            except OSError:
+                pass
+
+    def put_memory(self, key, data, fmt):
+        # 单个变体超过内存上限时只放磁盘
+        if len(data) > self.max_memory_bytes:
+            return
+        with self.lock:
+            old = self.memory.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= len(old[0])
+            self.memory[key] = (data, fmt)
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (old_data, _) = self.memory.popitem(last=False)
+                self.memory_bytes -= len(old_data)
+
+    def forget_disk(self, key):
+        entry = self.disk.pop(key, None)
+        if entry is not None:
+            self.disk_bytes -= entry[1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "memory_entries": len(self.memory),
+                "memory_mb": self.memory_bytes / 1024 / 1024,
+                "disk_entries": len(self.disk),
+                "disk_mb": self.disk_bytes / 1024 / 1024,
+            }
+
+
+class ServiceMetrics:
+    """命中率和延迟统计，延迟保留最近 window 个请求"""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.counts = {
+            "requests": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "not_modified": 0,
+            "errors": 0,
+        }
+        self.latencies = deque(maxlen=window)
+        self.compress_times = deque(maxlen=window)
+
+    def record(self, status, latency):
+        key = {
+            "memory": "memory_hits",
+            "disk": "disk_hits",
+            "miss": "misses",
+            "coalesced": "coalesced",
+            "not_modified": "not_modified",
+        }.get(status, "errors")
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts[key] += 1
+            self.latencies.append(latency)
+
+    def record_compress(self, seconds):
+        with self.lock:
+            self.compress_times.append(seconds)
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {}
+        values = sorted(values)
+        result = {"mean_ms": sum(values) / len(values) * 1000}
+        for p in (50, 95, 99):
+            index = min(len(values) - 1, len(values) * p // 100)
+            result[f"p{p}_ms"] = values[index] * 1000
+        return result
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+            latencies = list(self.latencies)
+            compress_times = list(self.compress_times)
+        served = counts["requests"] - counts["errors"]
+        hits = counts["memory_hits"] + counts["disk_hits"] + counts["not_modified"]
+        counts["hit_rate"] = hits / served if served else 0.0
+        counts["latency"] = self.percentiles(latencies)
+        counts["compress"] = self.percentiles(compress_times)
+        return counts
+
+
+class ImageService:
+    """按需生成压缩变体：同一变体的并发请求只压缩一次，结果进入两级缓存"""
+
+    def __init__(
+        self,
+        source_folder,
+        cache_dir,
+        target_size_kb=200,
+        effort="max",
+        search_effort=None,
+        max_memory_mb=256,
+        max_disk_mb=2048,
+        max_concurrent=None,
+    ):
+        self.source_folder = os.path.realpath(source_folder)
+        self.target_size_kb = target_size_kb
+        self.effort = effort
+        self.search_effort = search_effort
+        self.cache = VariantCache(
+            cache_dir, max_memory_mb * 1024 * 1024, max_disk_mb * 1024 * 1024
+        )
+        self.metrics = ServiceMetrics()
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        # 限制同时压缩的数量，其余请求排队
+        self.compress_slots = threading.BoundedSemaphore(
+            max_concurrent or os.cpu_count() or 1
+        )
+
+    def resolve(self, rel_path):
+        """源文件路径，禁止访问源文件夹以外的文件"""
+        path = os.path.realpath(os.path.join(self.source_folder, rel_path))
+        if not path.startswith(self.source_folder + os.sep) or not os.path.isfile(path):
+            raise FileNotFoundError(rel_path)
+        return path
+
+    def variant_key(self, path, kb, width, fmt):
+        # 源文件的大小和修改时间参与键计算，源图更新后旧变体自然失效
+        stat = os.stat(path)
+        raw = (
+            f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{kb}|{width}|{fmt}|"
+            f"{self.effort}|{self.search_effort}"
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get_variant(self, rel_path, kb=None, width=None, fmt=None):
+        """返回 (数据, 内容类型, 键, 缓存状态)"""
+        if kb is None:
+            kb = self.target_size_kb
+        if kb <= 0 or (width is not None and width <= 0):
+            raise ValueError("kb 和 w 必须为正数")
+        if fmt == "auto":
+            fmt = None
+        if fmt is not None and fmt not in CONTENT_TYPES:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+
+        path = self.resolve(rel_path)
+        key = self.variant_key(path, kb, width, fmt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            data, stored_fmt, tier = cached
+            return data, self.content_type(stored_fmt), key, tier
+
+        # 同一变体只有第一个请求负责压缩，其他请求等待它的结果
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.inflight[key] = future
+
+        if not owner:
+            data, stored_fmt = future.result()
+            return data, self.content_type(stored_fmt), key, "coalesced"
+
+        try:
+            with self.compress_slots:
+                start = time.perf_counter()
+                data, stored_fmt = self.compress(path, kb, width, fmt)
+                self.metrics.record_compress(time.perf_counter() - start)
+            self.cache.put(key, data, stored_fmt)
+            future.set_result((data, stored_fmt))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+        return data, self.content_type(stored_fmt), key, "miss"
+
+    def compress(self, path, kb, width, fmt):
+        """压缩一个变体，返回 (数据, 格式)；格式为源文件扩展名时表示原样返回
+
+        结果不超过 kb：最低质量仍超出时按比例缩小重压，缩到最小宽度仍超出时
+        抛出 VariantTooLarge。指定了 fmt 时只输出该格式，只有自动选择格式时
+        PNG 才可能转为 WebP。
+        """
+        engine = CompressionEngine(
+            kb, effort=self.effort, search_effort=self.search_effort
+        )
+        with open_image(path) as img:
+            source_fmt = (img.format or "").lower()
+            resize = width is not None and width < img.width
+            # PNG 阶梯最后会转为 WebP，指定 PNG 时走严格的变体流程
+            if not resize and (fmt is None or (fmt == source_fmt and fmt != "png")):
+                # 原尺寸、原格式：与批量压缩相同的流程（含 jpegtran 无损、PNG 阶梯）
+                compression_data = engine.compress_image(img, path)
+            else:
+                variant = resized(img, width) if resize else img
+                out_fmt = fmt or VARIANT_FORMATS.get(source_fmt)
+                if out_fmt is None:
+                    out_fmt = "jpeg" if source_fmt in ("heic", "heif") else "webp"
+                if out_fmt == "avif" and not avif_supported():
+                    if fmt:
+                        raise ValueError("当前环境不支持 AVIF 编码")
+                    out_fmt = "webp"
+                compression_data = engine.compress_variant(
+                    variant, out_fmt, strict=fmt is not None
+                )
+
+            if compression_data["data"] is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+                stored_fmt = os.path.splitext(path)[1][1:].lower()
+            else:
+                data = bytes(compression_data["data"])
+                stored_fmt = compression_data["format"]
+            if len(data) <= kb * 1024:
+                return data, stored_fmt
+
+            out_fmt = fmt or VARIANT_FORMATS.get(source_fmt, "webp")
+            if out_fmt == "avif" and not avif_supported():
+                out_fmt = "webp"
+            current = min(width or img.width, img.width)
+            return self.downscale(
+                engine, img, out_fmt, kb, current, len(data), strict=fmt is not None
+            )
+
+    def downscale(self, engine, img, fmt, kb, width, size, strict=False):
+        """按面积与目标大小之比缩小后重压，直到不超过 kb"""
+        for _ in range(MAX_DOWNSCALE):
+            # 大小约与像素数成正比，多缩 5% 留余量
+            width = int(width * min(0.9, math.sqrt(kb * 1024 / size) * 0.95))
+            if width < MIN_VARIANT_WIDTH:
+                break
+            compression_data = engine.compress_variant(resized(img, width), fmt, strict)
+            size = len(compression_data["data"])
+            if size <= kb * 1024:
+                return bytes(compression_data["data"]), compression_data["format"]
+        raise VariantTooLarge(f"无法以 {fmt} 格式压缩到 {kb}KB 以内")
+
+    @staticmethod
+    def content_type(fmt):
+        for name, extensions in FORMAT_EXTENSIONS.items():
+            if f".{fmt}" in extensions:
+                return CONTENT_TYPES[name]
+        return (
+            CONTENT_TYPES.get(fmt)
+            or mimetypes.guess_type(f"x.{fmt}")[0]
+            or "application/octet-stream"
+        )
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """GET /image/<相对路径>?kb=200&w=1200&format=webp，GET /metrics"""
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            metrics = self.service.metrics.snapshot()
+            metrics["cache"] = self.service.cache.stats()
+            body = json.dumps(metrics, ensure_ascii=False, indent=2).encode("utf-8")
+            return self.send_body(200, body, "application/json; charset=utf-8")
+        if not url.path.startswith("/image/"):
+            return self.send_error(404)
+
+        start = time.perf_counter()
+        try:
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            kb = int(query["kb"]) if query.get("kb") else None
+            width = int(query["w"]) if query.get("w") else None
+            data, content_type, key, status = self.service.get_variant(
+                unquote(url.path[len("/image/") :]), kb, width, query.get("format")
+            )
+        except FileNotFoundError:
+            self.service.metrics.record("error", time.perf_counter() - start)
+            return self.send_error(404)
+        except VariantTooLarge as e:
+            self.service.metrics.record("error", time.perf_counter() - start)
+            return self.send_error(422, explain=str(e))
+        except ValueError as e:
+            self.service.metrics.record("error", time.perf_counter() - start)
+            return self.send_error(400, explain=str(e))
+        except Exception as e:
+            self.service.metrics.record("error", time.perf_counter() - start)
+            return self.send_error(500, explain=str(e))
+
+        etag = f'"{key}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.service.metrics.record("not_modified", time.perf_counter() - start)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        latency = time.perf_counter() - start
+        self.service.metrics.record(status, latency)
+        self.send_body(
+            200,
+            data,
+            content_type,
+            {
+                "ETag": etag,
+                "Cache-Control": "public, max-age=3600",
+                "X-Cache": status.upper(),
+                "Server-Timing": f"total;dur={latency * 1000:.1f}",
+            },
+        )
+
+    def send_body(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 访问日志太多，只保留错误
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="按需图片压缩服务（本地）")
+    parser.add_argument("--source", default="output/download", help="图片文件夹")
+    parser.add_argument(
+        "--cache-dir", default="output/variant_cache", help="磁盘变体缓存目录"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--target-kb", type=int, default=200, help="默认目标大小")
+    parser.add_argument(
+        "--effort", choices=list(EFFORT_PRESETS), default="max", help="最终编码力度"
+    )
+    parser.add_argument(
+        "--search-effort",
+        choices=list(EFFORT_PRESETS),
+        default="fast",
+        help="质量搜索时的编码力度",
+    )
+    parser.add_argument("--memory-mb", type=int, default=256, help="内存缓存上限")
+    parser.add_argument("--disk-mb", type=int, default=2048, help="磁盘缓存上限")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ServiceHandler.service = ImageService(
+        args.source,
+        args.cache_dir,
+        target_size_kb=args.target_kb,
+        effort=args.effort,
+        search_effort=args.search_effort,
+        max_memory_mb=args.memory_mb,
+        max_disk_mb=args.disk_mb,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    print(
+        f"🚀 图片服务已启动: http://{args.host}:{args.port}/image/<路径>?kb=200&w=1200"
+    )
+    print(f"📊 指标: http://{args.host}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("服务已停止")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
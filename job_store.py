@@ -0,0 +1,258 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    cost REAL NOT NULL DEFAULT 0,
+    duplicate_of TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    destination TEXT,
+    result TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, cost);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def default_worker_id():
+    """主机名加进程号，多台机器上的多个进程互不重复"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobStore:
+    """放在共享存储上的分片任务库（SQLite）
+
+    任务以相对源文件夹的路径为键，各机器可以挂载在不同位置。工作进程领取任务时
+    获得租约，定期心跳续约；进程崩溃后租约过期，任务被其他进程重新领取，
+    超过 max_attempts 次标记为失败。重复图片在代表图完成后才能领取。
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 自动提交模式，事务由 transaction() 显式开启
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        # 共享存储（NFS/SMB）上 WAL 不可靠，使用默认的回滚日志
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE：开始即取得写锁，避免两个进程领取同一任务
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def enqueue(self, jobs):
+        """加入任务 [(相对路径, 代价, 代表图相对路径或 None)]，已有任务保持不变
+
+        返回新增数量；有新任务时清除汇总标记，完成后重新汇总
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (path, cost, duplicate_of, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(path, cost, duplicate_of, now) for path, cost, duplicate_of in jobs],
+            )
+            added = conn.total_changes - before
+            if added:
+                conn.execute("DELETE FROM meta WHERE key = 'finalized'")
+        return added
+
+    def claim(self, worker_id, limit=1):
+        """领取最多 limit 个任务（代价高的优先），返回任务字典列表
+
+        可领取：待处理的任务、租约已过期的任务；重复图片要等代表图结束
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            rows = conn.execute(
+                "SELECT j.path, j.duplicate_of, j.attempts, "
+                "r.state AS rep_state, r.destination AS rep_destination "
+                "FROM jobs j LEFT JOIN jobs r ON r.path = j.duplicate_of "
+                "WHERE (j.state = 'pending' "
+                "OR (j.state = 'leased' AND j.lease_until < ?)) "
+                "AND (j.duplicate_of IS NULL OR r.state IN ('done', 'failed')) "
+                "ORDER BY j.duplicate_of IS NOT NULL, j.cost DESC LIMIT ?",
+                (now, limit),
+            ).fetchall()
+
+            claimed = []
+            for row in rows:
+                if row["attempts"] >= self.max_attempts:
+                    # 多次领取都未完成（进程反复崩溃），不再重试
+                    conn.execute(
+                        "UPDATE jobs SET state = 'failed', worker = NULL, "
+                        "lease_until = NULL, error = ?, updated_at = ? WHERE path = ?",
+                        (f"租约过期 {row['attempts']} 次", now, row["path"]),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE path = ?",
+                    (worker_id, now + self.lease_seconds, now, row["path"]),
+                )
+                claimed.append(dict(row))
+        return claimed
+
+    def heartbeat(self, worker_id):
+        """为该进程持有的所有任务续约，返回续约数量"""
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE worker = ? AND state = 'leased'",
+            (now + self.lease_seconds, worker_id),
+        )
+        return cursor.rowcount
+
+    def complete(self, path, worker_id, item, destination):
+        """记录完成结果；destination 为相对输出文件夹的路径，供重复图片复用
+
+        只有仍持有租约的进程能提交；租约已过期并被其他进程领取时返回 False
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = 'done', lease_until = NULL, "
+            "destination = ?, result = ?, error = NULL, updated_at = ? "
+            "WHERE path = ? AND worker = ? AND state = 'leased'",
+            (destination, json.dumps(item), time.time(), path, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, path, worker_id, error):
+        """处理异常：未超过重试次数时放回队列；租约已失去时不改动，返回 False"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' "
+            "ELSE 'pending' END, worker = NULL, lease_until = NULL, error = ?, "
+            "updated_at = ? WHERE path = ? AND worker = ? AND state = 'leased'",
+            (self.max_attempts, str(error), time.time(), path, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, worker_id):
+        """进程正常退出（如被取消）时归还未完成的任务"""
+        self.conn.execute(
+            "UPDATE jobs SET state = 'pending', worker = NULL, lease_until = NULL, "
+            "attempts = attempts - 1 WHERE worker = ? AND state = 'leased'",
+            (worker_id,),
+        )
+
+    def counts(self):
+        """各状态的任务数量"""
+        return {
+            row["state"]: row["n"]
+            for row in self.conn.execute(
+                "SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"
+            )
+        }
+
+    def remaining(self):
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def results(self):
+        """已完成任务 [(相对路径, 相对输出路径, 报告条目)]，按路径排序"""
+        return [
+            (row["path"], row["destination"], json.loads(row["result"]))
+            for row in self.conn.execute(
+                "SELECT path, destination, result FROM jobs "
+                "WHERE state = 'done' ORDER BY path"
+            )
+        ]
+
+    def failures(self):
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                "SELECT path, attempts, error FROM jobs WHERE state = 'failed'"
+            )
+        ]
+
+    def duplicate_groups(self):
+        """[(代表图, 重复图...)] 相对路径"""
+        groups = {}
+        for row in self.conn.execute(
+            "SELECT path, duplicate_of FROM jobs "
+            "WHERE duplicate_of IS NOT NULL ORDER BY path"
+        ):
+            groups.setdefault(row["duplicate_of"], []).append(row["path"])
+        return [[rep] + dups for rep, dups in sorted(groups.items())]
+
+    def finalize_once(self):
+        """全部完成后只有一个进程能拿到汇总权（写清单、报告），返回是否拿到"""
+        if self.remaining():
+            return False
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('finalized', ?)",
+            (str(time.time()),),
+        )
+        return cursor.rowcount == 1
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class LeaseHeartbeat:
+    """后台线程定期续约；使用独立的数据库连接"""
+
+    def __init__(self, path, worker_id, lease_seconds=300):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        store = JobStore(self.path, self.lease_seconds)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                try:
+                    store.heartbeat(self.worker_id)
+                except sqlite3.OperationalError as e:
+                    # 共享存储短暂不可用时下次再试，租约留有余量
+                    print(f"⚠️ 心跳续约失败: {e}")
+        finally:
+            store.close()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,166 @@
+import json
+import math
+import os
+
+from PIL import Image
+
+DEFAULT_PRIOR = "output/quality_prior.json"
+
+# 每种格式至少积累这么多条有效记录才开始预测；超过上限时丢弃最旧的
+MIN_SAMPLES = 20
+MAX_SAMPLES = 5000
+
+
+def image_features(img, target_kb):
+    """预测质量用的特征，复杂度在约 64 像素宽的缩略图上计算
+
+    [常数项, log(目标每像素比特数), log(像素数), 平均梯度, 亮度标准差, 是否灰度]
+    """
+    import numpy as np
+
+    pixels = img.width * img.height
+    scale = max(1, max(img.size) // 64)
+    small = img.resize(
+        (max(1, img.width // scale), max(1, img.height // scale)), Image.BOX
+    )
+    gray = np.asarray(small.convert("L"), dtype=np.float32) / 255
+    gradient = 0.0
+    if gray.shape[1] > 1:
+        gradient += float(np.abs(np.diff(gray, axis=1)).mean())
+    if gray.shape[0] > 1:
+        gradient += float(np.abs(np.diff(gray, axis=0)).mean())
+    return [
+        1.0,
+        math.log(target_kb * 8192 / pixels),
+        math.log(pixels),
+        gradient,
+        float(gray.std()),
+        1.0 if img.mode in ("L", "LA") else 0.0,
+    ]
+
+
+class QualityPrior:
+    """根据历史压缩结果预测起始质量
+
+    每种格式（JPEG/WEBP/AVIF）分别用最小二乘拟合 特征 -> 最终质量 的线性模型，
+    残差标准差作为搜索的初始步长。最高质量就已达标、或最低质量仍超标的记录
+    只知道边界（删失），不参与拟合。每张源图片只保留最近一次的记录，
+    重复处理同一批图片不会让它们在拟合中占更大比重。
+    """
+
+    def __init__(self, path=DEFAULT_PRIOR):
+        self.path = path
+        # 格式 -> {源图片: {"features", "quality", "kb", "censored", "mtime_ns"}}，
+        # 按写入先后排列，超出上限时丢弃最旧的
+        self.samples = {}
+        # 格式 -> (系数, 残差标准差)；首次预测时才拟合，不拖慢启动
+        self.models = None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                samples = json.load(f).get("samples", {})
+            # 旧版本按列表保存，没有源图片路径，给每条一个独立的键
+            self.samples = {
+                fmt: (
+                    rows
+                    if isinstance(rows, dict)
+                    else {f"#{i}": row for i, row in enumerate(rows)}
+                )
+                for fmt, rows in samples.items()
+            }
+
+    def __getstate__(self):
+        # 工作进程只需要模型，不传递全部样本
+        if self.models is None:
+            self.fit()
+        state = self.__dict__.copy()
+        state["samples"] = {}
+        return state
+
+    def fit(self):
+        import numpy as np
+
+        self.models = {}
+        for fmt, rows in self.samples.items():
+            rows = [row for row in rows.values() if not row["censored"]]
+            if len(rows) < MIN_SAMPLES:
+                continue
+            x = np.array([row["features"] for row in rows])
+            y = np.array([row["quality"] for row in rows], dtype=float)
+            coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+            residual = float(np.sqrt(np.mean((x @ coefficients - y) ** 2)))
+            self.models[fmt] = (coefficients.tolist(), residual)
+
+    def predict(self, fmt, features, low, high):
+        """返回 (预测质量, 步长)；样本不足时返回 None"""
+        if self.models is None:
+            self.fit()
+        model = self.models.get(fmt)
+        if model is None:
+            return None
+        coefficients, residual = model
+        quality = sum(c * v for c, v in zip(coefficients, features))
+        quality = min(high, max(low, round(quality)))
+        return quality, max(2, math.ceil(residual))
+
+    def observe(self, search, path):
+        """记录 path 的质量搜索结果（compression_data["search"]），替换它之前的记录"""
+        key = os.path.abspath(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        # 输出格式可能变化，先从所有格式中移除
+        for rows in self.samples.values():
+            rows.pop(key, None)
+        rows = self.samples.setdefault(search["format"], {})
+        rows[key] = {
+            "features": search["features"],
+            "quality": search["quality"],
+            "kb": search["kb"],
+            "censored": search["censored"],
+            "mtime_ns": mtime_ns,
+        }
+        while len(rows) > MAX_SAMPLES:
+            del rows[next(iter(rows))]
+
+    def update(self, report_data):
+        """从批量压缩的报告条目中收集记录并重新拟合，返回新增条数"""
+        added = 0
+        for item in report_data:
+            search = item.get("search")
+            if search and item.get("status") == "success":
+                self.observe(search, item["file"])
+                added += 1
+        if added:
+            self.fit()
+        return added
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"samples": self.samples}, f)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+
+def prior_stats(report_data):
+    """汇总报告条目中的预测效果：误差、编码次数与不用预测时的估计"""
+    searches = [
+        item["search"]
+        for item in report_data
+        if item.get("search") and item["search"].get("predicted") is not None
+    ]
+    if not searches:
+        return None
+    count = len(searches)
+    # 删失的记录只知道边界，不计入误差
+    exact = [s for s in searches if not s["censored"]] or searches
+    return {
+        "images": count,
+        "mean_error": sum(abs(s["predicted"] - s["quality"]) for s in exact)
+        / len(exact),
+        "encodes": sum(s["encodes"] for s in searches) / count,
+        "baseline_encodes": sum(s["baseline_encodes"] for s in searches) / count,
+        "first_hit": sum(1 for s in searches if s["encodes"] <= 1 + s["final"]),
+    }
@@ -0,0 +1,61 @@
+import os
+from collections import namedtuple
+
+from image_probe import probe_image
+
+# 相对编码代价（每百万像素）：PNG 可能走完整个压缩阶梯，WebP method=6 较慢
+FORMAT_COST = {
+    "png": 4.0,
+    "webp": 2.5,
+    "avif": 3.0,
+    "heic": 1.5,
+    "heif": 1.5,
+    "jpeg": 1.0,
+}
+
+Job = namedtuple("Job", ["path", "cost", "format", "split"])
+
+
+def estimate_cost(path, target_kb, info=None):
+    """估算单张图片的处理代价，只用文件头信息（ProbeIndex 的结果），不解码像素
+
+    未传入 info 时现读文件头；返回 (代价, 格式)，已足够小、只需复制的图片代价接近 0
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        # 文件已被删除或无法访问，压缩时按失败处理
+        return 0.0, None
+    if size / 1024 <= target_kb * 1.05:
+        return size / 1e9, None
+    if info is None:
+        try:
+            info = probe_image(path)
+        except Exception:
+            return size / 1e6, None
+    megapixels = info["width"] * info["height"] / 1e6
+    fmt = info["format"]
+    return megapixels * FORMAT_COST.get(fmt, 2.0) + size / 1e6, fmt
+
+
+def schedule(paths, target_kb, workers, probes=None):
+    """按代价从高到低排序（最长任务优先），并标记需要拆分的超大图片
+
+    单张图片的代价超过每个进程的平均份额时，把它的质量探测和 PNG 阶梯候选
+    拆成独立的编码任务分给空闲进程，避免一张图拖住整个批次。
+    probes 为 ProbeIndex 的结果 {路径: 文件头信息}，缺失的现读文件头。
+    """
+    probes = probes or {}
+    jobs = []
+    for path in paths:
+        cost, fmt = estimate_cost(path, target_kb, probes.get(path))
+        jobs.append((path, cost, fmt))
+
+    total_cost = sum(cost for _, cost, _ in jobs)
+    fair_share = total_cost / max(workers, 1)
+    scheduled = [
+        Job(path, cost, fmt, workers > 1 and fmt is not None and cost > fair_share)
+        for path, cost, fmt in jobs
+    ]
+    scheduled.sort(key=lambda job: job.cost, reverse=True)
+    return scheduled
@@ -0,0 +1,79 @@
+import os
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image
+
+# 工作进程重建图像所需的全部信息；像素本身留在共享内存中，不经过 pickle
+SharedDescriptor = namedtuple(
+    "SharedDescriptor", ["name", "mode", "size", "info", "palette"]
+)
+
+
+def prepare_workers():
+    """创建进程池前调用：先启动资源跟踪进程，fork 出的工作进程共用它
+
+    否则每个工作进程附加共享内存时各自启动跟踪进程，退出时误报泄漏并重复删除
+    """
+    if os.name == "posix":
+        resource_tracker.ensure_running()
+
+
+class SharedPixels:
+    """把解码后的像素放入共享内存，供多个工作进程同时编码
+
+    由创建方负责 close()，关闭后共享内存段被删除。
+    """
+
+    def __init__(self, img):
+        data = img.tobytes()
+        self.shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self.shm.buf[: len(data)] = data
+        del data
+
+        palette = None
+        if img.mode in ("P", "PA"):
+            palette = (img.palette.mode, img.palette.tobytes())
+        self.descriptor = SharedDescriptor(
+            self.shm.name, img.mode, img.size, dict(img.info), palette
+        )
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def open_shared(descriptor, buffer):
+    """按描述符把共享缓冲区映射为图像（L/RGBA 等模式不复制像素）"""
+    img = Image.frombuffer(
+        descriptor.mode, descriptor.size, buffer, "raw", descriptor.mode, 0, 1
+    )
+    if descriptor.palette:
+        rawmode, palette = descriptor.palette
+        img.putpalette(palette, rawmode)
+    img.info.update(descriptor.info)
+    return img
+
+
+def call_with_image(descriptor, buffer, func, args):
+    img = open_shared(descriptor, buffer)
+    return func(img, *args)
+
+
+def run_shared(descriptor, func, *args):
+    """在工作进程中映射共享像素并调用 func(img, *args)
+
+    返回 (结果, CPU 时间)，CPU 时间用于统计并行效率
+    """
+    cpu_start = time.process_time()
+    shm = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        result = call_with_image(descriptor, shm.buf, func, args)
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # 异常回溯仍引用着图像时无法解除映射，随进程回收
+            pass
+    return result, time.process_time() - cpu_start
@@ -1,10 +1,14 @@
 import os
-import json
 import time
+from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 from google.api_core import exceptions, retry
 from dotenv import load_dotenv
+from download_process.export_sink import JsonlChunkSink
+from download_process.firestore_serializer import firestore_default
+from download_process.export_checkpoint import ExportCheckpoint
 
 
 def main():
@@ -13,6 +17,9 @@ def main():
     collection_name = os.getenv("COLLECTION_NAME")
     output_dir = os.getenv("OUTPUT_DIR", "downloaded_data")
     config_filepath = os.getenv("FIREBASE_CONFIG")
+    compression = os.getenv("EXPORT_COMPRESSION", "gzip")
+    # 例如 updatedAt / createdAt；设置后只导出上次导出后变更的文档
+    incremental_field = os.getenv("EXPORT_INCREMENTAL_FIELD")
 
     # 初始化 Firebase
     try:
@@ -27,7 +34,7 @@ def main():
     test_connection(db, collection_name)
 
     # 分批下载
-    download_collection(db, collection_name, output_dir)
+    download_collection(db, collection_name, output_dir, compression, incremental_field)
 
 
 def test_connection(db, collection_name):
@@ -52,10 +59,38 @@ def test_connection(db, collection_name):
     return False
 
 
-def download_collection(db, collection_name, output_dir):
-    """分批下载集合数据"""
+def download_collection(
+    db, collection_name, output_dir, compression="gzip", incremental_field=None
+):
+    """分批下载集合数据（支持断点续传和增量导出）"""
     print(f"\n📂 开始下载集合: {collection_name}")
     os.makedirs(output_dir, exist_ok=True)
+    checkpoint = ExportCheckpoint(
+        os.path.join(output_dir, "checkpoint.json"), collection_name
+    )
+
+    # 增量模式: 只导出上次完成后有变更的文档，写入独立的子目录
+    since = checkpoint.since if incremental_field else None
+    if since:
+        run_dir = os.path.join(
+            output_dir, "increments", datetime.now().strftime("%Y%m%d_%H%M%S")
+        )
+        print(f"🔁 增量导出: {incremental_field} > {since}")
+    else:
+        run_dir = output_dir
+    resuming = checkpoint.in_progress
+    run_dir = checkpoint.start_run(run_dir, incremental=bool(incremental_field))
+
+    sink = JsonlChunkSink(
+        run_dir,
+        compression=compression,
+        default=firestore_default,
+        resume=resuming,
+        chunk_meta=checkpoint.chunk_meta,
+    )
+    if resuming:
+        # 分块索引与分块一起提交，比检查点文件可靠
+        checkpoint.resume(sink.index["chunks"])
 
     # 自定义重试策略
     custom_retry = retry.Retry(
@@ -67,78 +102,114 @@ def download_collection(db, collection_name, output_dir):
         ),
     )
 
+    # 从检查点游标恢复：按排序字段的值定位，不重新读取游标文档
+    # （它可能已被删除，或增量字段已被修改）
     last_doc = None
+    if checkpoint.cursor:
+        last_doc = {"__name__": checkpoint.cursor}
+        if since:
+            cursor_value = checkpoint.cursor_value
+            if cursor_value is None:
+                # 旧版本检查点没有记录排序值，只能读取游标文档
+                last_doc = (
+                    db.collection(collection_name).document(checkpoint.cursor).get()
+                )
+            else:
+                last_doc = {incremental_field: cursor_value, **last_doc}
+
     batch_size = 50
     total_count = 0
+    batch_no = 0
+    failures = 0
+    max_failures = 5
     start_time = time.time()
 
-    while True:
-        try:
-            # 构建分页查询
-            query = db.collection(collection_name)
-            query = query.order_by("__name__").limit(batch_size)
-            if last_doc:
-                query = query.start_after(last_doc)
-
-            # 执行查询（带重试）
-            docs = list(query.stream(retry=custom_retry))
-
-            if not docs:
-                break  # 没有更多数据
-
-            # 处理当前批次
-            batch_start = time.time()
-            for doc in docs:
-                try:
-                    save_document(doc, output_dir)
-                    total_count += 1
-                    last_doc = doc
-                except Exception as e:
-                    print(f"⚠️ 文档 {doc.id} 保存失败: {type(e).__name__}: {str(e)}")
-
-            # 打印批次信息
-            batch_time = time.time() - batch_start
-            print(f"🔄 已处理 {total_count} 个文档 | 本批次耗时: {batch_time:.2f}s")
-
-        except Exception as e:
-            print(f"⚠️ 批次查询失败: {type(e).__name__}: {str(e)}")
-            time.sleep(5)  # 等待后重试
-            continue
+    try:
+        while True:
+            try:
+                # 构建分页查询
+                query = db.collection(collection_name)
+                if since:
+                    query = query.where(
+                        filter=FieldFilter(incremental_field, ">", since)
+                    )
+                    query = query.order_by(incremental_field)
+                query = query.order_by("__name__").limit(batch_size)
+                if last_doc:
+                    query = query.start_after(last_doc)
+
+                # 执行查询（带重试）
+                docs = list(query.stream(retry=custom_retry))
+                failures = 0
+
+                if not docs:
+                    break  # 没有更多数据
+
+                # 处理当前批次
+                batch_start = time.time()
+                for doc in docs:
+                    try:
+                        save_document(doc, sink)
+                        # 写入成功后才记水位，之后落盘的分块索引中的水位包含本文档
+                        if incremental_field:
+                            checkpoint.track(field_value(doc, incremental_field))
+                        chunk = sink.flush_if_full()
+                        if chunk:
+                            checkpoint.commit(chunk)
+                        total_count += 1
+                        last_doc = doc
+                    except Exception as e:
+                        print(f"⚠️ 文档 {doc.id} 保存失败: {type(e).__name__}: {str(e)}")
+
+                # 每 20 个批次打印一次进度，避免控制台输出成为瓶颈
+                batch_no += 1
+                if batch_no % 20 == 0:
+                    batch_time = time.time() - batch_start
+                    print(
+                        f"🔄 已处理 {total_count} 个文档 | 本批次耗时: {batch_time:.2f}s"
+                    )
+
+            except Exception as e:
+                failures += 1
+                print(
+                    f"⚠️ 批次查询失败 ({failures}/{max_failures}): "
+                    f"{type(e).__name__}: {str(e)}"
+                )
+                if failures >= max_failures:
+                    # 已缓冲的文档在 finally 中落盘，重新运行时从检查点继续
+                    print(f"❌ 重试次数耗尽，进度已保存到 {checkpoint.path}")
+                    raise
+                time.sleep(min(5 * 2 ** (failures - 1), 60))  # 指数退避后重试
+                continue
+    finally:
+        # 任何方式退出（包括异常和 Ctrl+C）都落盘已缓冲的文档并提交到检查点
+        chunk = sink.close()
+        if chunk:
+            checkpoint.commit(chunk)
+    checkpoint.complete()
 
     # 最终报告
     total_time = time.time() - start_time
     print(f"\n🎉 下载完成! 共 {total_count} 个文档 | 总耗时: {total_time:.2f}s")
-    print(f"文件保存在: {os.path.abspath(output_dir)}")
-
-
-def save_document(doc, output_dir):
-    """安全保存单个文档"""
-    doc_data = {"id": doc.id, "data": convert_firestore_types(doc.to_dict())}
+    print(
+        f"文件保存在: {os.path.abspath(run_dir)} ({len(sink.index['chunks'])} 个分块)"
+    )
 
-    file_path = os.path.join(output_dir, f"{doc.id}.json")
 
-    # 原子写入（避免写入不完整文件）
-    temp_path = f"{file_path}.tmp"
-    with open(temp_path, "w", encoding="utf-8") as f:
-        json.dump(doc_data, f, ensure_ascii=False, indent=2)
+def field_value(doc, field):
+    """读取文档字段，缺失时返回 None"""
+    try:
+        return doc.get(field)
+    except KeyError:
+        return None
 
-    os.replace(temp_path, file_path)
-    print(f"✅ 保存: {doc.id}")
 
+def save_document(doc, sink):
+    """写入单个文档到分块导出的缓冲区（特殊类型由编码器的 default 钩子转换）
 
-def convert_firestore_types(data):
-    """递归转换 Firestore 特殊类型"""
-    if isinstance(data, dict):
-        return {k: convert_firestore_types(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_firestore_types(item) for item in data]
-    elif hasattr(data, "_path"):  # DocumentReference
-        return {"__reference__": data.path}
-    elif hasattr(data, "__class__") and data.__class__.__name__ == "Timestamp":
-        return {"__timestamp__": data.isoformat()}
-    elif hasattr(data, "to_eng_string"):  # GeoPoint
-        return {"__geopoint__": f"{data.latitude},{data.longitude}"}
-    return data
+    不自动落盘，调用方记录水位后调用 sink.flush_if_full()
+    """
+    sink.write(doc.id, doc.to_dict(), auto_flush=False)
 
 
 if __name__ == "__main__":
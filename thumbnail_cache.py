@@ -0,0 +1,219 @@
+import io
+import os
+import sqlite3
+import threading
+from collections import deque
+
+from PIL import Image
+
+from compression_engine import open_image
+
+DEFAULT_THUMBNAILS = "output/thumbnails"
+THUMB_SIZE = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    file_size INTEGER,
+    pack INTEGER,
+    offset INTEGER,
+    length INTEGER
+);
+"""
+
+
+class ThumbnailCache:
+    """持久化的缩略图缓存
+
+    缩略图以 (路径, 修改时间, 文件大小) 为键，编码后追加写入少数几个大的
+    pack 文件，位置记录在 SQLite 索引中；文件变更后键不匹配，自动重新生成。
+    request() 把待生成的路径交给后台线程，新的请求替换旧的（只生成当前可见的）。
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_THUMBNAILS,
+        size=THUMB_SIZE,
+        max_pack_mb=256,
+        workers=2,
+        batch_size=64,
+    ):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_pack_bytes = max_pack_mb * 1024 * 1024
+        self.batch_size = batch_size
+        # 索引和 pack 文件由多个线程共用，读写都在锁内进行
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"), check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._uncommitted = 0
+        self.readers = {}
+        pack = self.conn.execute("SELECT MAX(pack) FROM thumbs").fetchone()[0]
+        self.pack = pack or 0
+        self.writer = open(self.pack_path(self.pack), "ab")
+
+        # 后台生成：待处理队列与回调
+        self.queue = deque()
+        self.on_ready = None
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def pack_path(self, pack):
+        return os.path.join(self.cache_dir, f"pack-{pack:04d}.bin")
+
+    @staticmethod
+    def signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def lookup(self, path):
+        """缓存有效时返回 (pack, 偏移, 长度)，否则 None；调用方持有锁"""
+        try:
+            signature = self.signature(path)
+        except OSError:
+            return None
+        row = self.conn.execute(
+            "SELECT mtime_ns, file_size, pack, offset, length FROM thumbs "
+            "WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None or row[:2] != signature:
+            return None
+        return row[2:]
+
+    def contains(self, path):
+        with self.lock:
+            return self.lookup(os.path.abspath(path)) is not None
+
+    def get(self, path):
+        """读取缓存的缩略图；不存在或原图已变更时返回 None"""
+        with self.lock:
+            location = self.lookup(os.path.abspath(path))
+            if location is None:
+                return None
+            pack, offset, length = location
+            data = self._read(pack, offset, length)
+        if len(data) != length:
+            return None  # pack 文件被截断，重新生成
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    def _read(self, pack, offset, length):
+        if pack == self.pack:
+            # 当前 pack 的写入缓冲区先落盘
+            self.writer.flush()
+        reader = self.readers.get(pack)
+        if reader is None:
+            reader = self.readers[pack] = open(self.pack_path(pack), "rb")
+        reader.seek(offset)
+        return reader.read(length)
+
+    def generate(self, path):
+        """生成并保存缩略图，返回缩略图"""
+        path = os.path.abspath(path)
+        signature = self.signature(path)
+        with open_image(path) as img:
+            # draft 模式：JPEG 直接按缩小比例解码，不解码全尺寸像素
+            img.draft("RGB", (self.size, self.size))
+            img.thumbnail((self.size, self.size))
+            alpha = "A" in img.getbands() or "transparency" in img.info
+            thumb = img.convert("RGBA" if alpha else "RGB")
+
+        buffer = io.BytesIO()
+        if thumb.mode == "RGBA":
+            thumb.save(buffer, "PNG")
+        else:
+            thumb.save(buffer, "JPEG", quality=85)
+        self.store(path, signature, buffer.getvalue())
+        return thumb
+
+    def store(self, path, signature, data):
+        with self.lock:
+            if (
+                self.writer.tell()
+                and self.writer.tell() + len(data) > self.max_pack_bytes
+            ):
+                self.writer.close()
+                self.pack += 1
+                self.writer = open(self.pack_path(self.pack), "ab")
+            offset = self.writer.tell()
+            self.writer.write(data)
+            # 原图变更后旧数据留在 pack 中成为垃圾，索引只指向最新的
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?)",
+                (path, *signature, self.pack, offset, len(data)),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.batch_size:
+                self._commit()
+
+    def _commit(self):
+        # 先把数据写入 pack，再提交指向它的索引
+        self.writer.flush()
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def request(self, paths, on_ready):
+        """后台生成缺失的缩略图，替换之前未开始的请求
+
+        生成后在后台线程调用 on_ready(路径, 缩略图或 None)
+        """
+        with self.lock:
+            self.on_ready = on_ready
+            self.queue = deque(os.path.abspath(path) for path in paths)
+            self.wakeup.notify_all()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                path = self.queue.popleft()
+                on_ready = self.on_ready
+            # 已缓存的（预取范围内）无需处理，可见的由调用方直接读取
+            if self.contains(path):
+                continue
+            thumb = None
+            try:
+                thumb = self.generate(path)
+            except Exception as e:
+                print(f"⚠️ 无法生成缩略图 {path}: {e}")
+            on_ready(path, thumb)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            self._commit()
+            self.writer.close()
+            for reader in self.readers.values():
+                reader.close()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,338 @@
+import functools
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+
+from PIL import Image
+
+from compression_engine import CompressionEngine, open_image
+
+# 扫描件常见的未压缩格式，可以按行条流式读取（仅限未压缩的单块像素数据；
+# LZW/Deflate TIFF、JPEG、PNG 在 Pillow 中无法按区域解码，仍整张解码）
+SCAN_FORMATS = (".tif", ".tiff", ".bmp", ".ppm", ".pgm")
+
+# 瓦片扩展名，与 Deep Zoom（.dzi）的 Format 属性一致
+TILE_EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'Format="{format}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+    '  <Size Width="{width}" Height="{height}"/>\n'
+    "</Image>\n"
+)
+
+
+@contextmanager
+def trusted_pixels():
+    """作品扫描件是可信来源，临时关闭 Pillow 的超大图片（解压炸弹）检查"""
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def raw_layout(img):
+    """未压缩的单块像素数据（TIFF/PPM/BMP 等）返回 (偏移, 行字节数, rawmode, 方向)
+
+    其他格式返回 None，只能整张解码
+    """
+    if len(img.tile) != 1:
+        return None
+    tile = img.tile[0]
+    if tile[0] != "raw" or tuple(tile[1]) != (0, 0) + img.size:
+        return None
+    args = (tile[3],) if isinstance(tile[3], str) else tuple(tile[3])
+    rawmode, stride, orientation = (args + (0, 1))[:3]
+    if not stride:
+        if rawmode != img.mode:
+            return None  # 无法可靠推算行字节数
+        stride = len(Image.new(img.mode, (img.width, 1)).tobytes())
+    if tile[2] + stride * img.height > os.path.getsize(img.filename):
+        return None
+    return tile[2], stride, rawmode, orientation
+
+
+def read_strips(path, strip_rows):
+    """按行条产出源图 (行条, 是否最后一条)
+
+    未压缩格式每次只从文件读取一条，内存只占一条；其他格式整张解码一次后切条。
+    """
+    with trusted_pixels(), open_image(path) as img:
+        width, height = img.size
+        layout = raw_layout(img)
+        palette = img.getpalette() if img.mode == "P" else None
+        if layout is None:
+            img.load()
+            for top in range(0, height, strip_rows):
+                bottom = min(height, top + strip_rows)
+                yield img.crop((0, top, width, bottom)), bottom == height
+            return
+
+        offset, stride, rawmode, orientation = layout
+        with open(path, "rb") as f:
+            for top in range(0, height, strip_rows):
+                bottom = min(height, top + strip_rows)
+                # 自下而上存储（BMP）时文件中的行顺序相反
+                first = top if orientation > 0 else height - bottom
+                f.seek(offset + first * stride)
+                data = f.read(stride * (bottom - top))
+                strip = Image.frombytes(
+                    img.mode,
+                    (width, bottom - top),
+                    data,
+                    "raw",
+                    rawmode,
+                    stride,
+                    orientation,
+                )
+                if palette:
+                    strip.putpalette(palette)
+                yield strip, bottom == height
+
+
+def stack(upper, lower):
+    """上下拼接两个行条"""
+    img = Image.new(upper.mode, (upper.width, upper.height + lower.height))
+    img.paste(upper, (0, 0))
+    img.paste(lower, (0, upper.height))
+    return img
+
+
+class PyramidLevel:
+    """一个缩放级别的行缓冲
+
+    收到的行攒够一行瓦片（含重叠）就切出，然后丢弃之后不再需要的行；
+    同时把收到的行两两合并缩小一半，交给下一级。
+    """
+
+    def __init__(self, level, width, height, tile_size, overlap):
+        self.level = level
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.columns = math.ceil(width / tile_size)
+        self.rows = math.ceil(height / tile_size)
+        self.buffer = None
+        self.top = 0  # 缓冲区第一行在本级中的位置
+        self.received = 0
+        self.row = 0  # 下一个待切出的瓦片行
+        self.carry = None  # 等待配对缩小的奇数行
+
+    def push(self, strip):
+        """加入行条，返回切出的瓦片 [(列, 行, 瓦片)]"""
+        self.received += strip.height
+        if self.row == self.rows:
+            return []
+        self.buffer = strip if self.buffer is None else stack(self.buffer, strip)
+        tiles = []
+        while self.row < self.rows:
+            y0 = max(0, self.row * self.tile_size - self.overlap)
+            y1 = min(self.height, (self.row + 1) * self.tile_size + self.overlap)
+            if self.received < y1:
+                break
+            for column in range(self.columns):
+                x0 = max(0, column * self.tile_size - self.overlap)
+                x1 = min(self.width, (column + 1) * self.tile_size + self.overlap)
+                box = (x0, y0 - self.top, x1, y1 - self.top)
+                tiles.append((column, self.row, self.buffer.crop(box)))
+            self.row += 1
+            if self.row == self.rows:
+                self.buffer = None  # 本级已全部切完
+                break
+            keep_from = self.row * self.tile_size - self.overlap
+            if keep_from > self.top:
+                self.buffer = self.buffer.crop(
+                    (0, keep_from - self.top, self.width, self.buffer.height)
+                )
+                self.top = keep_from
+        return tiles
+
+    def downsample(self, strip, final):
+        """缩小一半交给下一级；行数为奇数时留下最后一行与下一条配对"""
+        if self.carry is not None:
+            strip = stack(self.carry, strip)
+            self.carry = None
+        if strip.height % 2 and not final:
+            self.carry = strip.crop((0, strip.height - 1, strip.width, strip.height))
+            strip = strip.crop((0, 0, strip.width, strip.height - 1))
+        if not strip.height:
+            return None
+        size = (math.ceil(strip.width / 2), math.ceil(strip.height / 2))
+        return strip.resize(size, Image.BOX)
+
+
+@functools.cache
+def tile_engine(target_kb, effort, search_effort):
+    # 每个工作进程复用一个引擎
+    return CompressionEngine(target_kb, effort=effort, search_effort=search_effort)
+
+
+def encode_tile(tile, path, fmt, target_kb, effort, search_effort):
+    """用现有的质量搜索压缩一个瓦片并写出，返回 (字节数, 质量)"""
+    engine = tile_engine(target_kb, effort, search_effort)
+    compression_data = engine.compress_variant(tile, fmt)
+    data = compression_data["data"]
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data), compression_data["quality"]
+
+
+class PyramidBuilder:
+    """把一张大图切成 Deep Zoom 瓦片金字塔
+
+    未压缩的 TIFF/BMP/PPM 按瓦片行分条读取，每一级只缓存几行瓦片，峰值内存与
+    图片高度无关；压缩格式（JPEG、PNG、LZW TIFF 等）先整张解码，内存与像素数
+    成正比，清单中 streamed 为 false。
+    瓦片在进程池中并行压缩。输出 <name>.dzi、<name>_files/<级>/<列>_<行>.<扩展名>
+    和描述各级的 <name>.json。
+    """
+
+    def __init__(
+        self,
+        tile_size=254,
+        overlap=1,
+        fmt="jpeg",
+        tile_kb=30,
+        effort="balanced",
+        search_effort=None,
+        workers=1,
+    ):
+        if fmt not in TILE_EXTENSIONS:
+            raise ValueError(f"不支持的瓦片格式: {fmt}")
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.fmt = fmt
+        self.tile_kb = tile_kb
+        self.effort = effort
+        self.search_effort = search_effort or effort
+        self.workers = max(1, workers)
+
+    def tile_mode(self, mode):
+        """瓦片统一的像素模式：WebP 保留透明，JPEG 转为 RGB（灰度保持）"""
+        if mode in ("L", "RGB"):
+            return mode
+        if self.fmt == "webp" and mode in ("RGBA", "LA", "PA", "P"):
+            return "RGBA"
+        return "RGB"
+
+    def build(self, source_path, dest_folder, name=None, on_progress=None):
+        """生成金字塔，返回清单字典"""
+        start = time.time()
+        name = name or os.path.splitext(os.path.basename(source_path))[0]
+        tiles_folder = os.path.join(dest_folder, f"{name}_files")
+        extension = TILE_EXTENSIONS[self.fmt]
+
+        with trusted_pixels(), open_image(source_path) as img:
+            width, height = img.size
+            streamed = raw_layout(img) is not None
+            mode = self.tile_mode(img.mode)
+
+        max_level = math.ceil(math.log2(max(width, height))) if width * height else 0
+        levels = []
+        for level in range(max_level, -1, -1):
+            scale = 2 ** (max_level - level)
+            levels.append(
+                PyramidLevel(
+                    level,
+                    math.ceil(width / scale),
+                    math.ceil(height / scale),
+                    self.tile_size,
+                    self.overlap,
+                )
+            )
+            os.makedirs(os.path.join(tiles_folder, str(level)), exist_ok=True)
+        total_tiles = sum(level.columns * level.rows for level in levels)
+        stats = {level.level: {"tiles": 0, "bytes": 0} for level in levels}
+        qualities = []
+
+        def record(level, size, quality):
+            stats[level]["tiles"] += 1
+            stats[level]["bytes"] += size
+            if quality is not None:
+                qualities.append(quality)
+            if on_progress:
+                done = sum(s["tiles"] for s in stats.values())
+                on_progress(done, total_tiles)
+
+        def jobs():
+            for strip, final in read_strips(source_path, self.tile_size):
+                strip = strip.convert(mode) if strip.mode != mode else strip
+                for level in levels:
+                    for column, row, tile in level.push(strip):
+                        path = os.path.join(
+                            tiles_folder,
+                            str(level.level),
+                            f"{column}_{row}.{extension}",
+                        )
+                        yield level.level, (tile, path, self.fmt) + self.settings()
+                    strip = level.downsample(strip, final)
+                    if strip is None:
+                        break
+
+        if self.workers == 1:
+            for level, args in jobs():
+                record(level, *encode_tile(*args))
+        else:
+            # 限制排队中的瓦片数量，内存不随图片大小增长
+            with ProcessPoolExecutor(self.workers) as pool:
+                pending = {}
+                for level, args in jobs():
+                    pending[pool.submit(encode_tile, *args)] = level
+                    if len(pending) >= self.workers * 4:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(pending.pop(future), *future.result())
+                for future in list(pending):
+                    record(pending.pop(future), *future.result())
+
+        manifest = {
+            "source": source_path,
+            "width": width,
+            "height": height,
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "format": self.fmt,
+            "tile_kb": self.tile_kb,
+            "streamed": streamed,
+            "levels": [
+                {
+                    "level": level.level,
+                    "width": level.width,
+                    "height": level.height,
+                    "columns": level.columns,
+                    "rows": level.rows,
+                    "tiles": stats[level.level]["tiles"],
+                    "bytes": stats[level.level]["bytes"],
+                }
+                for level in reversed(levels)
+            ],
+            "total_tiles": total_tiles,
+            "total_bytes": sum(s["bytes"] for s in stats.values()),
+            "average_quality": (sum(qualities) / len(qualities) if qualities else None),
+            "time": time.time() - start,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(dest_folder, f"{name}.dzi"), "w") as f:
+            f.write(
+                DZI_TEMPLATE.format(
+                    format=extension,
+                    overlap=self.overlap,
+                    tile_size=self.tile_size,
+                    width=width,
+                    height=height,
+                )
+            )
+        with open(os.path.join(dest_folder, f"{name}.json"), "w") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+    def settings(self):
+        return (self.tile_kb, self.effort, self.search_effort)
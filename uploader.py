@@ -0,0 +1,367 @@
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import quote
+
+from catalog import ImageCatalog
+from image_probe import probe_image
+
+# mimetypes 在部分系统上不认识 webp/avif
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".gif": "image/gif",
+}
+
+
+def content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    guessed = mimetypes.guess_type(path)[0]
+    return CONTENT_TYPES.get(extension) or guessed or "application/octet-stream"
+
+
+def image_size(item):
+    """清单条目的尺寸；重复复用和直接复制的条目没有记录，读取文件头"""
+    if item.get("width") and item.get("height"):
+        return item["width"], item["height"]
+    try:
+        info = probe_image(item["destination"])
+    except Exception:
+        return None, None
+    return info["width"], info["height"]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 次，允许 burst 次突发；线程安全"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不足时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class LocalStorage:
+    """本地文件夹存储后端，用于测试上传流程
+
+    文件复制到 root 下，元数据保存在 root/metadata.json（按文档 ID）。
+    """
+
+    def __init__(self, root="output/uploads"):
+        self.root = root
+        # 存储后端标识，目录中的上传状态按它区分
+        self.target = f"local:{os.path.abspath(root)}"
+        self.metadata_path = os.path.join(root, "metadata.json")
+        self.batches = 0
+        os.makedirs(root, exist_ok=True)
+        self.metadata = {}
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, encoding="utf-8") as f:
+                self.metadata = json.load(f)
+
+    def upload(self, local_path, key, content_type, metadata):
+        """上传一个文件，返回访问地址"""
+        dest_path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = dest_path + ".tmp"
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return Path(dest_path).resolve().as_uri()
+
+    def write_metadata(self, records):
+        """在一次写入中保存一批元数据 {文档ID: 字段}"""
+        self.metadata.update(records)
+        tmp_path = self.metadata_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.metadata_path)
+        self.batches += 1
+
+
+class FirebaseStorage:
+    """Firebase Storage + Firestore 后端
+
+    下载地址使用 Firebase 下载令牌拼出，不为每个文件请求签名 URL，也不会过期；
+    元数据以 内容哈希_标签 为文档 ID 批量写入，重复上传时覆盖而不是新增文档。
+    """
+
+    # Firestore 单个批量写入最多 500 个操作
+    MAX_BATCH = 500
+
+    def __init__(
+        self,
+        bucket_name="portfolio-d5d1f.appspot.com",
+        credentials_path="./config/serviceAccount.json",
+        collection="images",
+    ):
+        import firebase_admin
+        from firebase_admin import credentials, firestore, storage
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(
+                credentials.Certificate(credentials_path),
+                {"storageBucket": bucket_name},
+            )
+        self.firestore = firestore
+        self.db = firestore.client()
+        self.bucket = storage.bucket(bucket_name)
+        self.collection = self.db.collection(collection)
+        self.target = f"firebase:{bucket_name}/{collection}"
+
+    def upload(self, local_path, key, content_type, metadata):
+        token = str(uuid.uuid4())
+        blob = self.bucket.blob(key)
+        blob.metadata = {**metadata, "firebaseStorageDownloadTokens": token}
+        blob.upload_from_filename(local_path, content_type=content_type)
+        return (
+            f"https://firebasestorage.googleapis.com/v0/b/{self.bucket.name}/o/"
+            f"{quote(key, safe='')}?alt=media&token={token}"
+        )
+
+    def write_metadata(self, records):
+        items = list(records.items())
+        for start in range(0, len(items), self.MAX_BATCH):
+            batch = self.db.batch()
+            for doc_id, fields in items[start : start + self.MAX_BATCH]:
+                fields = {**fields, "createdAt": self.firestore.SERVER_TIMESTAMP}
+                batch.set(self.collection.document(doc_id), fields)
+            batch.commit()
+
+
+class Uploader:
+    """按输出清单上传压缩结果
+
+    内容相同的文件只上传一次，每个 (内容, 标签) 写一个元数据文档；之前已上传到
+    同一存储后端的（按目录中的路径、内容哈希和后端标识）直接跳过。最多
+    concurrency 个上传同时进行，由令牌桶限制请求速率；元数据每 batch_size 条
+    批量写入一次，一批写入成功后才把其中的图片记为已上传，中途退出的下次运行
+    会重新写入。
+    """
+
+    def __init__(
+        self,
+        backend,
+        catalog_path,
+        source_folder,
+        concurrency=4,
+        rate=5.0,
+        burst=None,
+        batch_size=100,
+        retries=2,
+    ):
+        self.backend = backend
+        self.catalog_path = catalog_path
+        self.source_folder = source_folder
+        self.concurrency = max(1, concurrency)
+        self.limiter = TokenBucket(rate, burst)
+        self.batch_size = batch_size
+        self.retries = retries
+        self.results = []
+        self.elapsed = 0.0
+
+    def tag_for(self, item):
+        """标签取源图片相对路径的第一级目录，与图片目录一致"""
+        rel_path = os.path.relpath(item["file"], self.source_folder)
+        return rel_path.split(os.sep)[0] if os.sep in rel_path else None
+
+    def upload_file(self, path, key, metadata):
+        """限速上传，失败时按指数退避重试"""
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                return self.backend.upload(path, key, content_type(path), metadata)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(2**attempt)
+
+    def run(self, manifest_items, on_progress=None):
+        """上传清单中的图片，返回每张图片的结果"""
+        start_time = time.time()
+        self.results = []
+        items = [
+            item
+            for item in manifest_items
+            if not item["status"].startswith("failed")
+            and os.path.exists(item.get("destination") or "")
+        ]
+
+        # 先计算内容哈希，内容相同的文件归为一组只上传一次
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            hashes = list(pool.map(file_hash, [item["destination"] for item in items]))
+        groups = {}
+        for item, digest in zip(items, hashes):
+            groups.setdefault(digest, []).append(item)
+
+        catalog = ImageCatalog(self.catalog_path)
+        try:
+            target = self.backend.target
+            uploaded = catalog.uploaded_files(target)
+            # 内容已上传过的文件直接复用地址，不再上传
+            urls = {digest: url for digest, url in uploaded.values()}
+            # 文档 ID -> (字段, 对应的清单条目)，批量写入成功后才记为已上传
+            pending = {}
+
+            def finish(group, digest, status, url=None, error=None):
+                for item in group:
+                    path = item["destination"]
+                    result = {
+                        "file": item["file"],
+                        "name": os.path.basename(path),
+                        "tag": self.tag_for(item),
+                        "hash": digest,
+                        "status": status,
+                    }
+                    if status == "failed":
+                        result["error"] = error
+                        catalog.upsert(
+                            item["file"], upload_state="failed", upload_target=target
+                        )
+                    else:
+                        result["url"] = url
+                        catalog.upsert(
+                            item["file"],
+                            upload_state="uploaded",
+                            upload_url=url,
+                            upload_target=target,
+                            content_hash=digest,
+                        )
+                    self.results.append(result)
+                    if on_progress:
+                        on_progress(len(self.results), len(items), path, result)
+
+            def flush():
+                if not pending:
+                    return
+                batch = dict(pending)
+                pending.clear()
+                try:
+                    self.backend.write_metadata(
+                        {doc_id: fields for doc_id, (fields, _) in batch.items()}
+                    )
+                except Exception as e:
+                    print(f"❌ 元数据写入失败（{len(batch)} 条）: {e}")
+                    for fields, group in batch.values():
+                        finish(group, fields["hash"], "failed", error=str(e))
+                    return
+                for fields, group in batch.values():
+                    finish(group, fields["hash"], "uploaded", url=fields["url"])
+
+            def record(digest, url, group):
+                """每个 (内容, 标签) 写一个文档，同一内容在不同标签下各自可见"""
+                by_tag = {}
+                for item in group:
+                    by_tag.setdefault(self.tag_for(item), []).append(item)
+                for tag, tag_items in by_tag.items():
+                    item = tag_items[0]
+                    path = item["destination"]
+                    width, height = image_size(item)
+                    doc_id = f"{digest}_{tag}" if tag else digest
+                    pending[doc_id] = (
+                        {
+                            "name": os.path.basename(path),
+                            "url": url,
+                            "tag": tag,
+                            "hash": digest,
+                            "contentType": content_type(path),
+                            "size": os.path.getsize(path),
+                            "width": width,
+                            "height": height,
+                        },
+                        tag_items,
+                    )
+                if len(pending) >= self.batch_size:
+                    flush()
+
+            todo = []
+            for digest, group in groups.items():
+                done = [
+                    item
+                    for item in group
+                    if uploaded.get(item["file"], (None,))[0] == digest
+                ]
+                if done:
+                    finish(done, digest, "skipped", url=uploaded[done[0]["file"]][1])
+                remaining = [item for item in group if item not in done]
+                if not remaining:
+                    continue
+                if digest in urls:
+                    record(digest, urls[digest], remaining)
+                else:
+                    todo.append((digest, remaining))
+
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                futures = {}
+
+                def collect(done):
+                    for future in done:
+                        digest, group = futures.pop(future)
+                        try:
+                            url = future.result()
+                        except Exception as e:
+                            print(f"❌ 上传失败 {group[0]['destination']}: {e}")
+                            finish(group, digest, "failed", error=str(e))
+                            continue
+                        urls[digest] = url
+                        record(digest, url, group)
+
+                # 排队中的任务有上限，避免一次性提交全部文件
+                for digest, group in todo:
+                    path = group[0]["destination"]
+                    key = f"{digest[:16]}_{os.path.basename(path)}"
+                    metadata = {"tag": self.tag_for(group[0]) or ""}
+                    future = pool.submit(self.upload_file, path, key, metadata)
+                    futures[future] = (digest, group)
+                    if len(futures) >= self.concurrency * 2:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        collect(done)
+                collect(list(futures))
+            flush()
+        finally:
+            catalog.close()
+            self.elapsed = time.time() - start_time
+        return self.results
+
+    def summary(self):
+        statuses = [result["status"] for result in self.results]
+        return {
+            "total": len(self.results),
+            "uploaded": statuses.count("uploaded"),
+            "skipped": statuses.count("skipped"),
+            "failed": statuses.count("failed"),
+            "elapsed": self.elapsed,
+        }